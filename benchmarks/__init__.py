@@ -0,0 +1 @@
+# Benchmarks for MSG to EML converter
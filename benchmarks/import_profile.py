@@ -0,0 +1,119 @@
+"""
+Import-time profile of the function app
+Imports a module in a fresh interpreter with -X importtime and reports the
+total import time, the slowest top-level packages and the slowest modules
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+# Statement run in the child interpreter; the warm-up, when requested, is
+# timed separately from the import
+PROFILE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__({module!r})
+imported = time.perf_counter()
+warm_up = None
+if {warm!r}:
+    module._warm_up()
+    warm_up = time.perf_counter() - imported
+print(json.dumps({{'import_seconds': imported - start, 'warm_up_seconds': warm_up,
+                  'extract_msg_loaded': 'extract_msg' in sys.modules,
+                  'storage_sdk_loaded': 'azure.storage.blob' in sys.modules}}))
+"""
+
+
+def profile_imports(module: str, warm: bool = False) -> Dict:
+    """
+    Import a module in a fresh interpreter and collect its import times
+
+    The background warm-up is disabled in the child, so the import is
+    measured on its own.
+
+    Args:
+        module: Module to import (e.g. 'function_app')
+        warm: Also run the module's _warm_up() and time it
+
+    Returns:
+        Dictionary with the child's timings and one (module, self_us,
+        cumulative_us) tuple per imported module
+    """
+    env = dict(os.environ, WARMUP_ON_STARTUP='false')
+    env.setdefault('AzureWebJobsStorage', 'UseDevelopmentStorage=true')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         PROFILE_SCRIPT.format(module=module, warm=warm)],
+        capture_output=True, text=True, env=env, check=True
+    )
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report['modules'] = modules
+    return report
+
+
+def slowest_packages(modules: List[Tuple[str, int, int]], count: int) -> List[Tuple[str, int]]:
+    """
+    Sum the self time of every module per top-level package
+
+    Args:
+        modules: (module, self_us, cumulative_us) tuples
+        count: Number of packages to return
+
+    Returns:
+        (package, microseconds) tuples, slowest first
+    """
+    totals: Dict[str, int] = {}
+    for name, self_us, _ in modules:
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def main(argv=None) -> int:
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Profile the import time of the function app")
+    parser.add_argument('--module', default='function_app', help="Module to import")
+    parser.add_argument('--top', type=int, default=15, help="Number of entries per table")
+    parser.add_argument('--warm', action='store_true', help="Also time _warm_up()")
+    parser.add_argument('--output', help="Write the full profile as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = profile_imports(args.module, args.warm)
+
+    print(f"⏱️  import {args.module}: {report['import_seconds'] * 1000:.0f} ms "
+          f"(extract_msg loaded: {report['extract_msg_loaded']}, "
+          f"azure.storage.blob loaded: {report['storage_sdk_loaded']})")
+    if report['warm_up_seconds'] is not None:
+        print(f"🔥 _warm_up(): {report['warm_up_seconds'] * 1000:.0f} ms")
+
+    print(f"\n📦 Slowest top-level packages (self time):")
+    for package, micros in slowest_packages(report['modules'], args.top):
+        print(f"   {micros / 1000:8.1f} ms  {package}")
+
+    print(f"\n🐢 Slowest modules (cumulative):")
+    for name, _, cumulative_us in sorted(report['modules'], key=lambda m: m[2],
+                                         reverse=True)[:args.top]:
+        print(f"   {cumulative_us / 1000:8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"\n💾 Profile written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
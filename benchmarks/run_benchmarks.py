@@ -0,0 +1,335 @@
+"""
+MSG to EML converter benchmarks
+Measures validation, parsing, conversion and EML generation over a synthetic corpus,
+writes JSON results and flags regressions against a stored baseline
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.corpus import generate_corpus
+
+
+OPERATIONS = ['validate', 'parse', 'convert', 'generate']
+
+# Results schema version, bumped when fields change meaning
+RESULTS_VERSION = 1
+
+
+def run_case(path: str, operation: str, iterations: int, warmup: int,
+             time_budget: float) -> Dict:
+    """
+    Benchmark one operation on one MSG file
+
+    Runs inside a fresh worker process, so the reported peak RSS belongs to
+    this case alone.
+
+    Args:
+        path: MSG file path
+        operation: 'validate', 'parse', 'convert' or 'generate'
+        iterations: Maximum number of timed iterations
+        warmup: Number of untimed iterations run first
+        time_budget: Seconds after which no further iterations are started
+            (at least one timed iteration always runs)
+
+    Returns:
+        Result dictionary (see summarize())
+    """
+    from services.msg_converter import MsgToEmlConverter
+    from utils.metrics import peak_memory_mb
+
+    with open(path, 'rb') as msg_file:
+        data = msg_file.read()
+
+    converter = MsgToEmlConverter()
+    baseline_rss_mb = peak_memory_mb()
+
+    def once() -> float:
+        if operation == 'validate':
+            start = time.perf_counter()
+            converter.validate_msg_format(data)
+            return time.perf_counter() - start
+        if operation == 'parse':
+            start = time.perf_counter()
+            msg = converter._parse_message(data)
+            elapsed = time.perf_counter() - start
+            msg.close()
+            return elapsed
+        if operation == 'convert':
+            start = time.perf_counter()
+            converter.convert(data)
+            return time.perf_counter() - start
+        if operation == 'generate':
+            # Parsing is not part of this measurement
+            msg = converter._parse_message(data)
+            try:
+                start = time.perf_counter()
+                converter._generate_eml(msg)
+                return time.perf_counter() - start
+            finally:
+                msg.close()
+        raise ValueError(f"Unknown operation '{operation}'")
+
+    for _ in range(warmup):
+        once()
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < iterations:
+        latencies.append(once())
+        if time.perf_counter() - started >= time_budget:
+            break
+
+    return summarize(os.path.basename(path), operation, len(data), latencies,
+                     baseline_rss_mb, peak_memory_mb())
+
+
+def summarize(filename: str, operation: str, input_bytes: int, latencies: List[float],
+              baseline_rss_mb: Optional[float], peak_rss_mb: Optional[float]) -> Dict:
+    """
+    Build the result record of one benchmark case
+
+    Args:
+        filename: MSG filename
+        operation: Benchmarked operation
+        input_bytes: MSG file size
+        latencies: Measured latencies in seconds
+        baseline_rss_mb: Peak RSS before the timed runs
+        peak_rss_mb: Peak RSS after the timed runs
+
+    Returns:
+        Result dictionary
+    """
+    mean = sum(latencies) / len(latencies)
+    return {
+        'file': filename,
+        'operation': operation,
+        'input_bytes': input_bytes,
+        'iterations': len(latencies),
+        'mean_ms': mean * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'min_ms': min(latencies) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'throughput_mb_s': (input_bytes / (1024 * 1024)) / mean if mean else None,
+        'baseline_rss_mb': baseline_rss_mb,
+        'peak_rss_mb': peak_rss_mb,
+    }
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile
+
+    Args:
+        values: Samples (not necessarily sorted)
+        percent: Percentile between 0 and 100
+
+    Returns:
+        Sample at the given percentile
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _run_case_args(args: Tuple) -> Dict:
+    """Pool entry point for run_case; errors are recorded, not raised"""
+    path, operation = args[0], args[1]
+    try:
+        return run_case(*args)
+    except Exception as e:
+        return {'file': os.path.basename(path), 'operation': operation,
+                'error': f"{type(e).__name__}: {str(e)}"}
+
+
+def run_benchmarks(corpus_dir: str, operations: List[str], iterations: int,
+                   warmup: int, time_budget: float) -> Dict:
+    """
+    Benchmark every MSG file in a corpus directory
+
+    Each (file, operation) case runs in its own short-lived process.
+
+    Args:
+        corpus_dir: Directory with .msg files
+        operations: Operations to benchmark
+        iterations: Maximum timed iterations per case
+        warmup: Untimed iterations per case
+        time_budget: Per-case time budget in seconds
+
+    Returns:
+        Results document with metadata and one record per case
+    """
+    import extract_msg
+
+    paths = sorted(
+        os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir)
+        if name.lower().endswith('.msg')
+    )
+    cases = [(path, operation, iterations, warmup, time_budget)
+             for path in paths for operation in operations]
+
+    results = []
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(_run_case_args, cases):
+            if 'error' in result:
+                print(f"❌ {result['file']} [{result['operation']}]: {result['error']}")
+            else:
+                print(f"✅ {result['file']} [{result['operation']}] "
+                      f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+                      f"peak RSS {_format_mb(result['peak_rss_mb'])}")
+            results.append(result)
+
+    return {
+        'version': RESULTS_VERSION,
+        'metadata': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'extract_msg': extract_msg.__version__,
+            'corpus_dir': corpus_dir,
+            'iterations': iterations,
+            'warmup': warmup,
+            'time_budget_seconds': time_budget,
+        },
+        'results': results,
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float,
+                    min_delta_ms: float) -> List[str]:
+    """
+    Find regressions of current results against a baseline
+
+    A case regresses when its p50 latency or peak RSS grew by more than
+    threshold (relative), ignoring latency changes below min_delta_ms, or
+    when it succeeded in the baseline but fails now.
+
+    Args:
+        current: Results document of the current run
+        baseline: Results document of the baseline run
+        threshold: Allowed relative growth (0.1 = 10%)
+        min_delta_ms: Latency changes smaller than this are noise
+
+    Returns:
+        One message per regression (empty if none)
+    """
+    baseline_cases = {(r['file'], r['operation']): r for r in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        key = (result['file'], result['operation'])
+        base = baseline_cases.get(key)
+        if base is None or 'error' in base:
+            continue
+
+        label = f"{result['file']} [{result['operation']}]"
+        if 'error' in result:
+            regressions.append(f"{label}: now fails with {result['error']}")
+            continue
+
+        delta_ms = result['p50_ms'] - base['p50_ms']
+        if delta_ms > min_delta_ms and result['p50_ms'] > base['p50_ms'] * (1 + threshold):
+            regressions.append(
+                f"{label}: p50 {base['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms "
+                f"(+{delta_ms / base['p50_ms']:.0%})"
+            )
+
+        if (result.get('peak_rss_mb') and base.get('peak_rss_mb')
+                and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold)):
+            regressions.append(
+                f"{label}: peak RSS {base['peak_rss_mb']:.1f} -> "
+                f"{result['peak_rss_mb']:.1f} MB"
+            )
+
+    return regressions
+
+
+def _format_mb(value: Optional[float]) -> str:
+    """Format an optional size in MB"""
+    return f"{value:.1f} MB" if value is not None else "n/a"
+
+
+def _report_comparison(current: Dict, baseline_path: str, threshold: float,
+                       min_delta_ms: float) -> int:
+    """Print the comparison against a baseline file and return the exit code"""
+    with open(baseline_path, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare_results(current, baseline, threshold, min_delta_ms)
+
+    print()
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) against {baseline_path}:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+
+    print(f"✅ No regressions against {baseline_path} (threshold {threshold:.0%})")
+    return 0
+
+
+def main(argv=None) -> int:
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Benchmark the MSG to EML converter")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Run the benchmarks")
+    run.add_argument('--corpus-dir', default=os.path.join('benchmarks', 'corpus'),
+                     help="Directory with .msg files (generated if missing)")
+    run.add_argument('--output', help="Write the JSON results to this file")
+    run.add_argument('--operations', nargs='+', choices=OPERATIONS, default=OPERATIONS,
+                     help="Operations to benchmark")
+    run.add_argument('--iterations', type=int, default=20,
+                     help="Maximum timed iterations per case")
+    run.add_argument('--warmup', type=int, default=1, help="Untimed iterations per case")
+    run.add_argument('--time-budget', type=float, default=10.0,
+                     help="Seconds per case after which no more iterations start")
+    run.add_argument('--baseline', help="Results file to compare against")
+
+    compare = commands.add_parser('compare', help="Compare two results files")
+    compare.add_argument('results', help="Current results file")
+    compare.add_argument('baseline', help="Baseline results file")
+
+    for command in (run, compare):
+        command.add_argument('--threshold', type=float, default=0.10,
+                             help="Allowed relative growth before flagging (default 0.10)")
+        command.add_argument('--min-delta-ms', type=float, default=1.0,
+                             help="Ignore latency changes smaller than this")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.results, 'r', encoding='utf-8') as results_file:
+            current = json.load(results_file)
+        return _report_comparison(current, args.baseline, args.threshold, args.min_delta_ms)
+
+    if not os.path.isdir(args.corpus_dir) or not any(
+            name.lower().endswith('.msg') for name in os.listdir(args.corpus_dir)):
+        print(f"📁 Generating corpus in {args.corpus_dir}")
+        for _ in generate_corpus(args.corpus_dir):
+            pass
+
+    current = run_benchmarks(args.corpus_dir, args.operations, args.iterations,
+                             args.warmup, args.time_budget)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(current, output_file, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.baseline:
+        return _report_comparison(current, args.baseline, args.threshold, args.min_delta_ms)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Batch MSG to EML conversion - Command Line Tool
+Converts a directory, a manifest or a blob container prefix across a process pool
+"""
+
+import argparse
+import json
+import os
+import sys
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+from models.conversion_models import ConversionJob, ConversionResult
+from services.msg_converter import MsgToEmlConverter
+
+if TYPE_CHECKING:
+    from services.blob_storage import BlobStorageService
+
+
+# Converted blobs moved to the archive container per archive_many call
+ARCHIVE_BATCH_SIZE = 256
+
+
+def iter_directory_jobs(input_dir: str, output_dir: Optional[str],
+                        output_container: Optional[str]) -> Iterator[ConversionJob]:
+    """Yield a job for every .msg file below input_dir, mirroring its layout"""
+    for root, _, files in os.walk(input_dir):
+        for name in sorted(files):
+            if not name.lower().endswith('.msg'):
+                continue
+            input_path = os.path.join(root, name)
+            yield _local_job(input_path, os.path.relpath(input_path, input_dir),
+                             output_dir, output_container)
+
+
+def iter_manifest_jobs(manifest_path: str, output_dir: Optional[str],
+                       output_container: Optional[str]) -> Iterator[ConversionJob]:
+    """Yield a job for every MSG path listed (one per line) in a manifest file"""
+    with open(manifest_path, 'r', encoding='utf-8') as manifest:
+        for line in manifest:
+            input_path = line.strip()
+            if input_path and not input_path.startswith('#'):
+                yield _local_job(input_path, os.path.basename(input_path),
+                                 output_dir, output_container)
+
+
+def iter_container_jobs(container: str, prefix: Optional[str], output_dir: Optional[str],
+                        output_container: Optional[str]) -> Iterator[ConversionJob]:
+    """Yield a job for every .msg blob in a container under the given prefix"""
+    from services.blob_storage import BlobStorageService
+
+    blob_service = BlobStorageService()
+    container_client = blob_service.blob_service_client.get_container_client(container)
+
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        if not blob.name.lower().endswith('.msg'):
+            continue
+        yield ConversionJob(
+            filename=blob.name,
+            input_container=container,
+            output_path=_eml_path(output_dir, blob.name) if output_dir else None,
+            output_container=output_container
+        )
+
+
+def _local_job(input_path: str, relative_name: str, output_dir: Optional[str],
+               output_container: Optional[str]) -> ConversionJob:
+    """Build a job for a local MSG file"""
+    return ConversionJob(
+        filename=relative_name.replace(os.sep, '/'),
+        input_path=input_path,
+        output_path=_eml_path(output_dir, relative_name) if output_dir else None,
+        output_container=output_container
+    )
+
+
+def _eml_path(output_dir: str, relative_name: str) -> str:
+    """Map an MSG name to its EML path inside output_dir"""
+    base_name = relative_name.rsplit('.', 1)[0] if '.' in relative_name else relative_name
+    return os.path.join(output_dir, f"{base_name}.eml")
+
+
+def _archive_converted(blob_service: 'BlobStorageService', container: str, filenames: List[str],
+                       archive_container: str) -> int:
+    """Move converted blobs to the archive container; returns the number that failed"""
+    failures = blob_service.archive_many(container, filenames, archive_container)
+    for filename, error in failures.items():
+        print(f"⚠️ {filename} converted but not archived: {error}")
+    return len(failures)
+
+
+def _result_to_json(result: ConversionResult) -> str:
+    """Serialize a ConversionResult as a single JSON line"""
+    data = asdict(result)
+    data['timestamp'] = result.timestamp.isoformat()
+    return json.dumps(data)
+
+
+def main(argv=None) -> int:
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description="Convert many MSG files to EML in parallel"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input-dir', help="Directory to scan for .msg files")
+    source.add_argument('--manifest', help="File listing one MSG path per line")
+    source.add_argument('--container', help="Blob container to read .msg blobs from")
+    parser.add_argument('--prefix', help="Blob name prefix (with --container)")
+    parser.add_argument('--archive-container',
+                        help="Move converted blobs to this container (with --container)")
+
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument('--output-dir', help="Directory to write .eml files to")
+    destination.add_argument('--output-container', help="Blob container to upload .eml files to")
+
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Maximum number of queued jobs (default: 2x workers)")
+    parser.add_argument('--report', help="Write one JSON result per line to this file")
+    args = parser.parse_args(argv)
+    if args.archive_container and not args.container:
+        parser.error("--archive-container requires --container")
+
+    if args.input_dir:
+        jobs = iter_directory_jobs(args.input_dir, args.output_dir, args.output_container)
+    elif args.manifest:
+        jobs = iter_manifest_jobs(args.manifest, args.output_dir, args.output_container)
+    else:
+        jobs = iter_container_jobs(args.container, args.prefix, args.output_dir,
+                                   args.output_container)
+
+    converter = MsgToEmlConverter()
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    succeeded = failed = unarchived = 0
+    to_archive: List[str] = []
+    if args.archive_container:
+        from services.blob_storage import BlobStorageService
+        blob_service = BlobStorageService()
+
+    try:
+        for result in converter.convert_many(jobs, max_workers=args.workers,
+                                             max_in_flight=args.max_in_flight):
+            if result.success:
+                succeeded += 1
+                print(f"✅ {result.filename} -> {result.output_blob_url} "
+                      f"({result.duration_seconds:.3f}s)")
+                if args.archive_container:
+                    to_archive.append(result.filename)
+            else:
+                failed += 1
+                print(f"❌ {result.filename}: {result.error_message}")
+
+            if report:
+                report.write(_result_to_json(result) + "\n")
+
+            if len(to_archive) >= ARCHIVE_BATCH_SIZE:
+                unarchived += _archive_converted(blob_service, args.container, to_archive,
+                                                 args.archive_container)
+                to_archive = []
+
+        if to_archive:
+            unarchived += _archive_converted(blob_service, args.container, to_archive,
+                                             args.archive_container)
+    finally:
+        if report:
+            report.close()
+
+    print()
+    print(f"📊 Converted: {succeeded}, failed: {failed}")
+    if args.archive_container:
+        print(f"📦 Archived: {succeeded - unarchived}, not archived: {unarchived}")
+    return 1 if failed or unarchived else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
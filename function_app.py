@@ -1,19 +1,44 @@
 import azure.functions as func
+import asyncio
+import io
+import json
 import logging
 import os
+import threading
 import time
 from datetime import datetime
-from services.msg_converter import MsgToEmlConverter, ConversionError, ValidationError
-from services.blob_storage import BlobStorageService, BlobStorageError
-from utils.logging import ConversionLogger
-from models.conversion_models import ConversionResult
+from typing import TYPE_CHECKING, Dict, Optional
+from services.msg_converter import MsgToEmlConverter
+from services.errors import BlobStorageError, ConversionError, ValidationError
+from services.archive_converter import is_archive
+from services.dedup_cache import compute_msg_digest, create_dedup_cache
+from services.processing_ledger import (
+    STAGE_ARCHIVED, STAGE_UPLOADED, create_processing_ledger, ledger_key, lookup_checkpoint,
+    record_checkpoint
+)
+from utils.logging import ConversionLogger, correlated
+from utils.deadline import Deadline
+from utils.metrics import StageTimer, create_metrics_sink, peak_memory_mb
+from utils.work_lane import WorkLane
+from models.conversion_models import ConversionMetrics, ConversionResult
+
+if TYPE_CHECKING:
+    # The storage SDKs are imported on first use (or by the warm-up), not
+    # while the host indexes the functions
+    from services.blob_storage import BlobStorageService
+    from services.blob_storage_async import AsyncBlobStorageService
+    from services.dedup_cache import DedupCache
+    from services.processing_ledger import ProcessingLedger
+    from services.archive_converter import ZipArchiveConverter
+    from services.queue_worker import QueueConversionWorker
+    from azure.storage.queue import QueueClient
 
 app = func.FunctionApp()
 
-# Initialize services
+# Initialize services; storage services are created by _get_blob_service()
 converter = MsgToEmlConverter()
-blob_service = BlobStorageService()
 conversion_logger = ConversionLogger()
+metrics_sink = create_metrics_sink()
 
 # Get container names from environment
 INPUT_CONTAINER = os.environ.get('INPUT_CONTAINER', 'msg-input')
@@ -21,13 +46,76 @@ OUTPUT_CONTAINER = os.environ.get('OUTPUT_CONTAINER', 'eml-output')
 ARCHIVE_CONTAINER = os.environ.get('ARCHIVE_CONTAINER', 'msg-archive')
 FAILED_CONTAINER = os.environ.get('FAILED_CONTAINER', 'msg-failed')
 
+# Storage service, content-hash cache for duplicate MSG files and ledger of
+# completed stages for resuming retries (both stay None unless DEDUP_CACHE
+# or PROCESSING_LEDGER is set), created together on first use
+blob_service: Optional['BlobStorageService'] = None
+dedup_cache: Optional['DedupCache'] = None
+processing_ledger: Optional['ProcessingLedger'] = None
+_services_lock = threading.Lock()
+
 # Timeout configuration (30 seconds)
 TIMEOUT_SECONDS = 30
 
+# Parse in a child process that is killed when the deadline expires, so a
+# malformed MSG that hangs extract_msg cannot pin the worker. Off by default:
+# it costs a process start per file, and the EML is spooled to a temporary
+# file instead of being uploaded while it is generated.
+ISOLATE_PARSING = os.environ.get('ISOLATE_PARSING', 'false').lower() == 'true'
+
+# Use the asyncio trigger (msg_to_eml_converter_async) instead of the sync one
+ASYNC_TRIGGER_ENABLED = os.environ.get('ASYNC_TRIGGER_ENABLED', 'false').lower() == 'true'
+
+# Async storage service, created on first use inside the worker's event loop
+async_blob_service: Optional['AsyncBlobStorageService'] = None
+
+# Converter for zip archives of MSG files, created on first use
+archive_converter: Optional['ZipArchiveConverter'] = None
+
+# Size-aware scheduling: MSG files above HEAVY_LANE_THRESHOLD_MB are not
+# converted by the blob trigger but forwarded to HEAVY_LANE_QUEUE, whose
+# trigger runs them with their own concurrency, memory budget and timeout,
+# so a few large files cannot hold up the small ones behind them
+HEAVY_LANE_ENABLED = os.environ.get('HEAVY_LANE_ENABLED', 'false').lower() == 'true'
+HEAVY_LANE_THRESHOLD_MB = float(os.environ.get('HEAVY_LANE_THRESHOLD_MB', '4'))
+HEAVY_LANE_QUEUE = os.environ.get('HEAVY_LANE_QUEUE', 'msg-conversion-heavy')
+HEAVY_LANE_MAX_CONCURRENCY = int(os.environ.get('HEAVY_LANE_MAX_CONCURRENCY', '2'))
+HEAVY_LANE_MEMORY_BUDGET_MB = float(os.environ.get('HEAVY_LANE_MEMORY_BUDGET_MB', '64'))
+HEAVY_LANE_TIMEOUT_SECONDS = float(os.environ.get('HEAVY_LANE_TIMEOUT_SECONDS', '240'))
+
+# Invocation time limit; keep in step with functionTimeout in host.json. A
+# heavy-lane file waits for room only as long as its conversion still fits
+# in it (with a margin); otherwise it is put back on the queue, instead of
+# being cut off by the host and redelivered without a trace.
+FUNCTION_TIMEOUT_SECONDS = float(os.environ.get('FUNCTION_TIMEOUT_SECONDS', '600'))
+HEAVY_LANE_INVOCATION_MARGIN_SECONDS = 30
+HEAVY_LANE_REQUEUE_DELAY_SECONDS = 30
+
+# Consume the heavy lane in this app; set to false when run_queue_worker.py
+# drains HEAVY_LANE_QUEUE elsewhere
+HEAVY_LANE_TRIGGER_ENABLED = os.environ.get('HEAVY_LANE_TRIGGER_ENABLED', 'true').lower() == 'true'
+
+# Heavy-lane queue client, admission gate and worker, created on first use
+heavy_lane_queue: Optional['QueueClient'] = None
+heavy_lane: Optional[WorkLane] = None
+heavy_lane_worker: Optional['QueueConversionWorker'] = None
 
-@app.blob_trigger(arg_name="inputBlob", 
-                  path=f"{INPUT_CONTAINER}/{{name}}",
-                  connection="AzureWebJobsStorage")
+# Import the MSG parser and the storage SDK and create the storage clients in
+# a background thread at startup, so the host indexes the functions without
+# waiting for them and the first invocation finds them ready
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'true').lower() == 'true'
+
+
+def _register_if(enabled: bool, decorator):
+    """Apply a trigger decorator only when enabled, so only one variant listens"""
+    return decorator if enabled else (lambda function: function)
+
+
+@_register_if(not ASYNC_TRIGGER_ENABLED,
+              app.blob_trigger(arg_name="inputBlob", 
+                               path=f"{INPUT_CONTAINER}/{{name}}",
+                               connection="AzureWebJobsStorage"))
+@correlated
 def msg_to_eml_converter(inputBlob: func.InputStream):
     """
     Azure Function triggered by blob upload to convert MSG files to EML format.
@@ -39,73 +127,55 @@ def msg_to_eml_converter(inputBlob: func.InputStream):
     filename = inputBlob.name.split('/')[-1]  # Extract filename from blob path
     file_size = inputBlob.length
     
+    # Zip archives are expanded into one EML per MSG member
+    if is_archive(filename):
+        _convert_archive_blob(inputBlob, filename, file_size)
+        return
+    
+    # Large files are converted by the heavy lane
+    if _is_heavy(file_size):
+        _forward_to_heavy_lane(filename, file_size)
+        return
+    
+    timer = StageTimer()
+    deadline = Deadline(TIMEOUT_SECONDS)
+    
     # Log conversion start
     conversion_logger.log_conversion_start(filename, file_size)
     
     try:
-        # Check timeout before starting conversion
-        elapsed = time.time() - start_time
-        if elapsed >= TIMEOUT_SECONDS:
-            raise TimeoutError(
-                f"Timeout exceeded before conversion started: {elapsed:.2f}s"
-            )
+        # A retry of a blob version converted earlier resumes after the last
+        # stage it completed, instead of uploading a second EML
+        source_key = _ledger_key(inputBlob, filename)
+        checkpoint = lookup_checkpoint(_get_processing_ledger(), source_key, filename)
         
-        # Read MSG file from input blob stream
-        msg_data = inputBlob.read()
-        
-        # Check timeout after reading
-        elapsed = time.time() - start_time
-        if elapsed >= TIMEOUT_SECONDS:
-            raise TimeoutError(
-                f"Timeout exceeded after reading file: {elapsed:.2f}s"
+        if checkpoint is None:
+            output_url = _convert_and_upload(
+                inputBlob, filename, timer, deadline, source_key
             )
+        else:
+            output_url = checkpoint.output_blob_url
         
-        # Validate MSG format before conversion
-        converter.validate_msg_format(msg_data)
-        
-        # Check timeout after validation
-        elapsed = time.time() - start_time
-        if elapsed >= TIMEOUT_SECONDS:
-            raise TimeoutError(
-                f"Timeout exceeded after validation: {elapsed:.2f}s"
-            )
-        
-        # Convert MSG to EML
-        eml_content = converter.convert(msg_data)
-        
-        # Check timeout after conversion
-        elapsed = time.time() - start_time
-        if elapsed >= TIMEOUT_SECONDS:
-            raise TimeoutError(
-                f"Timeout exceeded after conversion: {elapsed:.2f}s"
-            )
-        
-        # Upload EML to output container
-        output_url = blob_service.upload_eml(
-            OUTPUT_CONTAINER, 
-            filename, 
-            eml_content
-        )
-        
-        # Check timeout after upload
-        elapsed = time.time() - start_time
-        if elapsed >= TIMEOUT_SECONDS:
-            raise TimeoutError(
-                f"Timeout exceeded after upload: {elapsed:.2f}s"
-            )
-        
-        # Archive original MSG file after successful conversion
-        blob_service.archive_msg(
-            INPUT_CONTAINER,
-            filename,
-            ARCHIVE_CONTAINER
-        )
+        if checkpoint is None or checkpoint.stage != STAGE_ARCHIVED:
+            # Check timeout after upload
+            deadline.check("after upload")
+            
+            # Archive original MSG file after successful conversion
+            with timer.stage('archive'):
+                _get_blob_service().archive_msg(
+                    INPUT_CONTAINER,
+                    filename,
+                    ARCHIVE_CONTAINER,
+                    timeout=deadline.remaining()
+                )
+            record_checkpoint(processing_ledger, source_key, STAGE_ARCHIVED, output_url)
         
         # Calculate final duration
         duration = time.time() - start_time
         
         # Log successful conversion
         conversion_logger.log_conversion_success(filename, duration, output_url)
+        _emit_metrics(filename, file_size, duration, timer)
         
         logging.info(
             f"Successfully converted {filename} to EML in {duration:.3f}s. "
@@ -115,18 +185,12 @@ def msg_to_eml_converter(inputBlob: func.InputStream):
     except TimeoutError as e:
         # Handle timeout
         duration = time.time() - start_time
-        conversion_logger.logger.error(
-            f"Conversion timeout - filename: {filename}, "
-            f"duration: {duration:.3f}s, "
-            f"error_type: TimeoutError, "
-            f"error_message: {str(e)}, "
-            f"status: timeout, "
-            f"timestamp: {datetime.utcnow().isoformat()}"
-        )
+        _emit_metrics(filename, file_size, duration, timer, e)
+        conversion_logger.log_conversion_timeout(filename, e, duration)
         
         # Move to failed container
         try:
-            blob_service.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+            _get_blob_service().move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
         except BlobStorageError as move_error:
             logging.error(f"Failed to move timeout file to failed container: {move_error}")
         
@@ -136,10 +200,11 @@ def msg_to_eml_converter(inputBlob: func.InputStream):
         # Handle validation errors
         duration = time.time() - start_time
         conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
         
         # Move to failed container
         try:
-            blob_service.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+            _get_blob_service().move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
         except BlobStorageError as move_error:
             logging.error(f"Failed to move invalid file to failed container: {move_error}")
         
@@ -150,10 +215,660 @@ def msg_to_eml_converter(inputBlob: func.InputStream):
         # Handle conversion errors
         duration = time.time() - start_time
         conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
+        
+        # Move to failed container
+        try:
+            _get_blob_service().move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+        except BlobStorageError as move_error:
+            logging.error(f"Failed to move failed file to failed container: {move_error}")
+        
+        logging.error(f"Conversion failed for {filename}: {str(e)}")
+        raise
+        
+    except BlobStorageError as e:
+        # Handle blob storage errors
+        duration = time.time() - start_time
+        conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
+        
+        logging.error(f"Blob storage error for {filename}: {str(e)}")
+        raise
+        
+    except Exception as e:
+        # Handle unexpected errors
+        duration = time.time() - start_time
+        conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
+        
+        # Try to move to failed container
+        try:
+            _get_blob_service().move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+        except BlobStorageError as move_error:
+            logging.error(f"Failed to move file to failed container: {move_error}")
+        
+        logging.error(f"Unexpected error converting {filename}: {str(e)}")
+        raise
+
+
+def _convert_and_upload(inputBlob: func.InputStream, filename: str, timer: StageTimer,
+                        deadline: Deadline, source_key: Optional[str]) -> str:
+    """
+    Read, validate, parse and upload one MSG file for the sync trigger
+    
+    Args:
+        inputBlob: Input stream containing MSG file data
+        filename: MSG filename
+        timer: Stage timer receiving the per-stage durations
+        deadline: Deadline of the conversion
+        source_key: Ledger key of the MSG blob version (None without a ledger)
+        
+    Returns:
+        Blob URL of the uploaded (or copied) EML file
+    """
+    tags = processing_ledger.upload_tags(source_key) if source_key else None
+    
+    # Check timeout before starting conversion
+    deadline.check("before conversion started")
+    
+    # Read MSG file: the host has already downloaded the blob for the
+    # trigger, so fetching it again with ranged GETs would only add requests
+    with timer.stage('read'):
+        msg_data = inputBlob.read()
+    
+    # Check timeout after reading
+    deadline.check("after reading file")
+    
+    # Validate MSG format before conversion
+    with timer.stage('validate'):
+        validated_msg = converter.validate_msg_format(msg_data)
+    
+    # Check timeout after validation
+    deadline.check("after validation")
+    
+    # Serve byte-identical duplicates by copying the EML converted earlier
+    with timer.stage('dedup'):
+        msg_digest = compute_msg_digest(msg_data) if _get_dedup_cache() else None
+        output_url = (
+            _copy_duplicate_eml(msg_digest, filename, deadline.remaining(), tags)
+            if msg_digest else None
+        )
+    
+    if output_url is None:
+        # Parse MSG: in an isolated process that is stopped at the
+        # deadline, or in-process with the EML generated while uploading
+        with timer.stage('parse'):
+            if ISOLATE_PARSING:
+                eml_content = converter.convert_isolated(validated_msg, deadline.remaining())
+            else:
+                eml_content = converter.convert_stream(validated_msg)
+        
+        # Check timeout after parsing
+        deadline.check("after parsing")
+        
+        # Stream EML to output container; chunk generation is timed apart
+        with timer.stage('upload'):
+            output_url = _get_blob_service().upload_eml(
+                OUTPUT_CONTAINER, 
+                filename, 
+                timer.timed_chunks('generate', eml_content),
+                timeout=deadline.remaining(),
+                tags=tags
+            )
+        
+        if msg_digest:
+            _record_converted_eml(msg_digest, output_url)
+    
+    record_checkpoint(processing_ledger, source_key, STAGE_UPLOADED, output_url)
+    return output_url
+
+
+def _ledger_key(inputBlob: func.InputStream, filename: str) -> Optional[str]:
+    """
+    Return the ledger key of the triggering blob version (None without a ledger)
+    
+    The ETag comes from the trigger's blob properties, or from the blob
+    itself if the host did not pass them.
+    """
+    if _get_processing_ledger() is None:
+        return None
+    
+    etag = (inputBlob.blob_properties or {}).get('ETag')
+    if not etag:
+        etag = _get_blob_service().get_etag(INPUT_CONTAINER, filename)
+    return ledger_key(INPUT_CONTAINER, filename, etag)
+
+
+def _emit_metrics(filename: str, file_size: Optional[int], duration: float,
+                  timer: StageTimer, error: Optional[Exception] = None) -> None:
+    """
+    Populate ConversionMetrics for one conversion and hand them to the sink
+    
+    Args:
+        filename: MSG filename
+        file_size: Size of the MSG file in bytes
+        duration: Total conversion duration in seconds
+        timer: Stage timer of the conversion
+        error: Exception that ended the conversion, if it failed
+    """
+    if error is None:
+        status = 'success'
+    elif isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        status = 'timeout'
+    else:
+        status = 'failed'
+    
+    metrics = ConversionMetrics(
+        filename=filename,
+        file_size_mb=(file_size or 0) / (1024 * 1024),
+        conversion_duration_ms=int(duration * 1000),
+        status=status,
+        error_type=type(error).__name__ if error else None,
+        timestamp=datetime.utcnow(),
+        stage_durations_ms=timer.durations_ms(),
+        bytes_in=file_size,
+        bytes_out=timer.bytes_out,
+        peak_memory_mb=peak_memory_mb()
+    )
+    
+    try:
+        metrics_sink.emit(metrics)
+    except Exception as e:
+        logging.warning(f"Failed to emit metrics for {filename}: {e}")
+
+
+def _copy_duplicate_eml(msg_digest: str, filename: str, timeout: Optional[float] = None,
+                        tags: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """
+    Create the EML for a duplicate MSG as a copy of the one converted earlier
+    
+    Args:
+        msg_digest: Content digest of the MSG file
+        filename: MSG filename
+        timeout: Time budget in seconds for the copy
+        tags: Blob index tags of the new EML
+        
+    Returns:
+        Blob URL of the copied EML, or None if the MSG must be converted
+    """
+    try:
+        source_url = dedup_cache.lookup(msg_digest)
+        if not source_url:
+            return None
+        
+        output_url = _get_blob_service().copy_eml(
+            OUTPUT_CONTAINER, source_url, filename, timeout, tags
+        )
+        logging.info(f"Duplicate MSG {filename}: copied existing EML {source_url}")
+        return output_url
+        
+    except BlobStorageError as e:
+        # The cached EML is gone or unreadable: drop the entry and convert
+        logging.warning(f"Dedup copy failed for {filename}, converting instead: {e}")
+        try:
+            dedup_cache.forget(msg_digest)
+        except Exception as forget_error:
+            logging.warning(f"Failed to drop stale dedup entry for {filename}: {forget_error}")
+    except Exception as e:
+        logging.warning(f"Dedup cache lookup failed for {filename}: {e}")
+    
+    return None
+
+
+def _record_converted_eml(msg_digest: str, output_url: str) -> None:
+    """Record a new EML in the dedup cache; failures only cost future hits"""
+    try:
+        dedup_cache.record(msg_digest, output_url)
+    except Exception as e:
+        logging.warning(f"Failed to record {output_url} in dedup cache: {e}")
+
+
+def _get_blob_service() -> 'BlobStorageService':
+    """
+    Return the shared storage service, creating it, the dedup cache and the
+    processing ledger on first use
+    """
+    global blob_service, dedup_cache, processing_ledger
+    if blob_service is None:
+        with _services_lock:
+            if blob_service is None:
+                from services.blob_storage import BlobStorageService
+                service = BlobStorageService()
+                dedup_cache = create_dedup_cache(service.blob_service_client, OUTPUT_CONTAINER)
+                processing_ledger = create_processing_ledger(
+                    service.blob_service_client, OUTPUT_CONTAINER
+                )
+                blob_service = service
+    return blob_service
+
+
+def _get_dedup_cache() -> Optional['DedupCache']:
+    """Return the dedup cache (None unless DEDUP_CACHE is set)"""
+    _get_blob_service()
+    return dedup_cache
+
+
+def _get_processing_ledger() -> Optional['ProcessingLedger']:
+    """Return the processing ledger (None unless PROCESSING_LEDGER is set)"""
+    _get_blob_service()
+    return processing_ledger
+
+
+def _get_archive_converter() -> 'ZipArchiveConverter':
+    """Return the shared archive converter, creating it on first use"""
+    global archive_converter
+    if archive_converter is None:
+        from services.archive_converter import ZipArchiveConverter
+        archive_converter = ZipArchiveConverter(_get_blob_service(), converter)
+    return archive_converter
+
+
+def _convert_archive_blob(inputBlob: func.InputStream, filename: str,
+                          file_size: Optional[int]) -> None:
+    """
+    Convert every MSG member of an uploaded zip archive
+    
+    Each MSG member becomes one EML under '<archive name>/' in the output
+    container, and a manifest with one result per member is written next to
+    them. Members that fail are listed in the manifest; the archive itself is
+    archived once all members have been attempted, and moved to the failed
+    container only if it cannot be read as a zip file at all.
+    
+    Archives are not bound by TIMEOUT_SECONDS, which is sized for single
+    files; the function host timeout applies instead.
+    
+    Args:
+        inputBlob: Input stream containing the zip archive
+        filename: Archive filename
+        file_size: Size of the archive in bytes
+    """
+    start_time = time.time()
+    conversion_logger.log_conversion_start(filename, file_size)
+    
+    try:
+        # The host has already downloaded the archive for the trigger
+        archive = io.BytesIO(inputBlob.read())
+        
+        try:
+            manifest = _get_archive_converter().convert_archive(
+                archive, filename, OUTPUT_CONTAINER
+            )
+        finally:
+            archive.close()
+        
+        _get_blob_service().archive_msg(INPUT_CONTAINER, filename, ARCHIVE_CONTAINER)
+        
+    except ValidationError as e:
+        # Not a readable zip file, or too many members
+        conversion_logger.log_conversion_failure(filename, e, time.time() - start_time)
+        try:
+            _get_blob_service().move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+        except BlobStorageError as move_error:
+            logging.error(f"Failed to move invalid archive to failed container: {move_error}")
+        raise
+        
+    except Exception as e:
+        conversion_logger.log_conversion_failure(filename, e, time.time() - start_time)
+        raise
+    
+    duration = time.time() - start_time
+    converted = sum(1 for result in manifest.members if result.success)
+    conversion_logger.log_conversion_success(filename, duration, manifest.manifest_blob_url)
+    
+    logging.info(
+        f"Converted {converted} of {len(manifest.members)} MSG members of archive "
+        f"{filename} in {duration:.3f}s ({len(manifest.skipped_members)} skipped). "
+        f"Manifest: {manifest.manifest_blob_url}"
+    )
+
+
+def _is_heavy(file_size: Optional[int]) -> bool:
+    """Check whether an MSG file belongs in the heavy lane"""
+    return HEAVY_LANE_ENABLED and bool(file_size) \
+        and file_size > HEAVY_LANE_THRESHOLD_MB * 1024 * 1024
+
+
+def _get_heavy_lane_queue() -> 'QueueClient':
+    """Return the heavy-lane queue client, creating it (and the queue) on first use"""
+    global heavy_lane_queue
+    if heavy_lane_queue is None:
+        from azure.core.exceptions import ResourceExistsError
+        from azure.storage.queue import ExponentialRetry, QueueClient, TextBase64EncodePolicy
+        from services.storage_transport import get_sync_transport, retry_settings
+        
+        # The Functions queue trigger expects base64-encoded messages
+        queue_client = QueueClient.from_connection_string(
+            _get_blob_service().connection_string, HEAVY_LANE_QUEUE,
+            transport=get_sync_transport(),
+            retry_policy=ExponentialRetry(**retry_settings()),
+            message_encode_policy=TextBase64EncodePolicy()
+        )
+        try:
+            queue_client.create_queue()
+        except ResourceExistsError:
+            pass
+        heavy_lane_queue = queue_client
+    return heavy_lane_queue
+
+
+def _forward_to_heavy_lane(filename: str, file_size: int, delay: Optional[int] = None) -> None:
+    """
+    Hand a large MSG file to the heavy lane instead of converting it here
+    
+    The message names the blob and its size, so the lane can account for
+    the file's memory before reading it. Failing to send raises, and the
+    host retries the triggering invocation.
+    
+    Args:
+        filename: MSG filename in the input container
+        file_size: Size of the MSG file in bytes
+        delay: Seconds before the message becomes visible (None: at once)
+    """
+    _get_heavy_lane_queue().send_message(
+        json.dumps({'container': INPUT_CONTAINER, 'name': filename, 'size': file_size}),
+        visibility_timeout=delay
+    )
+    logging.info(
+        f"Forwarded {filename} ({file_size / (1024 * 1024):.2f} MB) to heavy lane "
+        f"'{HEAVY_LANE_QUEUE}'"
+    )
+
+
+def _get_heavy_lane() -> WorkLane:
+    """Return the heavy lane's admission gate, creating it on first use"""
+    global heavy_lane
+    if heavy_lane is None:
+        heavy_lane = WorkLane(
+            HEAVY_LANE_MAX_CONCURRENCY, int(HEAVY_LANE_MEMORY_BUDGET_MB * 1024 * 1024)
+        )
+    return heavy_lane
+
+
+def _get_heavy_lane_worker() -> 'QueueConversionWorker':
+    """Return the worker converting heavy-lane files, creating it on first use"""
+    global heavy_lane_worker
+    if heavy_lane_worker is None:
+        from services.queue_worker import QueueConversionWorker
+        heavy_lane_worker = QueueConversionWorker(
+            None, _get_blob_service(), converter,
+            retry_delay=0,  # the host redelivers at once (visibilityTimeout)
+            conversion_timeout=HEAVY_LANE_TIMEOUT_SECONDS,
+            ledger=_get_processing_ledger()
+        )
+    return heavy_lane_worker
+
+
+@_register_if(HEAVY_LANE_ENABLED and HEAVY_LANE_TRIGGER_ENABLED,
+              app.queue_trigger(arg_name="message",
+                                queue_name=HEAVY_LANE_QUEUE,
+                                connection="AzureWebJobsStorage"))
+@correlated
+async def msg_to_eml_heavy_lane(message: func.QueueMessage):
+    """
+    Convert an MSG file forwarded to the heavy lane by the blob trigger
+    
+    Conversions wait on the event loop until the lane has room for them
+    (HEAVY_LANE_MAX_CONCURRENCY, HEAVY_LANE_MEMORY_BUDGET_MB), then run on
+    a thread under HEAVY_LANE_TIMEOUT_SECONDS. A file that cannot be
+    admitted while its conversion still fits in FUNCTION_TIMEOUT_SECONDS
+    is put back on the queue for a later attempt. Invalid files are moved to
+    the failed container; transient failures raise so that the host
+    delivers the message again, until the worker gives up on the file.
+    
+    Args:
+        message: Queue message naming the MSG blob and its size
+    """
+    from services.queue_worker import RETRY, parse_blob_notification
+    
+    budget = Deadline(FUNCTION_TIMEOUT_SECONDS - HEAVY_LANE_INVOCATION_MARGIN_SECONDS)
+    job = parse_blob_notification(message.get_body().decode('utf-8'), INPUT_CONTAINER)
+    if job is None or job.input_container != INPUT_CONTAINER:
+        logging.warning(f"Ignoring heavy-lane message {message.id}: no MSG in "
+                        f"container '{INPUT_CONTAINER}'")
+        return
+    
+    try:
+        async with _get_heavy_lane().admit(
+            job.input_size or 0, max(0.0, budget.remaining() - HEAVY_LANE_TIMEOUT_SECONDS)
+        ):
+            outcome, result = await asyncio.to_thread(
+                _get_heavy_lane_worker().process_job, job, message.dequeue_count
+            )
+    except asyncio.TimeoutError:
+        # Not admitted in time: try again later, without using up a delivery
+        await asyncio.to_thread(
+            _forward_to_heavy_lane, job.filename, job.input_size or 0,
+            HEAVY_LANE_REQUEUE_DELAY_SECONDS
+        )
+        return
+    
+    if outcome == RETRY:
+        raise BlobStorageError(
+            f"Heavy-lane conversion of {job.filename} failed: {result.error_message}"
+        )
+    if result is not None and result.success:
+        conversion_logger.log_conversion_success(
+            job.filename, result.duration_seconds, result.output_blob_url
+        )
+
+
+def _get_async_blob_service() -> 'AsyncBlobStorageService':
+    """Return the shared async storage service, creating it on first use"""
+    global async_blob_service
+    if async_blob_service is None:
+        from services.blob_storage_async import AsyncBlobStorageService
+        async_blob_service = AsyncBlobStorageService()
+    return async_blob_service
+
+
+def _warm_up() -> None:
+    """
+    Import the MSG parser and storage SDK and create the storage clients
+    
+    Errors are logged, not raised: the first invocation retries whatever
+    failed here and reports it properly.
+    """
+    start_time = time.perf_counter()
+    try:
+        _get_blob_service()
+        converter.preload()
+        if ASYNC_TRIGGER_ENABLED:
+            import services.blob_storage_async  # noqa: F401
+    except Exception as e:
+        logging.warning(f"Warm-up failed: {str(e)}")
+        return
+    logging.info(f"Warm-up finished in {time.perf_counter() - start_time:.3f}s")
+
+
+@app.warm_up_trigger(arg_name="warmup")
+def warmup(warmup) -> None:
+    """
+    Warm-up trigger, run on new instances before they receive traffic
+    (Premium and Dedicated plans)
+    
+    Args:
+        warmup: Warm-up context
+    """
+    _warm_up()
+
+
+async def _convert_and_store_async(inputBlob: func.InputStream, filename: str,
+                                   timer: StageTimer, deadline: Deadline) -> str:
+    """
+    Parse, upload and archive one MSG file for the async trigger
+    
+    Args:
+        inputBlob: Input stream containing MSG file data
+        filename: MSG filename
+        timer: Stage timer receiving the per-stage durations
+        deadline: Deadline of the conversion, bounding the isolated parse
+            and supplying the storage request timeouts
+        
+    Returns:
+        Blob URL of the uploaded EML file
+    """
+    # A retry of a blob version converted earlier resumes after the last
+    # stage it completed, instead of uploading a second EML
+    source_key = await asyncio.to_thread(_ledger_key, inputBlob, filename)
+    if source_key:
+        checkpoint = await asyncio.to_thread(
+            lookup_checkpoint, processing_ledger, source_key, filename
+        )
+        if checkpoint is not None:
+            if checkpoint.stage != STAGE_ARCHIVED:
+                with timer.stage('archive'):
+                    await _get_async_blob_service().archive_msg(
+                        INPUT_CONTAINER, filename, ARCHIVE_CONTAINER, deadline.remaining()
+                    )
+                await _record_checkpoint_async(
+                    source_key, STAGE_ARCHIVED, checkpoint.output_blob_url
+                )
+            return checkpoint.output_blob_url
+    tags = processing_ledger.upload_tags(source_key) if source_key else None
+    
+    # Read MSG file: the host has already downloaded the blob for the trigger
+    with timer.stage('read'):
+        msg_data = inputBlob.read()
+    
+    # Serve byte-identical duplicates by copying the EML converted earlier
+    if _get_dedup_cache():
+        with timer.stage('dedup'):
+            msg_digest = await asyncio.to_thread(compute_msg_digest, msg_data)
+            output_url = await asyncio.to_thread(
+                _copy_duplicate_eml, msg_digest, filename, deadline.remaining(), tags
+            )
+        if output_url:
+            await _record_checkpoint_async(source_key, STAGE_UPLOADED, output_url)
+            with timer.stage('archive'):
+                await _get_async_blob_service().archive_msg(
+                    INPUT_CONTAINER, filename, ARCHIVE_CONTAINER, deadline.remaining()
+                )
+            await _record_checkpoint_async(source_key, STAGE_ARCHIVED, output_url)
+            return output_url
+    else:
+        msg_digest = None
+    
+    # Validate and parse off the event loop (CPU-bound). Cancelling the await
+    # cannot stop the thread, so the isolated parse is given its own deadline.
+    with timer.stage('parse'):
+        if ISOLATE_PARSING:
+            eml_content = await asyncio.to_thread(
+                converter.convert_isolated, msg_data, deadline.remaining()
+            )
+        else:
+            eml_content = await asyncio.to_thread(converter.convert_stream, msg_data)
+    
+    # Upload the EML while the original is copied to the archive container;
+    # the two overlap, so they are timed as one stage
+    with timer.stage('upload_archive'):
+        output_url = await _get_async_blob_service().upload_and_archive(
+            OUTPUT_CONTAINER,
+            filename,
+            timer.timed_chunks('generate', eml_content),
+            INPUT_CONTAINER,
+            ARCHIVE_CONTAINER,
+            timeout=deadline.remaining(),
+            tags=tags,
+            on_uploaded=lambda url: _record_checkpoint_async(source_key, STAGE_UPLOADED, url)
+        )
+    await _record_checkpoint_async(source_key, STAGE_ARCHIVED, output_url)
+    
+    if msg_digest:
+        await asyncio.to_thread(_record_converted_eml, msg_digest, output_url)
+    
+    return output_url
+
+
+async def _record_checkpoint_async(source_key: Optional[str], stage: str,
+                                   output_url: str) -> None:
+    """Record a completed stage in the processing ledger off the event loop"""
+    if source_key:
+        await asyncio.to_thread(
+            record_checkpoint, processing_ledger, source_key, stage, output_url
+        )
+
+
+@_register_if(ASYNC_TRIGGER_ENABLED,
+              app.blob_trigger(arg_name="inputBlob", 
+                               path=f"{INPUT_CONTAINER}/{{name}}",
+                               connection="AzureWebJobsStorage"))
+@correlated
+async def msg_to_eml_converter_async(inputBlob: func.InputStream):
+    """
+    Async variant of msg_to_eml_converter, enabled with ASYNC_TRIGGER_ENABLED.
+    
+    Storage calls share one pooled async client, and the EML upload runs
+    concurrently with the archive copy. The whole pipeline runs under a
+    TIMEOUT_SECONDS deadline and is cancelled when it expires.
+    
+    Args:
+        inputBlob: Input stream containing MSG file data
+    """
+    start_time = time.time()
+    filename = inputBlob.name.split('/')[-1]  # Extract filename from blob path
+    file_size = inputBlob.length
+    
+    # Zip archives are expanded into one EML per MSG member; the members are
+    # converted in worker processes, so this only waits on a thread
+    if is_archive(filename):
+        await asyncio.to_thread(_convert_archive_blob, inputBlob, filename, file_size)
+        return
+    
+    # Large files are converted by the heavy lane
+    if _is_heavy(file_size):
+        await asyncio.to_thread(_forward_to_heavy_lane, filename, file_size)
+        return
+    
+    storage = _get_async_blob_service()
+    timer = StageTimer()
+    deadline = Deadline(TIMEOUT_SECONDS)
+    
+    # Log conversion start
+    conversion_logger.log_conversion_start(filename, file_size)
+    
+    try:
+        output_url = await asyncio.wait_for(
+            _convert_and_store_async(inputBlob, filename, timer, deadline),
+            timeout=TIMEOUT_SECONDS
+        )
+        
+        # Calculate final duration
+        duration = time.time() - start_time
+        
+        # Log successful conversion
+        conversion_logger.log_conversion_success(filename, duration, output_url)
+        _emit_metrics(filename, file_size, duration, timer)
+        
+        logging.info(
+            f"Successfully converted {filename} to EML in {duration:.3f}s. "
+            f"Output: {output_url}"
+        )
+        
+    except (TimeoutError, asyncio.TimeoutError) as e:
+        # Handle timeout
+        duration = time.time() - start_time
+        _emit_metrics(filename, file_size, duration, timer, e)
+        conversion_logger.log_conversion_timeout(
+            filename, e if str(e) else TimeoutError(f"exceeded {TIMEOUT_SECONDS}s"), duration
+        )
+        
+        # Move to failed container
+        try:
+            await storage.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+        except BlobStorageError as move_error:
+            logging.error(f"Failed to move timeout file to failed container: {move_error}")
+        
+        raise
+        
+    except (ValidationError, ConversionError) as e:
+        # Handle invalid or unconvertible files
+        duration = time.time() - start_time
+        conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
         
         # Move to failed container
         try:
-            blob_service.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+            await storage.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
         except BlobStorageError as move_error:
             logging.error(f"Failed to move failed file to failed container: {move_error}")
         
@@ -164,6 +879,7 @@ def msg_to_eml_converter(inputBlob: func.InputStream):
         # Handle blob storage errors
         duration = time.time() - start_time
         conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
         
         logging.error(f"Blob storage error for {filename}: {str(e)}")
         raise
@@ -172,12 +888,17 @@ def msg_to_eml_converter(inputBlob: func.InputStream):
         # Handle unexpected errors
         duration = time.time() - start_time
         conversion_logger.log_conversion_failure(filename, e, duration)
+        _emit_metrics(filename, file_size, duration, timer, e)
         
         # Try to move to failed container
         try:
-            blob_service.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
+            await storage.move_to_failed(INPUT_CONTAINER, filename, FAILED_CONTAINER)
         except BlobStorageError as move_error:
             logging.error(f"Failed to move file to failed container: {move_error}")
         
         logging.error(f"Unexpected error converting {filename}: {str(e)}")
         raise
+
+
+if WARMUP_ON_STARTUP:
+    threading.Thread(target=_warm_up, name='warmup', daemon=True).start()
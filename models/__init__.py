@@ -1,4 +1,4 @@
 # Models module for MSG to EML converter
-from .conversion_models import ConversionResult, ConversionMetrics
+from .conversion_models import ConversionResult, ConversionJob, ConversionMetrics
 
-__all__ = ['ConversionResult', 'ConversionMetrics']
+__all__ = ['ConversionResult', 'ConversionJob', 'ConversionMetrics']
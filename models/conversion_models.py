@@ -1,7 +1,7 @@
 """Data models for MSG to EML conversion logging and metrics"""
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 @dataclass
@@ -17,6 +17,36 @@ class ConversionResult:
     timestamp: datetime
 
 
+@dataclass
+class ConversionJob:
+    """A single MSG to EML conversion in a batch run
+    
+    The input is read from input_path (local file), from input_container
+    (blob named filename) or given inline as input_data (e.g. a member read
+    from a zip archive). The output is written to output_path (local file)
+    or uploaded to output_container. input_size is the input's size in
+    bytes when the job's source announced it.
+    """
+    filename: str
+    input_path: Optional[str] = None
+    input_container: Optional[str] = None
+    output_path: Optional[str] = None
+    output_container: Optional[str] = None
+    input_data: Optional[bytes] = None
+    input_size: Optional[int] = None
+
+
+@dataclass
+class ArchiveManifest:
+    """Outcome of converting the MSG members of one zip archive"""
+    archive_filename: str
+    members: List[ConversionResult]  # one per MSG member, in archive order
+    skipped_members: List[str]  # members that are not MSG files
+    duration_seconds: float
+    manifest_blob_url: Optional[str]
+    timestamp: datetime
+
+
 @dataclass
 class ConversionMetrics:
     """Metrics for monitoring and logging"""
@@ -26,3 +56,16 @@ class ConversionMetrics:
     status: str  # 'success', 'failed', 'timeout'
     error_type: Optional[str]
     timestamp: datetime
+    # Milliseconds per stage: read, validate, dedup, parse, generate, upload, archive
+    stage_durations_ms: Dict[str, int] = field(default_factory=dict)
+    bytes_in: Optional[int] = None
+    bytes_out: Optional[int] = None
+    peak_memory_mb: Optional[float] = None
+
+
+@dataclass
+class ProcessingCheckpoint:
+    """Last stage completed in the conversion of one MSG blob version"""
+    stage: str  # 'uploaded' or 'archived'
+    output_blob_url: str
+    timestamp: datetime
@@ -0,0 +1,296 @@
+"""
+Local MSG to EML conversion server
+Keeps a pool of warm worker processes and converts jobs sent as JSON lines
+on stdin, a Unix socket or a local TCP port
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+from dataclasses import asdict, fields
+from typing import Callable, Iterable, Optional, Tuple
+
+from models.conversion_models import ConversionJob, ConversionResult
+from services.worker_pool import WarmWorkerPool
+
+
+# Request keys that map onto ConversionJob fields (input_data is not
+# accepted: inputs are read by the workers themselves)
+JOB_FIELDS = {field.name for field in fields(ConversionJob)} - {'input_data'}
+
+# Jobs a single client may have queued or running at once
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+def confine_path(path: str, root: str) -> str:
+    """
+    Resolve a request path inside a root directory
+
+    Relative paths are taken from the root. Symlinks are resolved before
+    the check, so a link pointing out of the root is rejected too.
+
+    Args:
+        path: Path from the request
+        root: Directory the path must stay in (already resolved)
+
+    Returns:
+        Resolved absolute path
+
+    Raises:
+        ValueError: If the path resolves outside the root
+    """
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([resolved, root]) != root:
+        raise ValueError(f"Path is outside {root}: {path}")
+    return resolved
+
+
+def parse_request(line: str, input_root: str,
+                  output_root: str) -> Tuple[Optional[object], ConversionJob]:
+    """
+    Turn one request line into a conversion job
+
+    A request is a JSON object with ConversionJob fields, e.g.
+    {"id": 7, "input_path": "in/a.msg", "output_path": "out/a.eml"}; the
+    optional "id" is echoed in the response, and "filename" defaults to the
+    base name of input_path. input_path must lie in input_root and
+    output_path in output_root.
+
+    Args:
+        line: Request line
+        input_root: Directory input paths are read from (already resolved)
+        output_root: Directory output paths are written to (already resolved)
+
+    Returns:
+        Tuple of (request id, ConversionJob)
+
+    Raises:
+        ValueError: If the line is not a valid request, or a path is outside its root
+    """
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+
+    request_id = request.pop('id', None)
+    unknown = set(request) - JOB_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown request keys: {', '.join(sorted(unknown))}")
+    if 'filename' not in request and request.get('input_path'):
+        request['filename'] = os.path.basename(request['input_path'])
+    if not request.get('filename'):
+        raise ValueError("Request needs a filename or an input_path")
+    if request.get('input_path'):
+        request['input_path'] = confine_path(request['input_path'], input_root)
+    if request.get('output_path'):
+        request['output_path'] = confine_path(request['output_path'], output_root)
+
+    return request_id, ConversionJob(**request)
+
+
+def serve_stream(pool: WarmWorkerPool, lines: Iterable[str], write: Callable[[str], None],
+                 input_root: str, output_root: str,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> int:
+    """
+    Convert the jobs requested by one client, answering as each one finishes
+
+    Responses are JSON lines holding the ConversionResult fields and the
+    request's id; they are written in completion order, not request order.
+    At most max_in_flight jobs are outstanding, so a client that sends
+    requests faster than they are converted is slowed down instead of
+    queueing without bound.
+
+    Args:
+        pool: Worker pool converting the jobs
+        lines: Request lines (ends when the client is done)
+        write: Writes one response line
+        input_root: Directory input paths are read from (already resolved)
+        output_root: Directory output paths are written to (already resolved)
+        max_in_flight: Maximum outstanding jobs of this client
+
+    Returns:
+        Number of jobs that failed
+    """
+    slots = threading.BoundedSemaphore(max_in_flight)
+    write_lock = threading.Lock()
+    failed = 0
+
+    def respond(request_id, result: Optional[ConversionResult], error: Optional[str] = None):
+        nonlocal failed
+        if result is not None:
+            response = asdict(result)
+            response['timestamp'] = result.timestamp.isoformat()
+        else:
+            response = {'success': False, 'error_message': error}
+        response['id'] = request_id
+        with write_lock:
+            if not response['success']:
+                failed += 1
+            write(json.dumps(response) + "\n")
+
+    def finish(request_id, future):
+        try:
+            respond(request_id, future.result())
+        finally:
+            slots.release()
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request_id, job = parse_request(line, input_root, output_root)
+        except (ValueError, TypeError) as e:
+            respond(None, None, f"Invalid request: {str(e)}")
+            continue
+
+        slots.acquire()
+        try:
+            future = pool.submit(job)
+        except RuntimeError as e:
+            # The pool is closed; without a future nothing else frees the slot
+            slots.release()
+            respond(request_id, None, str(e))
+            continue
+        future.add_done_callback(
+            lambda future, request_id=request_id: finish(request_id, future)
+        )
+
+    # Wait for the outstanding jobs
+    for _ in range(max_in_flight):
+        slots.acquire()
+    return failed
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    """Serves the JSON-line requests of one socket connection"""
+
+    def handle(self) -> None:
+        lines = (raw.decode('utf-8', errors='replace') for raw in self.rfile)
+
+        def write(response: str) -> None:
+            self.wfile.write(response.encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            serve_stream(self.server.pool, lines, write, self.server.input_root,
+                         self.server.output_root, self.server.max_in_flight)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def create_server(pool: WarmWorkerPool, socket_path: Optional[str], host: str,
+                  port: Optional[int], input_root: str, output_root: str,
+                  max_in_flight: int) -> socketserver.BaseServer:
+    """
+    Create a threaded server handing each connection's requests to the pool
+
+    A Unix socket is created readable and writable by its owner only.
+
+    Args:
+        pool: Worker pool converting the jobs
+        socket_path: Unix socket path (replaced if it exists)
+        host: TCP interface, when no socket path is given
+        port: TCP port, when no socket path is given
+        input_root: Directory input paths are read from (already resolved)
+        output_root: Directory output paths are written to (already resolved)
+        max_in_flight: Maximum outstanding jobs per connection
+
+    Returns:
+        Server ready for serve_forever()
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(socket_path, _JobRequestHandler)
+        finally:
+            os.umask(umask)
+    else:
+        server = socketserver.ThreadingTCPServer((host, port), _JobRequestHandler)
+    server.daemon_threads = True
+    server.pool = pool
+    server.input_root = input_root
+    server.output_root = output_root
+    server.max_in_flight = max_in_flight
+    return server
+
+
+def main(argv=None) -> int:
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description="Serve MSG to EML conversions from a pool of warm worker processes"
+    )
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument('--socket', help="Listen on this Unix socket path")
+    listen.add_argument('--port', type=int, help="Listen on this TCP port")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="TCP interface to listen on (default: 127.0.0.1)")
+    parser.add_argument('--input-root', default='.',
+                        help="Directory input paths must lie in (default: current directory)")
+    parser.add_argument('--output-root', default='.',
+                        help="Directory output paths must lie in (default: current directory)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes (default: WORKER_POOL_SIZE or CPU count)")
+    parser.add_argument('--max-jobs', type=int, default=None,
+                        help="Jobs after which a worker is replaced (default: WORKER_MAX_JOBS "
+                             "or 1000)")
+    parser.add_argument('--max-rss-mb', type=float, default=None,
+                        help="RSS above which a worker is replaced (default: WORKER_MAX_RSS_MB "
+                             "or 512)")
+    parser.add_argument('--job-timeout', type=float, default=None,
+                        help="Seconds a job may take (default: WORKER_JOB_TIMEOUT_SECONDS or 300)")
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help=f"Maximum outstanding jobs per client "
+                             f"(default: {DEFAULT_MAX_IN_FLIGHT})")
+    args = parser.parse_args(argv)
+    input_root = os.path.realpath(args.input_root)
+    output_root = os.path.realpath(args.output_root)
+
+    pool = WarmWorkerPool(
+        workers=args.workers,
+        max_jobs_per_worker=args.max_jobs,
+        max_rss_mb=args.max_rss_mb,
+        job_timeout=args.job_timeout
+    )
+
+    try:
+        if not args.socket and args.port is None:
+            # One client: requests on stdin, responses on stdout
+            def write(response: str) -> None:
+                sys.stdout.write(response)
+                sys.stdout.flush()
+
+            failed = serve_stream(pool, sys.stdin, write, input_root, output_root,
+                                  args.max_in_flight)
+            return 1 if failed else 0
+
+        server = create_server(pool, args.socket, args.host, args.port, input_root, output_root,
+                               args.max_in_flight)
+        signal.signal(signal.SIGTERM,
+                      lambda *_: threading.Thread(target=server.shutdown).start())
+        address = args.socket or f"{args.host}:{server.server_address[1]}"
+        print(f"👷 Serving conversions on {address} with {pool.workers} warm worker(s)",
+              file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.remove(args.socket)
+        return 0
+
+    finally:
+        pool.close()
+        print(f"📊 Converted {pool.jobs_completed} job(s), recycled "
+              f"{pool.workers_recycled} worker(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Queue-driven MSG to EML conversion worker
+Consumes blob notifications (Event Grid BlobCreated events or plain blob names)
+from a Storage Queue and converts the announced MSG files concurrently
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from typing import Optional
+
+from azure.storage.queue import ExponentialRetry, QueueClient
+
+from services.blob_storage import BlobStorageService
+from services.queue_worker import DEFAULT_QUEUE_NAME, QueueConversionWorker
+from services.storage_transport import get_sync_transport, retry_settings
+
+
+def enqueue_existing(queue_client: QueueClient, blob_service: BlobStorageService,
+                     container: str, prefix: Optional[str] = None) -> int:
+    """
+    Post a notification for every .msg blob already in a container
+
+    Useful for backfills, and for Azurite, which has no Event Grid.
+
+    Args:
+        queue_client: Client of the notification queue
+        blob_service: Blob storage service
+        container: Input container name
+        prefix: Blob name prefix
+
+    Returns:
+        Number of notifications posted
+    """
+    container_client = blob_service.blob_service_client.get_container_client(container)
+    count = 0
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        if blob.name.lower().endswith('.msg'):
+            queue_client.send_message(json.dumps({'container': container, 'name': blob.name}))
+            count += 1
+    return count
+
+
+def main(argv=None) -> int:
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description="Convert MSG files announced on a Storage Queue"
+    )
+    parser.add_argument('--queue', default=os.environ.get('CONVERSION_QUEUE', DEFAULT_QUEUE_NAME),
+                        help="Notification queue name (default: CONVERSION_QUEUE or "
+                             f"{DEFAULT_QUEUE_NAME})")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="Maximum conversions in flight (default: QUEUE_MAX_CONCURRENCY "
+                             "or CPU count)")
+    parser.add_argument('--visibility-timeout', type=int, default=None,
+                        help="Seconds a received message stays invisible between renewals")
+    parser.add_argument('--enqueue-existing', action='store_true',
+                        help="First post a notification for every .msg blob in the input "
+                             "container")
+    parser.add_argument('--prefix', help="Blob name prefix (with --enqueue-existing)")
+    parser.add_argument('--drain', action='store_true',
+                        help="Exit once the queue is empty instead of polling")
+    args = parser.parse_args(argv)
+
+    blob_service = BlobStorageService()
+    queue_client = QueueClient.from_connection_string(
+        blob_service.connection_string, args.queue,
+        transport=get_sync_transport(),
+        retry_policy=ExponentialRetry(**retry_settings())
+    )
+
+    worker = QueueConversionWorker(
+        queue_client,
+        blob_service,
+        max_concurrency=args.concurrency,
+        visibility_timeout=args.visibility_timeout
+    )
+
+    if args.enqueue_existing:
+        count = enqueue_existing(queue_client, blob_service, worker.input_container, args.prefix)
+        print(f"📨 Posted {count} notification(s) to '{args.queue}'")
+
+    # Finish the conversions in flight on Ctrl+C / SIGTERM
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    print(f"👷 Processing '{args.queue}' with up to {worker.max_concurrency} conversion(s) "
+          f"in flight")
+    results = worker.run(stop_event, drain=args.drain)
+
+    if args.drain:
+        failed = sum(1 for result in results if not result.success)
+        for result in results:
+            if result.success:
+                print(f"✅ {result.filename} -> {result.output_blob_url} "
+                      f"({result.duration_seconds:.3f}s)")
+            else:
+                print(f"❌ {result.filename}: {result.error_message}")
+        print()
+        print(f"📊 Converted: {len(results) - failed}, failed: {failed}")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,31 @@
 # Services module for MSG to EML converter
-from .msg_converter import MsgToEmlConverter, ConversionError, ValidationError
-from .blob_storage import BlobStorageService, BlobStorageError
-
-__all__ = [
-    'MsgToEmlConverter', 
-    'ConversionError', 
-    'ValidationError',
-    'BlobStorageService',
-    'BlobStorageError'
-]
+#
+# Names are resolved on first access (PEP 562), so importing one submodule
+# does not import the Azure Storage SDKs and extract_msg behind the others.
+import importlib
+
+_EXPORTS = {
+    'MsgToEmlConverter': '.msg_converter',
+    'ConversionError': '.errors',
+    'ValidationError': '.errors',
+    'ParseTimeoutError': '.errors',
+    'BlobStorageService': '.blob_storage',
+    'BlobStorageError': '.errors',
+    'AsyncBlobStorageService': '.blob_storage_async',
+    'BlobRangeReader': '.blob_reader',
+    'ZipArchiveConverter': '.archive_converter',
+    'QueueConversionWorker': '.queue_worker',
+    'parse_blob_notification': '.queue_worker',
+    'WarmWorkerPool': '.worker_pool'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,267 @@
+"""Conversion of zip archives of MSG files into one EML per member"""
+import json
+import logging
+import os
+import posixpath
+import time
+import zipfile
+from dataclasses import asdict
+from datetime import datetime
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional
+
+from models.conversion_models import ArchiveManifest, ConversionJob, ConversionResult
+from .errors import ValidationError
+from .msg_converter import MsgToEmlConverter
+
+if TYPE_CHECKING:
+    # Only for annotations: the function app checks is_archive() without
+    # importing the storage SDK
+    from .blob_storage import BlobStorageService
+
+
+# Blob names handled as archives instead of single MSG files
+ARCHIVE_EXTENSIONS = ('.zip',)
+
+# Members per archive; archives with more are rejected before any is read
+DEFAULT_ARCHIVE_MAX_MEMBERS = 5000
+
+# Name suffix of the manifest written next to an archive's EMLs
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Members added by archivers that are never MSG files (macOS resource forks)
+_IGNORED_MEMBER_PREFIXES = ('__MACOSX/',)
+
+
+def is_archive(filename: str) -> bool:
+    """Return True if a blob name denotes a zip archive of MSG files"""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def archive_output_prefix(archive_filename: str) -> str:
+    """
+    Return the folder an archive's EMLs are written under
+
+    'batches/2024-06.zip' maps to 'batches/2024-06', so members of different
+    archives cannot overwrite each other's EMLs.
+
+    Args:
+        archive_filename: Blob name of the archive
+
+    Returns:
+        Blob name prefix (without trailing slash)
+    """
+    return archive_filename.rsplit('.', 1)[0]
+
+
+def _member_blob_name(member_name: str) -> Optional[str]:
+    """
+    Normalize an archive member path for use in a blob name
+
+    Args:
+        member_name: Path of the member inside the archive
+
+    Returns:
+        Normalized path, or None if it escapes the archive root
+    """
+    name = posixpath.normpath(member_name.replace('\\', '/')).lstrip('/')
+    if name in ('', '.') or name == '..' or name.startswith('../'):
+        return None
+    return name
+
+
+class ZipArchiveConverter:
+    """
+    Converts the MSG members of a zip archive in parallel
+
+    The archive is read from a seekable stream (bytes in memory, or a
+    BlobRangeReader over a large blob) one member at a time, in the order of
+    its central directory; nothing is extracted to disk. Every MSG member is
+    handed to MsgToEmlConverter.convert_many as an inline job, so members are
+    validated, converted and uploaded across a process pool while the next
+    ones are being read, with at most max_in_flight members held in memory.
+    """
+
+    def __init__(self, blob_service: 'BlobStorageService',
+                 converter: Optional[MsgToEmlConverter] = None,
+                 max_workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None,
+                 max_members: Optional[int] = None):
+        """
+        Initialize the archive converter
+
+        Args:
+            blob_service: Blob storage service (its connection string is
+                passed on to the worker processes)
+            converter: MSG converter (default: a new MsgToEmlConverter)
+            max_workers: Worker processes per archive (default from env
+                ARCHIVE_WORKERS or CPU count)
+            max_in_flight: Members read but not yet converted (default from
+                env ARCHIVE_MAX_IN_FLIGHT or twice the workers)
+            max_members: Maximum members per archive (default from env
+                ARCHIVE_MAX_MEMBERS or 5000)
+        """
+        self.blob_service = blob_service
+        self.converter = converter or MsgToEmlConverter()
+        self.max_workers = max_workers or int(
+            os.environ.get('ARCHIVE_WORKERS', os.cpu_count() or 1)
+        )
+        self.max_in_flight = max_in_flight or int(
+            os.environ.get('ARCHIVE_MAX_IN_FLIGHT', 2 * self.max_workers)
+        )
+        self.max_members = max_members or int(
+            os.environ.get('ARCHIVE_MAX_MEMBERS', DEFAULT_ARCHIVE_MAX_MEMBERS)
+        )
+
+    def convert_archive(self, archive: BinaryIO, archive_filename: str,
+                        output_container: str) -> ArchiveManifest:
+        """
+        Convert every MSG member of an archive and upload the manifest
+
+        A member that cannot be read or converted fails on its own; the
+        other members are converted regardless. The manifest is uploaded to
+        output_container as '<archive name without .zip>.manifest.json'.
+
+        Args:
+            archive: Seekable binary stream over the zip archive
+            archive_filename: Blob name of the archive
+            output_container: Container the EMLs and the manifest go to
+
+        Returns:
+            ArchiveManifest with one ConversionResult per MSG member
+
+        Raises:
+            ValidationError: If the archive is not a readable zip file or
+                has more than max_members members
+            BlobStorageError: If the manifest cannot be uploaded
+        """
+        start_time = time.time()
+        try:
+            zip_file = zipfile.ZipFile(archive)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            raise ValidationError(f"Invalid zip archive '{archive_filename}': {str(e)}") from e
+
+        with zip_file:
+            members = [info for info in zip_file.infolist() if not info.is_dir()]
+            if len(members) > self.max_members:
+                raise ValidationError(
+                    f"Archive '{archive_filename}' has {len(members)} members, more than "
+                    f"the maximum of {self.max_members}"
+                )
+
+            # Results in member order; None marks a member handed to the pool,
+            # whose result convert_many yields in the same order
+            entries: List[Optional[ConversionResult]] = []
+            skipped: List[str] = []
+            jobs = self._iter_member_jobs(zip_file, members, archive_filename,
+                                          output_container, entries, skipped)
+            converted = iter(list(self.converter.convert_many(
+                jobs,
+                max_workers=self.max_workers,
+                max_in_flight=self.max_in_flight,
+                connection_string=self.blob_service.connection_string
+            )))
+            results = [entry if entry is not None else next(converted) for entry in entries]
+
+        manifest = ArchiveManifest(
+            archive_filename=archive_filename,
+            members=results,
+            skipped_members=skipped,
+            duration_seconds=time.time() - start_time,
+            manifest_blob_url=None,
+            timestamp=datetime.utcnow()
+        )
+        manifest.manifest_blob_url = self.blob_service.upload_manifest(
+            output_container,
+            archive_output_prefix(archive_filename) + MANIFEST_SUFFIX,
+            self.manifest_json(manifest).encode('utf-8')
+        )
+        return manifest
+
+    def _iter_member_jobs(self, zip_file: zipfile.ZipFile, members: List[zipfile.ZipInfo],
+                          archive_filename: str, output_container: str,
+                          entries: List[Optional[ConversionResult]],
+                          skipped: List[str]) -> Iterator[ConversionJob]:
+        """
+        Read the MSG members of an archive and yield a conversion job for each
+
+        Members that are not MSG files are added to skipped. Members that
+        cannot be read (too large, encrypted, corrupt) get a failed result
+        in entries; every yielded job gets a None placeholder there.
+
+        Args:
+            zip_file: Open archive
+            members: File members of the archive
+            archive_filename: Blob name of the archive
+            output_container: Container the EMLs go to
+            entries: Receives the member results and placeholders, in order
+            skipped: Receives the names of skipped members
+
+        Yields:
+            ConversionJob with the member content as input_data
+        """
+        prefix = archive_output_prefix(archive_filename)
+        max_member_bytes = self.converter.max_file_size_mb * 1024 * 1024
+
+        for info in members:
+            member_name = _member_blob_name(info.filename)
+            if member_name is None or info.filename.startswith(_IGNORED_MEMBER_PREFIXES) \
+                    or not member_name.lower().endswith('.msg'):
+                skipped.append(info.filename)
+                continue
+
+            filename = f"{prefix}/{member_name}"
+            try:
+                # Checked before reading: the declared size bounds what
+                # zipfile will decompress, so oversized members are never
+                # inflated into memory
+                if info.file_size > max_member_bytes:
+                    raise ValidationError(
+                        f"File size {info.file_size / (1024 * 1024):.2f} MB exceeds maximum "
+                        f"allowed size of {self.converter.max_file_size_mb} MB"
+                    )
+                data = zip_file.read(info)
+            except Exception as e:
+                logging.warning(f"Cannot read member {info.filename} of {archive_filename}: {e}")
+                entries.append(_member_failure(filename, info.file_size, e))
+                continue
+
+            entries.append(None)
+            yield ConversionJob(
+                filename=filename,
+                input_data=data,
+                output_container=output_container
+            )
+
+    def manifest_json(self, manifest: ArchiveManifest) -> str:
+        """
+        Serialize a manifest as a JSON document
+
+        Args:
+            manifest: Archive manifest
+
+        Returns:
+            JSON with the archive name, member counts, one entry per MSG
+            member and the skipped member names
+        """
+        data = asdict(manifest)
+        data.pop('manifest_blob_url')
+        data['timestamp'] = manifest.timestamp.isoformat()
+        for member in data['members']:
+            member['timestamp'] = member['timestamp'].isoformat()
+        data['converted'] = sum(1 for result in manifest.members if result.success)
+        data['failed'] = len(manifest.members) - data['converted']
+        return json.dumps(data, indent=2)
+
+
+def _member_failure(filename: str, input_size: int, error: Exception) -> ConversionResult:
+    """Build the ConversionResult of a member that could not be read"""
+    return ConversionResult(
+        success=False,
+        filename=filename,
+        input_size_bytes=input_size,
+        output_size_bytes=None,
+        duration_seconds=0.0,
+        output_blob_url=None,
+        error_message=f"{type(error).__name__}: {str(error)}",
+        timestamp=datetime.utcnow()
+    )
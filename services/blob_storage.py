@@ -1,25 +1,331 @@
 """Azure Blob Storage service for MSG to EML converter"""
+import base64
 import os
+import threading
+import time
 import uuid
-from datetime import datetime
-from typing import Optional
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError
+from azure.storage.blob import (
+    BlobBlock,
+    BlobSasPermissions,
+    BlobServiceClient,
+    BlobClient,
+    ContainerClient,
+    ContentSettings,
+    ExponentialRetry,
+    generate_blob_sas
+)
+from utils.deadline import Deadline
+from .blob_reader import BlobRangeReader, DEFAULT_CACHE_PAGES, DEFAULT_PAGE_SIZE
+from .eml_compression import EML_CONTENT_TYPE, compress_chunks, compression_settings
+from .errors import BlobStorageError, ConversionError
+from .storage_transport import get_sync_transport, retry_settings
 
 
-class BlobStorageError(Exception):
-    """Exception raised when blob storage operations fail"""
-    pass
+# Defaults for chunked (block) uploads of streamed EML content
+DEFAULT_UPLOAD_BLOCK_SIZE_MB = 4
+DEFAULT_UPLOAD_MAX_CONCURRENCY = 4
 
+# Recently written EML names remembered per process, and the number of names
+# tried (original first, then uuid-suffixed) before an upload gives up
+DEFAULT_EML_NAME_CACHE_SIZE = 1024
+EML_NAME_ATTEMPTS = 3
 
-class BlobStorageService:
-    """Handles Azure Blob Storage operations for MSG and EML files"""
+# Blob copies: size limit for synchronous Put Blob From URL copies, deadline
+# and backoff for polling asynchronous copies, and blob batch size
+DEFAULT_SYNC_COPY_MAX_MB = 256
+DEFAULT_COPY_TIMEOUT_SECONDS = 300
+COPY_POLL_INITIAL_SECONDS = 0.25
+COPY_POLL_MAX_SECONDS = 5.0
+BLOB_BATCH_SIZE = 256
+
+
+def authorized_blob_url(blob_client, credential) -> Optional[str]:
+    """
+    Build a URL that another storage request can read the blob from
+    
+    Copy sources must be readable by the service itself: with an account
+    key, a short-lived read SAS is generated; with a SAS connection string
+    the client URL already carries it.
+    
+    Args:
+        blob_client: Client for the source blob (sync or async)
+        credential: Credential of the service client
+        
+    Returns:
+        Authorized URL, or None if the blob can only be read with the
+        caller's own credential
+    """
+    account_key = getattr(credential, 'account_key', None)
+    if account_key:
+        sas_token = generate_blob_sas(
+            account_name=blob_client.account_name,
+            container_name=blob_client.container_name,
+            blob_name=blob_client.blob_name,
+            account_key=account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=datetime.utcnow() + timedelta(hours=1)
+        )
+        return f"{blob_client.url}?{sas_token}"
+    
+    if '?' in blob_client.url:
+        return blob_client.url
+    
+    return None
+
+
+def make_block_id(upload_id: str, index: int) -> str:
+    """
+    Build a block ID; all IDs of a blob must have the same length
+    
+    The ID starts with a token unique to the upload, so blocks staged by an
+    earlier, abandoned upload to the same blob can never end up in this
+    upload's block list.
+    
+    Args:
+        upload_id: Token of the upload (uuid4 hex, so always 32 characters)
+        index: Sequence number of the block
+        
+    Returns:
+        Base64-encoded block ID
+    """
+    return base64.b64encode(f"{upload_id}-{index:08d}".encode('ascii')).decode('ascii')
+
+
+def timestamped_name(filename: str, marker: str = '') -> str:
+    """
+    Build a timestamp-based name for archived or failed MSG files
+    
+    Args:
+        filename: Original MSG filename
+        marker: Optional marker inserted before the timestamp
+        
+    Returns:
+        Name such as 'mail_failed_20240101_120000.msg'
+    """
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    base_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
+    extension = filename.rsplit('.', 1)[1] if '.' in filename else 'msg'
+    return f"{base_name}_{marker}{timestamp}.{extension}"
+
+
+def no_free_eml_name(original_filename: str) -> BlobStorageError:
+    """Build the error raised when every candidate EML name is taken"""
+    return BlobStorageError(
+        f"Could not find a free EML name for '{original_filename}' after "
+        f"{EML_NAME_ATTEMPTS} attempts"
+    )
+
+
+def copy_poll_delays(timeout: float) -> Iterator[float]:
+    """
+    Yield the waits between status polls of an asynchronous copy
+    
+    Waits start at COPY_POLL_INITIAL_SECONDS and double up to
+    COPY_POLL_MAX_SECONDS; the last one ends when timeout seconds (from
+    the first wait) have passed.
+    
+    Args:
+        timeout: Seconds the copy may take
+        
+    Yields:
+        Seconds to wait before the next poll
+    """
+    poll_deadline = time.monotonic() + timeout
+    delay = COPY_POLL_INITIAL_SECONDS
+    while True:
+        remaining = poll_deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield min(delay, remaining)
+        delay = min(delay * 2, COPY_POLL_MAX_SECONDS)
+
+
+def check_copy_status(status: str, dest_blob_name: str, timeout: float) -> None:
+    """
+    Raise unless a polled copy has succeeded
     
-    def __init__(self, connection_string: Optional[str] = None):
+    Args:
+        status: Last copy status of the destination blob
+        dest_blob_name: Name of the destination blob
+        timeout: Seconds the copy was given
+        
+    Raises:
+        BlobStorageError: If the copy is still pending or has failed
+    """
+    if status == 'pending':
+        raise BlobStorageError(
+            f"Copy to '{dest_blob_name}' did not complete within {timeout:.1f}s"
+        )
+    if status != 'success':
+        raise BlobStorageError(
+            f"Copy to '{dest_blob_name}' ended with status '{status}'"
+        )
+
+
+class BlockBuffer:
+    """
+    Cuts streamed content into the blocks of one block upload
+    
+    Chunks are accumulated until a block of block_size bytes is full, and
+    each block is handed out with its ID (see make_block_id).
+    """
+    
+    def __init__(self, block_size: int):
         """
-        Initialize the blob storage service
+        Initialize the buffer
+        
+        Args:
+            block_size: Size of every block but the last, in bytes
+        """
+        self.block_size = block_size
+        self.upload_id = uuid.uuid4().hex
+        self.block_ids: List[str] = []
+        self._buffer = bytearray()
+    
+    def add(self, chunk: bytes) -> Iterator[Tuple[str, bytes]]:
+        """
+        Add a chunk of content
+        
+        Args:
+            chunk: Next chunk of content
+            
+        Yields:
+            (block ID, block) for each block the chunk completes; a block
+            is cut only when the next one is requested
+        """
+        self._buffer += chunk
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            yield self._next_block_id(), block
+    
+    def rest(self) -> bytes:
+        """Return and clear the content that did not fill a block"""
+        rest = bytes(self._buffer)
+        self._buffer = bytearray()
+        return rest
+    
+    def last_block(self) -> Optional[Tuple[str, bytes]]:
+        """Return the final, partial block with its ID (None if nothing is left)"""
+        rest = self.rest()
+        return (self._next_block_id(), rest) if rest else None
+    
+    def block_list(self) -> List[BlobBlock]:
+        """Return the block list to commit"""
+        return [BlobBlock(block_id=block_id) for block_id in self.block_ids]
+    
+    def _next_block_id(self) -> str:
+        """Assign the ID of the next block"""
+        block_id = make_block_id(self.upload_id, len(self.block_ids))
+        self.block_ids.append(block_id)
+        return block_id
+
+
+class EmlNameAllocator:
+    """
+    Generates EML blob names and remembers the ones recently written
+    
+    Shared by the uploads of all threads; the name cache is guarded by a lock.
+    """
+    
+    def __init__(self, cache_size: Optional[int] = None):
+        """
+        Initialize the allocator
+        
+        Args:
+            cache_size: Number of recently written names to remember
+                (default from env or 1024; 0 disables the cache)
+        """
+        self.cache_size = cache_size if cache_size is not None else int(
+            os.environ.get('EML_NAME_CACHE_SIZE', DEFAULT_EML_NAME_CACHE_SIZE)
+        )
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def candidates(self, original_filename: str) -> Iterator[str]:
+        """
+        Generate candidate EML filenames in order of preference
+        
+        Preserves original filename with .eml extension, then falls back to
+        names with a unique identifier. The original name is skipped when
+        this process has recently written it, since it is then known to be
+        taken.
+        
+        Args:
+            original_filename: Original MSG filename
+            
+        Yields:
+            Up to EML_NAME_ATTEMPTS candidate EML filenames
+        """
+        # Remove .msg extension if present and add .eml
+        base_name = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
+        eml_filename = f"{base_name}.eml"
+        
+        with self._lock:
+            recently_written = eml_filename in self._recent
+        
+        attempts = EML_NAME_ATTEMPTS
+        if not recently_written:
+            yield eml_filename
+            attempts -= 1
+        
+        for _ in range(attempts):
+            # Name taken, generate unique identifier
+            unique_id = str(uuid.uuid4())[:8]
+            yield f"{base_name}_{unique_id}.eml"
+    
+    def remember(self, eml_filename: str) -> None:
+        """
+        Record a written EML filename
+        
+        Args:
+            eml_filename: Name of the blob that was created
+        """
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._recent[eml_filename] = None
+            self._recent.move_to_end(eml_filename)
+            if len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+
+class StorageSettings:
+    """
+    Settings shared by BlobStorageService and AsyncBlobStorageService
+    
+    Connection string, block uploads, EML naming and compression, and the
+    copy engine, from the arguments or the environment.
+    """
+    
+    def __init__(self, connection_string: Optional[str] = None,
+                 upload_block_size_mb: Optional[float] = None,
+                 upload_max_concurrency: Optional[int] = None,
+                 eml_compression: Optional[str] = None,
+                 eml_compression_level: Optional[int] = None):
+        """
+        Read the settings
         
         Args:
             connection_string: Azure Storage connection string (default from env)
+            upload_block_size_mb: Block size for chunked EML uploads in MB
+                (default from env or 4 MB)
+            upload_max_concurrency: Maximum number of blocks staged in
+                parallel during chunked uploads (default from env or 4)
+            eml_compression: Content-Encoding for EML uploads: none, gzip,
+                deflate or br (default from env EML_COMPRESSION or none)
+            eml_compression_level: Compression level (default from env
+                EML_COMPRESSION_LEVEL or the codec's default)
+            
+        Raises:
+            BlobStorageError: If there is no connection string, or the
+                compression settings are invalid
         """
         self.connection_string = connection_string or os.environ.get(
             'AzureWebJobsStorage'
@@ -31,89 +337,482 @@ class BlobStorageService:
                 "AzureWebJobsStorage environment variable not set"
             )
         
+        block_size_mb = upload_block_size_mb or float(
+            os.environ.get('UPLOAD_BLOCK_SIZE_MB', DEFAULT_UPLOAD_BLOCK_SIZE_MB)
+        )
+        self.upload_block_size = int(block_size_mb * 1024 * 1024)
+        self.upload_max_concurrency = upload_max_concurrency or int(
+            os.environ.get('UPLOAD_MAX_CONCURRENCY', DEFAULT_UPLOAD_MAX_CONCURRENCY)
+        )
+        
+        # EML naming, with an LRU of names this process has written
+        self.eml_names = EmlNameAllocator()
+        
+        # EML output compression, applied chunk by chunk while uploading
+        try:
+            self.eml_compression, self.eml_compression_level = compression_settings(
+                eml_compression, eml_compression_level
+            )
+        except ValueError as e:
+            raise BlobStorageError(str(e)) from e
+        self.eml_content_settings = ContentSettings(
+            content_type=EML_CONTENT_TYPE, content_encoding=self.eml_compression
+        )
+        
+        # Copy engine settings for archive and failed moves
+        self.sync_copy_max_bytes = int(
+            float(os.environ.get('SYNC_COPY_MAX_MB', DEFAULT_SYNC_COPY_MAX_MB)) * 1024 * 1024
+        )
+        self.copy_timeout_seconds = float(
+            os.environ.get('COPY_TIMEOUT_SECONDS', DEFAULT_COPY_TIMEOUT_SECONDS)
+        )
+    
+    def use_sync_copy(self, source_url: Optional[str], size: int) -> bool:
+        """Whether a blob is copied with a synchronous Put Blob From URL"""
+        return bool(source_url) and size <= self.sync_copy_max_bytes
+    
+    def copy_timeout(self, deadline: Deadline) -> float:
+        """Seconds an asynchronous copy may take: copy_timeout_seconds, capped by the deadline"""
+        remaining = deadline.remaining()
+        return self.copy_timeout_seconds if remaining is None else min(
+            self.copy_timeout_seconds, remaining
+        )
+
+
+class BlobStorageService(StorageSettings):
+    """Handles Azure Blob Storage operations for MSG and EML files"""
+    
+    def __init__(self, connection_string: Optional[str] = None,
+                 upload_block_size_mb: Optional[float] = None,
+                 upload_max_concurrency: Optional[int] = None,
+                 eml_compression: Optional[str] = None,
+                 eml_compression_level: Optional[int] = None):
+        """
+        Initialize the blob storage service
+        
+        Args:
+            connection_string: Azure Storage connection string (default from env)
+            upload_block_size_mb: Block size for chunked EML uploads in MB
+                (default from env or 4 MB)
+            upload_max_concurrency: Maximum number of blocks staged in
+                parallel during chunked uploads (default from env or 4)
+            eml_compression: Content-Encoding for EML uploads: none, gzip,
+                deflate or br (default from env EML_COMPRESSION or none)
+            eml_compression_level: Compression level (default from env
+                EML_COMPRESSION_LEVEL or the codec's default)
+        """
+        super().__init__(connection_string, upload_block_size_mb, upload_max_concurrency,
+                         eml_compression, eml_compression_level)
+        
         try:
+            # One pooled transport per process, shared with the other clients
             self.blob_service_client = BlobServiceClient.from_connection_string(
-                self.connection_string
+                self.connection_string,
+                transport=get_sync_transport(),
+                retry_policy=ExponentialRetry(**retry_settings())
             )
         except Exception as e:
             raise BlobStorageError(
                 f"Failed to initialize BlobServiceClient: {str(e)}"
             ) from e
+        
+        # Container clients by name, reused across calls
+        self._container_clients: Dict[str, ContainerClient] = {}
+    
+    def _get_container_client(self, container: str) -> ContainerClient:
+        """
+        Return the cached client for a container
+        
+        Args:
+            container: Container name
+            
+        Returns:
+            ContainerClient sharing the service client's pipeline
+        """
+        container_client = self._container_clients.get(container)
+        if container_client is None:
+            container_client = self.blob_service_client.get_container_client(container)
+            self._container_clients[container] = container_client
+        return container_client
+    
+    def _get_blob_client(self, container: str, blob: str) -> BlobClient:
+        """
+        Return a client for a blob, created from the cached container client
+        
+        Args:
+            container: Container name
+            blob: Blob name
+            
+        Returns:
+            BlobClient sharing the service client's pipeline
+        """
+        return self._get_container_client(container).get_blob_client(blob)
+    
+    def open_blob_reader(self, container: str, filename: str,
+                         page_size: int = DEFAULT_PAGE_SIZE,
+                         cache_pages: int = DEFAULT_CACHE_PAGES) -> BlobRangeReader:
+        """
+        Opens a seekable, page-cached stream over a blob
+        
+        Args:
+            container: Container name
+            filename: Blob name
+            page_size: Number of bytes fetched per ranged GET
+            cache_pages: Number of pages kept in memory
+            
+        Returns:
+            BlobRangeReader positioned at the start of the blob
+            
+        Raises:
+            BlobStorageError: If the blob cannot be opened
+        """
+        try:
+            blob_client = self._get_blob_client(container, filename)
+            return BlobRangeReader(blob_client, page_size=page_size, cache_pages=cache_pages)
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to open blob '{filename}' in container '{container}': {str(e)}"
+            ) from e
+    
+    def get_etag(self, container: str, filename: str) -> str:
+        """
+        Returns the current ETag of a blob
+        
+        Args:
+            container: Container name
+            filename: Blob name
+            
+        Returns:
+            ETag of the blob
+            
+        Raises:
+            BlobStorageError: If the blob's properties cannot be read
+        """
+        try:
+            return self._get_blob_client(container, filename).get_blob_properties().etag
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to read properties of blob '{filename}' in container "
+                f"'{container}': {str(e)}"
+            ) from e
     
-    def upload_eml(self, container: str, filename: str, content: bytes) -> str:
+    def upload_eml(self, container: str, filename: str,
+                   content: Union[bytes, Iterable[bytes]],
+                   timeout: Optional[float] = None,
+                   tags: Optional[Dict[str, str]] = None) -> str:
         """
         Uploads EML file to specified container
         
+        The blob is created with an If-None-Match: * precondition under the
+        original name; only if that name is taken does the upload fall back
+        to a uuid-suffixed name. Content that fits in one request needs no
+        existence check up front; see _upload_blocks for larger content.
+        
+        With eml_compression set, content is compressed as it is staged and
+        the blob gets a matching Content-Encoding, so SDK downloads (and HTTP
+        clients) decompress it transparently.
+        
         Args:
             container: Target container name
             filename: Name for the EML file (original filename preserved)
-            content: EML file content
+            content: EML file content, either as bytes or as an iterator of
+                chunks (e.g. from MsgToEmlConverter.convert_stream), which
+                is staged in blocks as it is produced
+            timeout: Time budget in seconds for the whole upload; each
+                request is sent with the remaining budget as its timeout
+            tags: Blob index tags, set in the request that creates the
+                blob (the single Put, or the block list commit)
             
         Returns:
             Blob URL of uploaded file
             
         Raises:
             BlobStorageError: If upload fails
+            ConversionError: If a streamed EML chunk fails to generate
+            TimeoutError: If the time budget runs out between blocks
         """
+        deadline = Deadline(timeout)
         try:
             # Get container client
-            container_client = self.blob_service_client.get_container_client(container)
-            
-            # Generate EML filename with proper naming convention
-            eml_filename = self._generate_eml_filename(container_client, filename)
+            container_client = self._get_container_client(container)
             
-            # Get blob client
-            blob_client = container_client.get_blob_client(eml_filename)
+            if self.eml_compression:
+                if isinstance(content, (bytes, bytearray)):
+                    content = [content]
+                content = compress_chunks(
+                    content, self.eml_compression, self.eml_compression_level
+                )
             
             # Upload the content
-            blob_client.upload_blob(content, overwrite=False)
+            if isinstance(content, (bytes, bytearray)):
+                blob_client = self._create_eml_blob(
+                    container_client, filename, content, deadline, tags
+                )
+            else:
+                blob_client = self._upload_blocks(
+                    container_client, filename, content, deadline, tags
+                )
             
             # Return the blob URL
             return blob_client.url
             
+        except (ConversionError, TimeoutError):
+            # Errors raised while generating streamed content, and running out
+            # of time, are not storage failures; let the caller handle them
+            raise
         except Exception as e:
             raise BlobStorageError(
                 f"Failed to upload EML file '{filename}' to container '{container}': {str(e)}"
             ) from e
     
-    def _generate_eml_filename(self, container_client: ContainerClient, 
-                               original_filename: str) -> str:
+    def copy_eml(self, container: str, source_url: str, filename: str,
+                 timeout: Optional[float] = None,
+                 tags: Optional[Dict[str, str]] = None) -> str:
         """
-        Generate EML filename with proper naming convention
+        Creates an EML file as a server-side copy of an existing EML blob
         
-        Preserves original filename with .eml extension.
-        Generates unique identifier for duplicate filenames.
+        Used for duplicate MSG files: the new EML gets the usual name for
+        filename (with the same conditional-create fallback as upload_eml),
+        but no content passes through this process.
         
         Args:
-            container_client: Container client to check for existing files
-            original_filename: Original MSG filename
+            container: Target container name
+            source_url: URL of the existing EML blob in the same account
+            filename: Name for the EML file (original filename preserved)
+            timeout: Time budget in seconds, passed on as request timeouts
+            tags: Blob index tags of the new EML (the source's are not copied)
             
         Returns:
-            EML filename with proper extension and uniqueness
+            Blob URL of the new EML file
+            
+        Raises:
+            BlobStorageError: If the copy fails (e.g. the source is gone)
         """
-        # Remove .msg extension if present and add .eml
-        base_name = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
-        eml_filename = f"{base_name}.eml"
+        deadline = Deadline(timeout)
+        try:
+            container_client = self._get_container_client(container)
+            source_blob_client = BlobClient.from_blob_url(
+                source_url, credential=self.blob_service_client.credential
+            )
+            copy_source_url = authorized_blob_url(
+                source_blob_client, self.blob_service_client.credential
+            ) or source_url
+            
+            for eml_filename in self.eml_names.candidates(filename):
+                blob_client = container_client.get_blob_client(eml_filename)
+                try:
+                    # overwrite=False sends If-None-Match: *
+                    blob_client.upload_blob_from_url(
+                        copy_source_url, overwrite=False, tags=tags,
+                        **deadline.request_options()
+                    )
+                except (ResourceExistsError, ResourceModifiedError):
+                    continue
+                
+                self.eml_names.remember(eml_filename)
+                return blob_client.url
+            
+            raise no_free_eml_name(filename)
+            
+        except BlobStorageError:
+            raise
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to copy EML '{source_url}' for '{filename}' to "
+                f"container '{container}': {str(e)}"
+            ) from e
+    
+    def upload_manifest(self, container: str, name: str, content: bytes) -> str:
+        """
+        Uploads a JSON manifest, replacing any earlier one of the same name
         
-        # Check if file already exists
-        blob_client = container_client.get_blob_client(eml_filename)
+        Args:
+            container: Target container name
+            name: Blob name of the manifest
+            content: UTF-8 encoded JSON document
         
+        Returns:
+            Blob URL of the manifest
+        
+        Raises:
+            BlobStorageError: If upload fails
+        """
         try:
-            # Check if blob exists
-            blob_client.get_blob_properties()
+            blob_client = self._get_blob_client(container, name)
+            blob_client.upload_blob(
+                content, overwrite=True,
+                content_settings=ContentSettings(content_type='application/json')
+            )
+            return blob_client.url
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to upload manifest '{name}' to container '{container}': {str(e)}"
+            ) from e
+    
+    def _create_eml_blob(self, container_client: ContainerClient, original_filename: str,
+                         content: bytes, deadline: Deadline,
+                         tags: Optional[Dict[str, str]] = None) -> BlobClient:
+        """
+        Create the EML blob with a conditional Put, renaming on conflict
+        
+        Args:
+            container_client: Container client for the output container
+            original_filename: Original MSG filename
+            content: Blob content
+            deadline: Deadline supplying the request timeouts
+            tags: Blob index tags of the created blob
             
-            # File exists, generate unique identifier
-            unique_id = str(uuid.uuid4())[:8]
-            eml_filename = f"{base_name}_{unique_id}.eml"
+        Returns:
+            Client for the created blob
+        """
+        for eml_filename in self.eml_names.candidates(original_filename):
+            blob_client = container_client.get_blob_client(eml_filename)
+            try:
+                # overwrite=False sends If-None-Match: *
+                blob_client.upload_blob(
+                    content, overwrite=False, content_settings=self.eml_content_settings,
+                    tags=tags, **deadline.request_options()
+                )
+            except (ResourceExistsError, ResourceModifiedError):
+                # Name taken: try the next (unique) candidate
+                continue
             
-        except Exception:
-            # Blob doesn't exist, use original name
-            pass
+            self.eml_names.remember(eml_filename)
+            return blob_client
         
-        return eml_filename
-
+        raise no_free_eml_name(original_filename)
+    
+    def _free_eml_blob(self, container_client: ContainerClient, original_filename: str,
+                       deadline: Deadline) -> BlobClient:
+        """
+        Pick the EML name a block upload stages its blocks under
+        
+        Staged blocks belong to one blob name and cannot be moved to another,
+        so the name is chosen before the first block: the first candidate
+        that does not exist yet. Nothing is written, so the name only
+        becomes visible when the block list is committed.
+        
+        Args:
+            container_client: Container client for the output container
+            original_filename: Original MSG filename
+            deadline: Deadline supplying the request timeouts
+            
+        Returns:
+            Client for the chosen (still nonexistent) blob
+        """
+        for eml_filename in self.eml_names.candidates(original_filename):
+            blob_client = container_client.get_blob_client(eml_filename)
+            if not blob_client.exists(**deadline.request_options()):
+                return blob_client
+        
+        raise no_free_eml_name(original_filename)
+    
+    def _upload_blocks(self, container_client: ContainerClient, original_filename: str,
+                       chunks: Iterable[bytes], deadline: Deadline,
+                       tags: Optional[Dict[str, str]] = None) -> BlobClient:
+        """
+        Upload streamed content as a block blob, staging blocks in parallel
+        
+        Chunks are accumulated into blocks of upload_block_size bytes, and
+        each full block is staged while the next one is being produced. At
+        most upload_max_concurrency blocks are in flight at once, which bounds
+        memory to roughly (upload_max_concurrency + 1) blocks. Content that
+        fits in a single block is uploaded with one conditional request.
+        
+        Blocks are staged under a free name (see _free_eml_blob) with IDs
+        that carry a per-upload token, and the block list is committed with
+        If-None-Match: *, which creates the blob in one step. Until then the
+        blocks are uncommitted and invisible, so a failed or crashed upload
+        leaves no EML behind (the service discards the blocks after a week).
+        If another writer takes the name first, the commit fails and the
+        upload raises; a retry then picks another name.
+        
+        Every request gets the remaining time of the deadline as its timeout,
+        and the deadline is checked before each block is staged.
+        
+        Args:
+            container_client: Container client for the output container
+            original_filename: Original MSG filename
+            chunks: Iterator of content chunks
+            deadline: Deadline for the whole upload
+            tags: Blob index tags, set by the request that creates the
+                content (the single Put, or the block list commit)
+            
+        Returns:
+            Client for the created blob
+        """
+        blocks = BlockBuffer(self.upload_block_size)
+        pending = set()
+        blob_client = None
+        
+        with ThreadPoolExecutor(max_workers=self.upload_max_concurrency) as executor:
+            try:
+                for chunk in chunks:
+                    for block_id, block in blocks.add(chunk):
+                        deadline.check("while uploading EML")
+                        if blob_client is None:
+                            blob_client = self._free_eml_blob(
+                                container_client, original_filename, deadline
+                            )
+                        
+                        # Wait for a free slot before staging another block
+                        if len(pending) >= self.upload_max_concurrency:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        
+                        pending.add(executor.submit(
+                            blob_client.stage_block, block_id, block,
+                            **deadline.request_options()
+                        ))
+                
+                if blob_client is None:
+                    # Small output: a single request is cheaper than staging
+                    return self._create_eml_blob(
+                        container_client, original_filename, blocks.rest(), deadline, tags
+                    )
+                
+                last_block = blocks.last_block()
+                if last_block:
+                    pending.add(executor.submit(
+                        blob_client.stage_block, *last_block, **deadline.request_options()
+                    ))
+                
+                done, pending = wait(pending, timeout=deadline.remaining())
+                for future in done:
+                    future.result()
+                if pending:
+                    raise TimeoutError(
+                        f"Timeout exceeded while uploading EML: {deadline.elapsed():.2f}s"
+                    )
+                
+            except BaseException:
+                # Don't stage further blocks for an upload that won't commit
+                for future in pending:
+                    future.cancel()
+                raise
+        
+        # Create the blob only if nobody else has taken the name meanwhile
+        try:
+            blob_client.commit_block_list(
+                blocks.block_list(),
+                content_settings=self.eml_content_settings,
+                tags=tags,
+                match_condition=MatchConditions.IfMissing,
+                **deadline.request_options()
+            )
+        except (ResourceExistsError, ResourceModifiedError) as e:
+            self.eml_names.remember(blob_client.blob_name)
+            raise BlobStorageError(
+                f"EML name '{blob_client.blob_name}' was taken while its blocks were "
+                f"being staged"
+            ) from e
+        
+        self.eml_names.remember(blob_client.blob_name)
+        return blob_client
+    
     def archive_msg(self, source_container: str, filename: str, 
-                    archive_container: str) -> None:
+                    archive_container: str, timeout: Optional[float] = None) -> None:
         """
         Moves original MSG file to archive container
         
@@ -121,35 +820,18 @@ class BlobStorageService:
             source_container: Source container name
             filename: MSG filename
             archive_container: Archive container name
+            timeout: Time budget in seconds (default: copy_timeout_seconds
+                for the copy, none for the other requests)
             
         Raises:
             BlobStorageError: If archive operation fails
         """
         try:
-            # Get source and destination blob clients
-            source_blob_client = self.blob_service_client.get_blob_client(
-                source_container, filename
-            )
-            
-            # Generate timestamp-based name for archive
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            base_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
-            extension = filename.rsplit('.', 1)[1] if '.' in filename else 'msg'
-            archive_filename = f"{base_name}_{timestamp}.{extension}"
-            
-            dest_blob_client = self.blob_service_client.get_blob_client(
-                archive_container, archive_filename
+            self._move_blob(
+                source_container, filename,
+                archive_container, timestamped_name(filename),
+                Deadline(timeout)
             )
-            
-            # Copy blob to archive container
-            dest_blob_client.start_copy_from_url(source_blob_client.url)
-            
-            # Wait for copy to complete (for small files this is usually instant)
-            # In production, you might want to check copy status
-            
-            # Delete the source blob
-            source_blob_client.delete_blob()
-            
         except Exception as e:
             raise BlobStorageError(
                 f"Failed to archive MSG file '{filename}' from '{source_container}' "
@@ -170,29 +852,169 @@ class BlobStorageService:
             BlobStorageError: If move operation fails
         """
         try:
-            # Get source and destination blob clients
-            source_blob_client = self.blob_service_client.get_blob_client(
-                source_container, filename
+            self._move_blob(
+                source_container, filename,
+                failed_container, timestamped_name(filename, 'failed_'),
+                Deadline(None)
             )
-            
-            # Generate timestamp-based name for failed file
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            base_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
-            extension = filename.rsplit('.', 1)[1] if '.' in filename else 'msg'
-            failed_filename = f"{base_name}_failed_{timestamp}.{extension}"
-            
-            dest_blob_client = self.blob_service_client.get_blob_client(
-                failed_container, failed_filename
-            )
-            
-            # Copy blob to failed container
-            dest_blob_client.start_copy_from_url(source_blob_client.url)
-            
-            # Delete the source blob
-            source_blob_client.delete_blob()
-            
         except Exception as e:
             raise BlobStorageError(
                 f"Failed to move MSG file '{filename}' from '{source_container}' "
                 f"to '{failed_container}': {str(e)}"
             ) from e
+    
+    def archive_many(self, source_container: str, filenames: List[str],
+                     archive_container: str) -> Dict[str, str]:
+        """
+        Moves many MSG files to the archive container
+        
+        Copies run in parallel; the sources of all completed copies are then
+        removed with blob batch requests (up to 256 deletes per request)
+        instead of one request each.
+        
+        Args:
+            source_container: Source container name
+            filenames: MSG filenames
+            archive_container: Archive container name
+            
+        Returns:
+            Mapping of filename to error message for files that could not be
+            archived (empty if all succeeded); their sources are kept
+        """
+        failures: Dict[str, str] = {}
+        copied: List[Tuple[str, str]] = []
+        
+        def copy_one(filename: str) -> str:
+            source_blob_client = self._get_blob_client(
+                source_container, filename
+            )
+            dest_blob_client = self._get_blob_client(
+                archive_container, timestamped_name(filename)
+            )
+            return self._copy_blob(source_blob_client, dest_blob_client, Deadline(None))
+        
+        with ThreadPoolExecutor(max_workers=self.upload_max_concurrency) as executor:
+            futures = {filename: executor.submit(copy_one, filename) for filename in filenames}
+            for filename, future in futures.items():
+                try:
+                    copied.append((filename, future.result()))
+                except Exception as e:
+                    failures[filename] = str(e)
+        
+        container_client = self._get_container_client(source_container)
+        for start in range(0, len(copied), BLOB_BATCH_SIZE):
+            batch = copied[start:start + BLOB_BATCH_SIZE]
+            try:
+                responses = container_client.delete_blobs(
+                    *[
+                        {'name': filename, 'etag': etag,
+                         'match_condition': MatchConditions.IfNotModified}
+                        for filename, etag in batch
+                    ],
+                    raise_on_any_failure=False
+                )
+                for (filename, _), response in zip(batch, responses):
+                    if response.status_code not in (200, 202, 204):
+                        failures[filename] = (
+                            f"Archived copy created but source delete failed "
+                            f"with status {response.status_code}"
+                        )
+            except Exception as e:
+                for filename, _ in batch:
+                    failures[filename] = (
+                        f"Archived copy created but source delete failed: {str(e)}"
+                    )
+        
+        return failures
+    
+    def _move_blob(self, source_container: str, filename: str,
+                   dest_container: str, dest_filename: str, deadline: Deadline) -> None:
+        """
+        Copy a blob to another container, then delete the source
+        
+        The source is deleted only after the copy has completed, and only if
+        it has not changed since it was copied.
+        
+        Args:
+            source_container: Source container name
+            filename: Source blob name
+            dest_container: Destination container name
+            dest_filename: Destination blob name
+            deadline: Deadline for the copy and delete
+        """
+        source_blob_client = self._get_blob_client(
+            source_container, filename
+        )
+        dest_blob_client = self._get_blob_client(
+            dest_container, dest_filename
+        )
+        
+        source_etag = self._copy_blob(source_blob_client, dest_blob_client, deadline)
+        
+        source_blob_client.delete_blob(
+            etag=source_etag,
+            match_condition=MatchConditions.IfNotModified,
+            **deadline.request_options()
+        )
+    
+    def _copy_blob(self, source_blob_client: BlobClient, dest_blob_client: BlobClient,
+                   deadline: Deadline) -> str:
+        """
+        Copy a blob and wait until the copy has completed
+        
+        Blobs up to sync_copy_max_bytes are copied with a synchronous Put Blob
+        From URL when the source can be authorized; larger blobs use the
+        asynchronous copy, whose status is polled with exponential backoff
+        until copy_timeout_seconds or the deadline, whichever comes first. A
+        copy that doesn't finish in time is aborted.
+        
+        Args:
+            source_blob_client: Client for the source blob
+            dest_blob_client: Client for the destination blob
+            deadline: Deadline supplying request timeouts and bounding polling
+            
+        Returns:
+            ETag of the source blob that was copied
+            
+        Raises:
+            BlobStorageError: If the copy fails, is aborted or times out
+        """
+        properties = source_blob_client.get_blob_properties(**deadline.request_options())
+        source_etag = properties.etag
+        source_url = authorized_blob_url(source_blob_client, self.blob_service_client.credential)
+        
+        if self.use_sync_copy(source_url, properties.size):
+            dest_blob_client.upload_blob_from_url(
+                source_url,
+                overwrite=True,
+                source_etag=source_etag,
+                source_match_condition=MatchConditions.IfNotModified,
+                **deadline.request_options()
+            )
+            return source_etag
+        
+        copy = dest_blob_client.start_copy_from_url(
+            source_url or source_blob_client.url,
+            source_etag=source_etag,
+            source_match_condition=MatchConditions.IfNotModified,
+            **deadline.request_options()
+        )
+        status = copy.get('copy_status')
+        timeout = self.copy_timeout(deadline)
+        
+        for delay in copy_poll_delays(timeout):
+            if status != 'pending':
+                break
+            time.sleep(delay)
+            status = dest_blob_client.get_blob_properties(
+                **deadline.request_options()
+            ).copy.status
+        
+        if status == 'pending':
+            try:
+                dest_blob_client.abort_copy(copy['copy_id'])
+            except Exception:
+                pass
+        check_copy_status(status, dest_blob_client.blob_name, timeout)
+        
+        return source_etag
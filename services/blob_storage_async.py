@@ -0,0 +1,618 @@
+"""Asynchronous Azure Blob Storage service for MSG to EML converter"""
+import asyncio
+from typing import (
+    AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Union
+)
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError
+from azure.storage.blob.aio import BlobServiceClient, BlobClient, ContainerClient, ExponentialRetry
+from utils.deadline import Deadline
+from .blob_storage import (
+    BlobStorageError,
+    BlockBuffer,
+    StorageSettings,
+    authorized_blob_url,
+    check_copy_status,
+    copy_poll_delays,
+    no_free_eml_name,
+    timestamped_name
+)
+from .eml_compression import ChunkCompressor, compress_chunks
+from .errors import ConversionError
+from .storage_transport import create_async_transport, retry_settings
+
+
+# Async clients shared by all service instances, keyed by event loop and
+# connection string, so that every caller on a loop reuses the same pooled
+# aiohttp session (a session only works on the loop it was created on)
+_shared_clients: Dict[asyncio.AbstractEventLoop, Dict[str, BlobServiceClient]] = {}
+
+
+def _for_running_loop(caches: Dict[asyncio.AbstractEventLoop, Dict]) -> Dict:
+    """
+    Returns the running loop's entry of a per-loop cache
+
+    Entries of loops that have since closed are dropped; their clients hold
+    sessions that can no longer be used or closed.
+    """
+    for loop in [loop for loop in caches if loop.is_closed()]:
+        del caches[loop]
+    return caches.setdefault(asyncio.get_running_loop(), {})
+
+
+class AsyncBlobStorageService(StorageSettings):
+    """Handles Azure Blob Storage operations for MSG and EML files with asyncio"""
+
+    def __init__(self, connection_string: Optional[str] = None,
+                 upload_block_size_mb: Optional[float] = None,
+                 upload_max_concurrency: Optional[int] = None,
+                 eml_compression: Optional[str] = None,
+                 eml_compression_level: Optional[int] = None):
+        """
+        Initialize the async blob storage service
+
+        Takes the same settings as BlobStorageService (see StorageSettings);
+        clients are created per event loop on first use.
+        """
+        super().__init__(connection_string, upload_block_size_mb, upload_max_concurrency,
+                         eml_compression, eml_compression_level)
+
+        # Container clients by event loop and name, reused across calls
+        self._container_clients: Dict[asyncio.AbstractEventLoop, Dict[str, ContainerClient]] = {}
+
+    @property
+    def blob_service_client(self) -> BlobServiceClient:
+        """
+        The shared service client of the running event loop
+
+        Created on the loop's first use, with its own pooled transport.
+
+        Raises:
+            BlobStorageError: If the client cannot be created
+        """
+        clients = _for_running_loop(_shared_clients)
+        client = clients.get(self.connection_string)
+        if client is None:
+            try:
+                client = BlobServiceClient.from_connection_string(
+                    self.connection_string,
+                    transport=create_async_transport(),
+                    retry_policy=ExponentialRetry(**retry_settings())
+                )
+            except Exception as e:
+                raise BlobStorageError(
+                    f"Failed to initialize async BlobServiceClient: {str(e)}"
+                ) from e
+            clients[self.connection_string] = client
+        return client
+
+    async def close(self) -> None:
+        """Closes the running loop's shared client and its connection pool"""
+        loop = asyncio.get_running_loop()
+        client = _shared_clients.get(loop, {}).pop(self.connection_string, None)
+        self._container_clients.pop(loop, None)
+        if client is not None:
+            await client.close()
+
+    def _get_container_client(self, container: str) -> ContainerClient:
+        """
+        Return the cached client for a container
+
+        Args:
+            container: Container name
+
+        Returns:
+            ContainerClient sharing the service client's pipeline
+        """
+        container_clients = _for_running_loop(self._container_clients)
+        container_client = container_clients.get(container)
+        if container_client is None:
+            container_client = self.blob_service_client.get_container_client(container)
+            container_clients[container] = container_client
+        return container_client
+
+    def _get_blob_client(self, container: str, blob: str) -> BlobClient:
+        """
+        Return a client for a blob, created from the cached container client
+
+        Args:
+            container: Container name
+            blob: Blob name
+
+        Returns:
+            BlobClient sharing the service client's pipeline
+        """
+        return self._get_container_client(container).get_blob_client(blob)
+
+    async def upload_eml(self, container: str, filename: str,
+                         content: Union[bytes, Iterable[bytes], AsyncIterable[bytes]],
+                         timeout: Optional[float] = None,
+                         tags: Optional[Dict[str, str]] = None) -> str:
+        """
+        Uploads EML file to specified container
+
+        Uses the same conditional-create naming and compression as
+        BlobStorageService.upload_eml.
+
+        Args:
+            container: Target container name
+            filename: Name for the EML file (original filename preserved)
+            content: EML file content, as bytes or as a (sync or async)
+                iterator of chunks, which is staged in blocks as it is produced
+            timeout: Time budget in seconds for the whole upload; each
+                request is sent with the remaining budget as its timeout
+            tags: Blob index tags, set in the request that creates the
+                blob's content
+
+        Returns:
+            Blob URL of uploaded file
+
+        Raises:
+            BlobStorageError: If upload fails
+            ConversionError: If a streamed EML chunk fails to generate
+            TimeoutError: If the time budget runs out between blocks
+        """
+        deadline = Deadline(timeout)
+        try:
+            container_client = self._get_container_client(container)
+
+            if self.eml_compression:
+                content = self._compress(content)
+
+            # Upload the content
+            if isinstance(content, (bytes, bytearray)):
+                blob_client = await self._create_eml_blob(
+                    container_client, filename, content, deadline, tags
+                )
+            else:
+                blob_client = await self._upload_blocks(
+                    container_client, filename, content, deadline, tags
+                )
+
+            return blob_client.url
+
+        except (ConversionError, TimeoutError):
+            raise
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to upload EML file '{filename}' to container '{container}': {str(e)}"
+            ) from e
+
+    async def _create_eml_blob(self, container_client: ContainerClient, original_filename: str,
+                               content: bytes, deadline: Deadline,
+                               tags: Optional[Dict[str, str]] = None) -> BlobClient:
+        """
+        Create the EML blob with a conditional Put, renaming on conflict
+
+        Args:
+            container_client: Container client for the output container
+            original_filename: Original MSG filename
+            content: Blob content
+            deadline: Deadline supplying the request timeouts
+            tags: Blob index tags of the created blob
+
+        Returns:
+            Client for the created blob
+        """
+        for eml_filename in self.eml_names.candidates(original_filename):
+            blob_client = container_client.get_blob_client(eml_filename)
+            try:
+                # overwrite=False sends If-None-Match: *
+                await blob_client.upload_blob(
+                    content, overwrite=False, content_settings=self.eml_content_settings,
+                    tags=tags, **deadline.request_options()
+                )
+            except (ResourceExistsError, ResourceModifiedError):
+                # Name taken: try the next (unique) candidate
+                continue
+
+            self.eml_names.remember(eml_filename)
+            return blob_client
+
+        raise no_free_eml_name(original_filename)
+
+    async def _free_eml_blob(self, container_client: ContainerClient,
+                             original_filename: str, deadline: Deadline) -> BlobClient:
+        """
+        Pick the EML name a block upload stages its blocks under
+
+        Same as BlobStorageService._free_eml_blob: the first candidate that
+        does not exist yet; nothing is written.
+
+        Args:
+            container_client: Container client for the output container
+            original_filename: Original MSG filename
+            deadline: Deadline supplying the request timeouts
+
+        Returns:
+            Client for the chosen (still nonexistent) blob
+        """
+        for eml_filename in self.eml_names.candidates(original_filename):
+            blob_client = container_client.get_blob_client(eml_filename)
+            if not await blob_client.exists(**deadline.request_options()):
+                return blob_client
+
+        raise no_free_eml_name(original_filename)
+
+    async def _upload_blocks(self, container_client: ContainerClient, original_filename: str,
+                             chunks: Union[Iterable[bytes], AsyncIterable[bytes]],
+                             deadline: Deadline,
+                             tags: Optional[Dict[str, str]] = None) -> BlobClient:
+        """
+        Upload streamed content as a block blob, staging blocks concurrently
+
+        Same strategy as BlobStorageService._upload_blocks: full blocks are
+        staged while the next one is produced, at most upload_max_concurrency
+        at a time, single-block content is sent with one conditional request,
+        and larger content is staged under a free name and created by a
+        block list commit with If-None-Match: *.
+
+        Args:
+            container_client: Container client for the output container
+            original_filename: Original MSG filename
+            chunks: Iterator of content chunks
+            deadline: Deadline for the whole upload
+            tags: Blob index tags, set by the single Put or the block list
+                commit
+
+        Returns:
+            Client for the created blob
+        """
+        blocks = BlockBuffer(self.upload_block_size)
+        pending = set()
+        blob_client = None
+
+        try:
+            async for chunk in self._aiter_chunks(chunks):
+                for block_id, block in blocks.add(chunk):
+                    deadline.check("while uploading EML")
+                    if blob_client is None:
+                        blob_client = await self._free_eml_blob(
+                            container_client, original_filename, deadline
+                        )
+
+                    # Wait for a free slot before staging another block
+                    if len(pending) >= self.upload_max_concurrency:
+                        done, pending = await asyncio.wait(
+                            pending, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in done:
+                            task.result()
+
+                    pending.add(asyncio.ensure_future(blob_client.stage_block(
+                        block_id, block, **deadline.request_options()
+                    )))
+
+            if blob_client is None:
+                # Small output: a single request is cheaper than staging
+                return await self._create_eml_blob(
+                    container_client, original_filename, blocks.rest(), deadline, tags
+                )
+
+            last_block = blocks.last_block()
+            if last_block:
+                pending.add(asyncio.ensure_future(blob_client.stage_block(
+                    *last_block, **deadline.request_options()
+                )))
+
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                for task in done:
+                    task.result()
+
+        except BaseException:
+            # Don't stage further blocks for an upload that won't commit, and
+            # wait for the cancelled requests to end before giving up
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            raise
+
+        # Create the blob only if nobody else has taken the name meanwhile
+        try:
+            await blob_client.commit_block_list(
+                blocks.block_list(),
+                content_settings=self.eml_content_settings,
+                tags=tags,
+                match_condition=MatchConditions.IfMissing,
+                **deadline.request_options()
+            )
+        except (ResourceExistsError, ResourceModifiedError) as e:
+            self.eml_names.remember(blob_client.blob_name)
+            raise BlobStorageError(
+                f"EML name '{blob_client.blob_name}' was taken while its blocks were "
+                f"being staged"
+            ) from e
+
+        self.eml_names.remember(blob_client.blob_name)
+        return blob_client
+
+    def _compress(self, content: Union[bytes, Iterable[bytes], AsyncIterable[bytes]]
+                  ) -> Union[Iterable[bytes], AsyncIterable[bytes]]:
+        """
+        Wrap EML content in the configured compression
+
+        Synchronous sources are compressed inside the iterator, so the work
+        runs on the worker thread that produces each chunk.
+
+        Args:
+            content: EML content as bytes or a (sync or async) chunk iterator
+
+        Returns:
+            Iterator of the same kind over the compressed chunks
+        """
+        if isinstance(content, (bytes, bytearray)):
+            content = [content]
+        if not hasattr(content, '__aiter__'):
+            return compress_chunks(content, self.eml_compression, self.eml_compression_level)
+        return self._acompress(content)
+
+    async def _acompress(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """Compress an async chunk iterator (see _compress)"""
+        compressor = ChunkCompressor(self.eml_compression, self.eml_compression_level)
+        async for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    async def _aiter_chunks(self, chunks: Union[Iterable[bytes], AsyncIterable[bytes]]
+                            ) -> AsyncIterator[bytes]:
+        """
+        Iterate over sync or async chunk sources without blocking the loop
+
+        Synchronous iterators (such as MsgToEmlConverter.convert_stream) do
+        CPU-bound work per chunk, so each chunk is produced on a worker thread.
+
+        Args:
+            chunks: Sync or async iterator of chunks
+
+        Yields:
+            Content chunks
+        """
+        if hasattr(chunks, '__aiter__'):
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        iterator = iter(chunks)
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _move_blob(self, source_container: str, filename: str,
+                         dest_container: str, dest_filename: str, deadline: Deadline) -> None:
+        """
+        Copy a blob to another container, then delete the source
+
+        Args:
+            source_container: Source container name
+            filename: Source blob name
+            dest_container: Destination container name
+            dest_filename: Destination blob name
+            deadline: Deadline for the copy and delete
+        """
+        source_blob_client = self._get_blob_client(
+            source_container, filename
+        )
+        dest_blob_client = self._get_blob_client(
+            dest_container, dest_filename
+        )
+
+        source_etag = await self._copy_blob(source_blob_client, dest_blob_client, deadline)
+
+        await source_blob_client.delete_blob(
+            etag=source_etag,
+            match_condition=MatchConditions.IfNotModified,
+            **deadline.request_options()
+        )
+
+    async def _copy_blob(self, source_blob_client: BlobClient, dest_blob_client: BlobClient,
+                         deadline: Deadline) -> str:
+        """
+        Copy a blob and wait until the copy has completed
+
+        Same strategy as BlobStorageService._copy_blob: synchronous Put Blob
+        From URL for small blobs, otherwise an asynchronous copy polled with
+        exponential backoff and aborted at the deadline.
+
+        Args:
+            source_blob_client: Client for the source blob
+            dest_blob_client: Client for the destination blob
+            deadline: Deadline supplying request timeouts and bounding polling
+
+        Returns:
+            ETag of the source blob that was copied
+
+        Raises:
+            BlobStorageError: If the copy fails, is aborted or times out
+        """
+        properties = await source_blob_client.get_blob_properties(**deadline.request_options())
+        source_etag = properties.etag
+        source_url = authorized_blob_url(source_blob_client, self.blob_service_client.credential)
+
+        if self.use_sync_copy(source_url, properties.size):
+            await dest_blob_client.upload_blob_from_url(
+                source_url,
+                overwrite=True,
+                source_etag=source_etag,
+                source_match_condition=MatchConditions.IfNotModified,
+                **deadline.request_options()
+            )
+            return source_etag
+
+        copy = await dest_blob_client.start_copy_from_url(
+            source_url or source_blob_client.url,
+            source_etag=source_etag,
+            source_match_condition=MatchConditions.IfNotModified,
+            **deadline.request_options()
+        )
+        status = copy.get('copy_status')
+        timeout = self.copy_timeout(deadline)
+
+        for delay in copy_poll_delays(timeout):
+            if status != 'pending':
+                break
+            await asyncio.sleep(delay)
+            status = (await dest_blob_client.get_blob_properties(
+                **deadline.request_options()
+            )).copy.status
+
+        if status == 'pending':
+            try:
+                await dest_blob_client.abort_copy(copy['copy_id'])
+            except Exception:
+                pass
+        check_copy_status(status, dest_blob_client.blob_name, timeout)
+
+        return source_etag
+
+    async def archive_msg(self, source_container: str, filename: str,
+                          archive_container: str, timeout: Optional[float] = None) -> None:
+        """
+        Moves original MSG file to archive container
+
+        Args:
+            source_container: Source container name
+            filename: MSG filename
+            archive_container: Archive container name
+            timeout: Time budget in seconds, passed on as request timeouts
+
+        Raises:
+            BlobStorageError: If archive operation fails
+        """
+        try:
+            await self._move_blob(
+                source_container, filename,
+                archive_container, timestamped_name(filename),
+                Deadline(timeout)
+            )
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to archive MSG file '{filename}' from '{source_container}' "
+                f"to '{archive_container}': {str(e)}"
+            ) from e
+
+    async def move_to_failed(self, source_container: str, filename: str,
+                             failed_container: str) -> None:
+        """
+        Moves failed MSG file to failed-conversion container
+
+        Args:
+            source_container: Source container name
+            filename: MSG filename
+            failed_container: Failed conversion container name
+
+        Raises:
+            BlobStorageError: If move operation fails
+        """
+        try:
+            await self._move_blob(
+                source_container, filename,
+                failed_container, timestamped_name(filename, 'failed_'),
+                Deadline(None)
+            )
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to move MSG file '{filename}' from '{source_container}' "
+                f"to '{failed_container}': {str(e)}"
+            ) from e
+
+    async def upload_and_archive(self, output_container: str, filename: str,
+                                 content: Union[bytes, Iterable[bytes], AsyncIterable[bytes]],
+                                 source_container: str, archive_container: str,
+                                 timeout: Optional[float] = None,
+                                 tags: Optional[Dict[str, str]] = None,
+                                 on_uploaded: Optional[Callable[[str], Awaitable[None]]] = None
+                                 ) -> str:
+        """
+        Uploads the EML and archives the original MSG concurrently
+
+        The archive copy only reads the source MSG, so it is safe to run while
+        the EML is uploading. The source is deleted only after the upload has
+        succeeded and the copy has completed, and only if it is unchanged; if
+        the upload fails, the archive copy is removed again so a retry starts
+        from the same state. If this coroutine is cancelled, both operations
+        are cancelled and awaited before the cancellation propagates.
+
+        Args:
+            output_container: Container for the EML file
+            filename: MSG filename
+            content: EML content, as bytes or a chunk iterator
+            source_container: Container holding the MSG file
+            archive_container: Archive container name
+            timeout: Time budget in seconds, passed on as request timeouts
+            tags: Blob index tags of the EML file
+            on_uploaded: Coroutine function called with the EML URL as soon
+                as the upload has succeeded, before the archive outcome is
+                known (e.g. to checkpoint the upload)
+
+        Returns:
+            Blob URL of the uploaded EML file
+
+        Raises:
+            BlobStorageError: If the upload or the archive operation fails
+            ConversionError: If a streamed EML chunk fails to generate
+            TimeoutError: If the time budget runs out during the upload
+        """
+        deadline = Deadline(timeout)
+        source_blob_client = self._get_blob_client(
+            source_container, filename
+        )
+        archive_blob_client = self._get_blob_client(
+            archive_container, timestamped_name(filename)
+        )
+
+        async def upload() -> str:
+            output_url = await self.upload_eml(
+                output_container, filename, content, deadline.remaining(), tags
+            )
+            if on_uploaded is not None:
+                await on_uploaded(output_url)
+            return output_url
+
+        tasks = [
+            asyncio.ensure_future(upload()),
+            asyncio.ensure_future(
+                self._copy_blob(source_blob_client, archive_blob_client, deadline)
+            )
+        ]
+        try:
+            upload_result, copy_result = await asyncio.gather(*tasks, return_exceptions=True)
+        except BaseException:
+            # Cancelled (e.g. at the trigger's timeout): stop both and wait
+            # for them to end, so no request outlives the invocation
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        if isinstance(upload_result, BaseException):
+            if not isinstance(copy_result, BaseException):
+                # Best-effort rollback of the archive copy
+                try:
+                    await archive_blob_client.delete_blob(**deadline.request_options())
+                except Exception:
+                    pass
+            raise upload_result
+
+        try:
+            if isinstance(copy_result, BaseException):
+                raise copy_result
+
+            # Both succeeded: remove the original, unless it has changed
+            await source_blob_client.delete_blob(
+                etag=copy_result,
+                match_condition=MatchConditions.IfNotModified,
+                **deadline.request_options()
+            )
+
+        except Exception as e:
+            raise BlobStorageError(
+                f"Failed to archive MSG file '{filename}' from '{source_container}' "
+                f"to '{archive_container}': {str(e)}"
+            ) from e
+
+        return upload_result
@@ -0,0 +1,612 @@
+"""Structural checks on, and stream reads from, the OLE/CFB container of MSG files"""
+import struct
+import sys
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+
+# OLE/CFB files start with this signature
+CFB_SIGNATURE = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+
+HEADER_SIZE = 512
+DIRECTORY_ENTRY_SIZE = 128
+
+# Special sector numbers ([MS-CFB] 2.1); regular sectors are below MAXREGSECT
+MAXREGSECT = 0xFFFFFFFA
+FATSECT = 0xFFFFFFFD
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+
+# Directory entry ID marking an absent sibling or child
+NOSTREAM = 0xFFFFFFFF
+
+# Directory entry object types
+STORAGE_OBJECT = 1
+STREAM_OBJECT = 2
+ROOT_STORAGE_OBJECT = 5
+
+# MAPI property streams of an MSG file are named __substg1.0_<tag><type>
+PROPERTY_STREAM_PREFIX = '__substg1.0_'
+
+# Header DIFAT entries; FAT sectors beyond these are listed in DIFAT sectors
+HEADER_DIFAT_ENTRIES = 109
+
+# Directory sectors scanned for a property stream before the file is
+# accepted without one having been seen (large directories list attachment
+# storages first)
+MAX_DIRECTORY_SECTORS_SCANNED = 16
+
+# Header fields from the byte order mark to the DIFAT sector count ([MS-CFB] 2.2)
+_HEADER_FIELDS = struct.Struct('<HHHH6xIIIIIIIII')
+
+# Directory entry fields ([MS-CFB] 2.6.1): name, name length, object type,
+# left sibling, right sibling, child and, after the CLSID, state bits and
+# timestamps, the start sector and stream size
+_DIRECTORY_ENTRY_FIELDS = struct.Struct('<64sHBxIII36xIQ')
+
+# Reads length bytes at an offset of the file
+ReadAt = Callable[[int, int], bytes]
+
+
+class CfbFormatError(Exception):
+    """Exception raised when a file is not a structurally valid MSG container"""
+    pass
+
+
+class CfbHeader:
+    """Fields of a CFB header needed to locate sectors"""
+
+    __slots__ = ('major_version', 'sector_size', 'mini_sector_size', 'num_fat_sectors',
+                 'first_directory_sector', 'mini_stream_cutoff', 'first_mini_fat_sector',
+                 'num_mini_fat_sectors', 'first_difat_sector', 'num_difat_sectors',
+                 'difat', 'sector_count')
+
+    def sector_offset(self, sector: int) -> int:
+        """Return the file offset of a sector (sector 0 follows the header sector)"""
+        return (sector + 1) * self.sector_size
+
+
+def parse_header(header: bytes, file_size: int) -> CfbHeader:
+    """
+    Parse and check the 512-byte CFB header
+
+    Args:
+        header: First 512 bytes of the file (fewer if the file is shorter)
+        file_size: Size of the whole file in bytes
+
+    Returns:
+        Parsed header
+
+    Raises:
+        CfbFormatError: If the signature, versions, sector sizes or sector
+            counts are invalid
+    """
+    if header[:8] != CFB_SIGNATURE:
+        raise CfbFormatError("file header does not match MSG signature")
+    if len(header) < HEADER_SIZE:
+        raise CfbFormatError("file is too small to hold a CFB header")
+
+    (major_version, byte_order, sector_shift, mini_sector_shift,
+     num_directory_sectors, num_fat_sectors, first_directory_sector,
+     _transaction_signature, mini_stream_cutoff, first_mini_fat_sector,
+     num_mini_fat_sectors, first_difat_sector,
+     num_difat_sectors) = _HEADER_FIELDS.unpack_from(header, 0x1A)
+
+    if major_version not in (3, 4):
+        raise CfbFormatError(f"unsupported CFB major version {major_version}")
+    if byte_order != 0xFFFE:
+        raise CfbFormatError(f"invalid CFB byte order mark 0x{byte_order:04X}")
+    if sector_shift not in (9, 12):
+        raise CfbFormatError(f"invalid CFB sector size 2^{sector_shift}")
+    if mini_sector_shift != 6:
+        raise CfbFormatError(f"invalid CFB mini sector size 2^{mini_sector_shift}")
+    if num_fat_sectors == 0:
+        raise CfbFormatError("CFB header declares no FAT sectors")
+
+    cfb = CfbHeader()
+    cfb.major_version = major_version
+    cfb.sector_size = 1 << sector_shift
+    cfb.mini_sector_size = 1 << mini_sector_shift
+    cfb.num_fat_sectors = num_fat_sectors
+    cfb.first_directory_sector = first_directory_sector
+    cfb.mini_stream_cutoff = mini_stream_cutoff
+    cfb.first_mini_fat_sector = first_mini_fat_sector
+    cfb.num_mini_fat_sectors = num_mini_fat_sectors
+    cfb.first_difat_sector = first_difat_sector
+    cfb.num_difat_sectors = num_difat_sectors
+    cfb.difat = struct.unpack_from(f'<{HEADER_DIFAT_ENTRIES}I', header, 0x4C)
+    # Sectors after the header; a partial last sector still counts
+    cfb.sector_count = max(0, -(-file_size // cfb.sector_size) - 1)
+
+    entries_per_sector = cfb.sector_size // 4
+    if num_fat_sectors > cfb.sector_count or \
+            num_fat_sectors > HEADER_DIFAT_ENTRIES + num_difat_sectors * (entries_per_sector - 1):
+        raise CfbFormatError(
+            f"CFB header declares {num_fat_sectors} FAT sectors, more than the file can hold"
+        )
+
+    # The header lists the first FAT sectors, then FREESECT padding
+    listed = min(num_fat_sectors, HEADER_DIFAT_ENTRIES)
+    for index, sector in enumerate(cfb.difat):
+        if index < listed:
+            if sector >= cfb.sector_count:
+                raise CfbFormatError(f"FAT sector {index} points outside the file")
+        elif sector != FREESECT:
+            raise CfbFormatError("CFB header lists more FAT sectors than it declares")
+
+    if first_directory_sector >= cfb.sector_count:
+        raise CfbFormatError("CFB directory starts outside the file")
+    return cfb
+
+
+def check_structure(read_at: ReadAt, file_size: int) -> CfbHeader:
+    """
+    Check that a file is a CFB container holding MAPI property streams
+
+    Reads the header, the FAT sectors covering the FAT sectors themselves
+    and the directory chain, and the first directory sectors: a few KB for
+    typical MSG files. Verifies that every FAT sector the header lists is
+    marked as such in the FAT (those listed in DIFAT sectors, past the
+    first 109, are not read), that the directory chain stays inside the
+    file without loops, that the first directory entry is the root
+    storage, and that a __substg1.0_ property stream exists.
+
+    Args:
+        read_at: Function returning length bytes at an offset of the file
+        file_size: Size of the file in bytes
+
+    Returns:
+        Parsed header
+
+    Raises:
+        CfbFormatError: If the structure is invalid
+    """
+    cfb = parse_header(read_at(0, HEADER_SIZE), file_size)
+    fat = _FatReader(cfb, read_at)
+
+    # FAT sectors must be marked as such in the FAT itself (unless their
+    # entries are in FAT sectors listed outside the header); the entries
+    # are usually all in the first FAT sector
+    for fat_sector in cfb.difat[:min(cfb.num_fat_sectors, HEADER_DIFAT_ENTRIES)]:
+        fat_entry = fat.next_sector(fat_sector)
+        if fat_entry is not None and fat_entry != FATSECT:
+            raise CfbFormatError("CFB FAT does not mark its own sectors")
+
+    scanned = 0
+    for sector_data in _iter_chain(cfb, fat, read_at, cfb.first_directory_sector):
+        for offset in range(0, cfb.sector_size, DIRECTORY_ENTRY_SIZE):
+            entry = sector_data[offset:offset + DIRECTORY_ENTRY_SIZE]
+            object_type = entry[66]
+            if scanned == 0 and offset == 0:
+                if object_type != ROOT_STORAGE_OBJECT:
+                    raise CfbFormatError("first CFB directory entry is not the root storage")
+                continue
+            if object_type == STREAM_OBJECT and \
+                    _entry_name(entry).startswith(PROPERTY_STREAM_PREFIX):
+                return cfb
+
+        scanned += 1
+        if scanned >= MAX_DIRECTORY_SECTORS_SCANNED:
+            # Sane so far; the parser checks the rest of the directory
+            return cfb
+
+    raise CfbFormatError("file contains no MAPI property streams")
+
+
+class _FatReader:
+    """Looks up FAT entries, reading each FAT sector on first use"""
+
+    def __init__(self, cfb: CfbHeader, read_at: ReadAt, follow_difat: bool = False):
+        """
+        Initialize the reader
+
+        Args:
+            cfb: Parsed header
+            read_at: Function returning length bytes at an offset of the file
+            follow_difat: Whether to read DIFAT sectors to find the FAT
+                sectors the header does not list
+        """
+        self._cfb = cfb
+        self._read_at = read_at
+        self._follow_difat = follow_difat
+        self._entries_per_sector = cfb.sector_size // 4
+        self._sectors: Dict[int, array] = {}
+        self._fat_sectors = list(cfb.difat[:min(cfb.num_fat_sectors, HEADER_DIFAT_ENTRIES)])
+        self._next_difat_sector = cfb.first_difat_sector
+        self._difat_sectors_read = 0
+
+    def next_sector(self, sector: int) -> Optional[int]:
+        """
+        Return the FAT entry of a sector
+
+        Returns:
+            Next sector number, a special value, or None if the entry is in
+            a FAT sector listed outside the header (not checked) and DIFAT
+            sectors are not followed
+
+        Raises:
+            CfbFormatError: If the FAT sector holding the entry is missing
+                or truncated
+        """
+        index, position = divmod(sector, self._entries_per_sector)
+        entries = self._sectors.get(index)
+        if entries is None:
+            fat_sector = self._fat_sector(index)
+            if fat_sector is None:
+                if self._follow_difat:
+                    raise CfbFormatError(f"CFB sector 0x{sector:X} is not covered by the FAT")
+                return None
+
+            data = self._read_at(self._cfb.sector_offset(fat_sector), self._cfb.sector_size)
+            if len(data) < self._cfb.sector_size:
+                raise CfbFormatError(f"FAT sector {index} is truncated")
+            entries = array('I', data)
+            if sys.byteorder == 'big':
+                entries.byteswap()
+            self._sectors[index] = entries
+        return entries[position]
+
+    def _fat_sector(self, index: int) -> Optional[int]:
+        """Return the sector number of a FAT sector, reading DIFAT sectors as needed"""
+        while self._follow_difat and index >= len(self._fat_sectors) and \
+                len(self._fat_sectors) < self._cfb.num_fat_sectors and \
+                self._difat_sectors_read < self._cfb.num_difat_sectors:
+            difat_sector = self._next_difat_sector
+            if difat_sector >= self._cfb.sector_count:
+                raise CfbFormatError(f"CFB DIFAT sector 0x{difat_sector:X} is outside the file")
+            data = self._read_at(self._cfb.sector_offset(difat_sector), self._cfb.sector_size)
+            if len(data) < self._cfb.sector_size:
+                raise CfbFormatError(f"CFB DIFAT sector 0x{difat_sector:X} is truncated")
+            entries = struct.unpack(f'<{self._entries_per_sector}I', data)
+            # The last entry of a DIFAT sector links to the next one
+            self._fat_sectors.extend(entries[:-1])
+            self._next_difat_sector = entries[-1]
+            self._difat_sectors_read += 1
+
+        if index >= min(len(self._fat_sectors), self._cfb.num_fat_sectors):
+            return None
+        fat_sector = self._fat_sectors[index]
+        if fat_sector >= self._cfb.sector_count:
+            raise CfbFormatError(f"FAT sector {index} points outside the file")
+        return fat_sector
+
+
+def _iter_chain(cfb: CfbHeader, fat: _FatReader, read_at: ReadAt,
+                start: int) -> Iterator[bytes]:
+    """Yield the sectors of a FAT chain, checking each link"""
+    sector = start
+    visited = set()
+    while sector != ENDOFCHAIN:
+        if sector >= cfb.sector_count or sector > MAXREGSECT:
+            raise CfbFormatError(f"CFB sector chain points to invalid sector 0x{sector:X}")
+        if sector in visited:
+            raise CfbFormatError("CFB sector chain contains a loop")
+        visited.add(sector)
+
+        data = read_at(cfb.sector_offset(sector), cfb.sector_size)
+        if len(data) < cfb.sector_size:
+            raise CfbFormatError("CFB directory sector is truncated")
+        yield data
+
+        sector = fat.next_sector(sector)
+        if sector is None:
+            return
+
+
+def _entry_name(entry: bytes) -> str:
+    """Decode the name of a directory entry"""
+    return _decode_name(entry[:64], struct.unpack_from('<H', entry, 64)[0])
+
+
+def _decode_name(name: bytes, name_length: int) -> str:
+    """Decode a directory entry name field given its length in bytes (with the NUL)"""
+    return name[:max(min(name_length, 64) - 2, 0)].decode('utf-16-le', errors='replace')
+
+
+class DirectoryEntry:
+    """A storage or stream in the directory of a CFB file"""
+
+    __slots__ = ('name', 'object_type', 'left', 'right', 'child', 'start_sector', 'size')
+
+
+class CfbReader:
+    """
+    Reads storages and streams of a CFB file held in memory
+
+    Works on a buffer over the whole file (bytes, or an mmap). Sectors are
+    located through the FAT and sliced from a memoryview, so a stream
+    stored in consecutive sectors is returned as a view without copying;
+    only fragmented streams are joined into new bytes. The FAT and mini FAT
+    are unpacked once, and directory entries are decoded as storages are
+    listed rather than all up front.
+    """
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview]):
+        """
+        Initialize the reader
+
+        Args:
+            buffer: Content of the whole CFB file
+
+        Raises:
+            CfbFormatError: If the header, FAT, directory or mini stream
+                chains are invalid
+        """
+        self._view = memoryview(buffer)
+        self.header = parse_header(bytes(self._view[:HEADER_SIZE]), len(self._view))
+        self._entries: Dict[int, DirectoryEntry] = {}
+        try:
+            self._fat = self._read_fat()
+            self._directory_sectors = self._chain(self._fat, self.header.first_directory_sector)
+            self.root = self.entry(0)
+            if self.root.object_type != ROOT_STORAGE_OBJECT:
+                raise CfbFormatError("first CFB directory entry is not the root storage")
+            self._mini_fat = self._read_table(self._chain(
+                self._fat, self.header.first_mini_fat_sector, self.header.num_mini_fat_sectors
+            ))
+            self._mini_stream_sectors = self._chain(
+                self._fat, self.root.start_sector, self._sectors_for(self.root.size)
+            )
+        except struct.error as e:
+            raise CfbFormatError(f"CFB structure is truncated: {str(e)}") from e
+
+    def entry(self, index: int) -> DirectoryEntry:
+        """
+        Return a directory entry by its ID
+
+        Raises:
+            CfbFormatError: If the ID is outside the directory
+        """
+        entry = self._entries.get(index)
+        if entry is not None:
+            return entry
+
+        sector_index, slot = divmod(index, self.header.sector_size // DIRECTORY_ENTRY_SIZE)
+        if sector_index >= len(self._directory_sectors):
+            raise CfbFormatError(f"CFB directory entry {index} is outside the directory")
+        (name, name_length, object_type, left, right, child, start_sector,
+         size) = _DIRECTORY_ENTRY_FIELDS.unpack_from(
+            self._view,
+            self.header.sector_offset(self._directory_sectors[sector_index])
+            + slot * DIRECTORY_ENTRY_SIZE
+        )
+
+        entry = DirectoryEntry()
+        entry.name = _decode_name(name, name_length)
+        entry.object_type = object_type
+        entry.left = left
+        entry.right = right
+        entry.child = child
+        entry.start_sector = start_sector
+        # Version 3 files may leave garbage in the high half of the size
+        entry.size = size if self.header.major_version == 4 else size & 0xFFFFFFFF
+        self._entries[index] = entry
+        return entry
+
+    def children(self, storage: DirectoryEntry) -> Dict[str, DirectoryEntry]:
+        """
+        List the streams and storages directly inside a storage
+
+        Args:
+            storage: Root or storage entry
+
+        Returns:
+            Entries by lower-case name (CFB names compare case-insensitively)
+
+        Raises:
+            CfbFormatError: If the sibling tree is invalid
+        """
+        found = {}
+        visited = set()
+        pending = [storage.child]
+        while pending:
+            index = pending.pop()
+            if index == NOSTREAM:
+                continue
+            if index in visited:
+                raise CfbFormatError("CFB directory tree contains a loop")
+            visited.add(index)
+
+            entry = self.entry(index)
+            if entry.object_type in (STORAGE_OBJECT, STREAM_OBJECT):
+                found[entry.name.lower()] = entry
+            pending.append(entry.left)
+            pending.append(entry.right)
+        return found
+
+    def read_stream(self, entry: DirectoryEntry) -> Union[memoryview, bytes]:
+        """
+        Return the content of a stream
+
+        Streams below the mini stream cutoff are read from the mini stream
+        in 64-byte mini sectors, larger ones from regular sectors.
+
+        Args:
+            entry: Stream entry
+
+        Returns:
+            A view of the buffer if the stream is stored contiguously,
+            otherwise a joined copy
+
+        Raises:
+            CfbFormatError: If the stream's chain is invalid or truncated
+        """
+        if entry.size < self.header.mini_stream_cutoff:
+            unit = self.header.mini_sector_size
+            offsets = [self._mini_sector_offset(sector) for sector in self._chain(
+                self._mini_fat, entry.start_sector, -(-entry.size // unit)
+            )]
+        else:
+            unit = self.header.sector_size
+            offsets = [self.header.sector_offset(sector) for sector in self._chain(
+                self._fat, entry.start_sector, self._sectors_for(entry.size)
+            )]
+
+        # Coalesce runs of adjacent sectors into single slices
+        pieces = []
+        remaining = entry.size
+        index = 0
+        while remaining > 0:
+            start = offsets[index]
+            end = start + unit
+            index += 1
+            while index < len(offsets) and offsets[index] == end:
+                end += unit
+                index += 1
+            length = min(end - start, remaining)
+            piece = self._view[start:start + length]
+            if len(piece) < length:
+                raise CfbFormatError(f"CFB stream '{entry.name}' is truncated")
+            pieces.append(piece)
+            remaining -= len(piece)
+
+        if len(pieces) == 1:
+            return pieces[0]
+        return b''.join(pieces)
+
+    def close(self) -> None:
+        """Release the view of the buffer"""
+        self._view.release()
+
+    def _sectors_for(self, size: int) -> int:
+        """Return the number of regular sectors holding size bytes"""
+        return -(-size // self.header.sector_size)
+
+    def _read_fat(self) -> array:
+        """Unpack the whole FAT, following DIFAT sectors beyond the header's 109"""
+        cfb = self.header
+        fat_sectors = list(cfb.difat[:min(cfb.num_fat_sectors, HEADER_DIFAT_ENTRIES)])
+        difat_sector = cfb.first_difat_sector
+        for _ in range(cfb.num_difat_sectors):
+            if len(fat_sectors) >= cfb.num_fat_sectors:
+                break
+            entries = self._read_table([difat_sector])
+            # The last entry of a DIFAT sector links to the next one
+            fat_sectors.extend(entries[:-1])
+            difat_sector = entries[-1]
+        if len(fat_sectors) < cfb.num_fat_sectors:
+            raise CfbFormatError("CFB DIFAT lists fewer FAT sectors than declared")
+        return self._read_table(fat_sectors[:cfb.num_fat_sectors])
+
+    def _read_table(self, sectors: Sequence[int]) -> array:
+        """Unpack the 32-bit entries of FAT, mini FAT or DIFAT sectors"""
+        entries = array('I')
+        for sector in sectors:
+            if sector >= self.header.sector_count:
+                raise CfbFormatError(f"CFB table sector 0x{sector:X} is outside the file")
+            offset = self.header.sector_offset(sector)
+            data = self._view[offset:offset + self.header.sector_size]
+            if len(data) < self.header.sector_size:
+                raise CfbFormatError(f"CFB table sector 0x{sector:X} is truncated")
+            entries.frombytes(data)
+        if sys.byteorder == 'big':
+            entries.byteswap()
+        return entries
+
+    def _chain(self, table: Sequence[int], start: int, count: Optional[int] = None) -> List[int]:
+        """
+        Follow a sector chain through the FAT or mini FAT
+
+        Args:
+            table: FAT or mini FAT entries
+            start: First sector of the chain
+            count: Sectors to follow (default: up to ENDOFCHAIN)
+
+        Returns:
+            Sector numbers of the chain
+
+        Raises:
+            CfbFormatError: If the chain ends early, leaves the table or loops
+        """
+        sectors = []
+        sector = start
+        while len(sectors) < count if count is not None else sector != ENDOFCHAIN:
+            if sector >= len(table):
+                raise CfbFormatError(f"CFB sector chain points to invalid sector 0x{sector:X}")
+            if len(sectors) >= len(table):
+                raise CfbFormatError("CFB sector chain contains a loop")
+            sectors.append(sector)
+            sector = table[sector]
+        return sectors
+
+    def _mini_sector_offset(self, mini_sector: int) -> int:
+        """Return the file offset of a mini sector of the mini stream"""
+        index, offset = divmod(mini_sector * self.header.mini_sector_size, self.header.sector_size)
+        if index >= len(self._mini_stream_sectors):
+            raise CfbFormatError(f"CFB mini sector 0x{mini_sector:X} is outside the mini stream")
+        return self.header.sector_offset(self._mini_stream_sectors[index]) + offset
+
+
+class CfbStreamReader:
+    """
+    Reads regular streams of a CFB file in chunks, through a read_at function
+
+    For payloads too large to hold in memory twice: each chunk is one read
+    of a run of consecutive sectors, and the FAT and DIFAT sectors are read
+    as the chain reaches them. Streams below the mini stream cutoff live in
+    the mini stream and are left to other readers.
+    """
+
+    def __init__(self, read_at: ReadAt, file_size: int):
+        """
+        Initialize the reader
+
+        Args:
+            read_at: Function returning length bytes at an offset of the file
+            file_size: Size of the file in bytes
+
+        Raises:
+            CfbFormatError: If the header is invalid
+        """
+        self._read_at = read_at
+        self.header = parse_header(read_at(0, HEADER_SIZE), file_size)
+        self._fat = _FatReader(self.header, read_at, follow_difat=True)
+
+    def iter_stream(self, start_sector: int, size: int, chunk_size: int) -> Iterator[bytes]:
+        """
+        Yield the content of a regular stream in chunks
+
+        Args:
+            start_sector: First sector of the stream
+            size: Stream size in bytes (at least the mini stream cutoff)
+            chunk_size: Largest chunk to read at once (rounded down to whole
+                sectors, at least one sector)
+
+        Yields:
+            Consecutive pieces of the stream
+
+        Raises:
+            CfbFormatError: If the stream's chain is invalid or truncated
+        """
+        cfb = self.header
+        run_offset = run_length = 0
+        remaining = size
+        sector = start_sector
+        # Only as many sectors as the size needs are followed, so a looping
+        # chain cannot make this run on
+        while remaining > 0:
+            if sector >= cfb.sector_count or sector > MAXREGSECT:
+                raise CfbFormatError(f"CFB sector chain points to invalid sector 0x{sector:X}")
+
+            offset = cfb.sector_offset(sector)
+            length = min(cfb.sector_size, remaining)
+            if run_length and offset == run_offset + run_length and \
+                    run_length + length <= chunk_size:
+                run_length += length
+            else:
+                if run_length:
+                    yield self._read(run_offset, run_length)
+                run_offset, run_length = offset, length
+
+            remaining -= length
+            if remaining > 0:
+                sector = self._fat.next_sector(sector)
+        if run_length:
+            yield self._read(run_offset, run_length)
+
+    def _read(self, offset: int, length: int) -> bytes:
+        """Read a run of sectors, which must be complete"""
+        data = self._read_at(offset, length)
+        if len(data) < length:
+            raise CfbFormatError("CFB stream is truncated")
+        return data
@@ -0,0 +1,200 @@
+"""Content-addressed cache of converted MSG files for duplicate detection"""
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Optional
+from .local_store import SqliteLruTable
+from .msg_converter import MsgSource
+from .storage_transport import blob_client_for_url
+
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobServiceClient
+
+
+# Blob index tag holding the SHA-256 of the MSG an EML was converted from
+DIGEST_TAG = 'msg_sha256'
+
+# Defaults for the local on-disk cache
+DEFAULT_LOCAL_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'msg_dedup.sqlite3')
+DEFAULT_LOCAL_CACHE_MAX_MB = 64
+
+# Bytes read per step when hashing a stream
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_msg_digest(msg_data: MsgSource) -> str:
+    """
+    Compute the SHA-256 digest used as the cache key for an MSG file
+
+    Args:
+        msg_data: Raw MSG file content, or a seekable stream over it (the
+            position is restored afterwards)
+
+    Returns:
+        Hex-encoded SHA-256 digest
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(msg_data, (bytes, bytearray, memoryview)):
+        digest.update(msg_data)
+        return digest.hexdigest()
+
+    position = msg_data.tell()
+    try:
+        msg_data.seek(0)
+        while True:
+            chunk = msg_data.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    finally:
+        msg_data.seek(position)
+
+    return digest.hexdigest()
+
+
+class DedupCache(ABC):
+    """
+    Maps MSG content digests to the URL of an EML already converted from them
+
+    Entries are hints: callers must handle the referenced EML having been
+    deleted since, and should then call forget().
+    """
+
+    @abstractmethod
+    def lookup(self, digest: str) -> Optional[str]:
+        """
+        Find the EML converted from an MSG with this digest
+
+        Args:
+            digest: MSG content digest
+
+        Returns:
+            EML blob URL, or None if unknown
+        """
+
+    @abstractmethod
+    def record(self, digest: str, eml_url: str) -> None:
+        """
+        Record the EML converted from an MSG with this digest
+
+        Args:
+            digest: MSG content digest
+            eml_url: URL of the uploaded EML blob
+        """
+
+    @abstractmethod
+    def forget(self, digest: str) -> None:
+        """
+        Remove a stale entry
+
+        Args:
+            digest: MSG content digest
+        """
+
+
+class LocalDedupCache(DedupCache):
+    """
+    Dedup cache stored in a local SQLite file
+
+    The entries (digests and EML URLs) are bounded by max_mb megabytes;
+    least recently used entries are evicted first.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_mb: Optional[float] = None):
+        """
+        Initialize the cache
+
+        Args:
+            path: SQLite file path (default from env or msg_dedup.sqlite3 in
+                the temp directory)
+            max_mb: Maximum size of the entries in MB (default from env or 64)
+        """
+        max_mb = max_mb or float(os.environ.get('DEDUP_CACHE_MAX_MB', DEFAULT_LOCAL_CACHE_MAX_MB))
+        self._table = SqliteLruTable(
+            path or os.environ.get('DEDUP_CACHE_PATH', DEFAULT_LOCAL_CACHE_PATH),
+            None, table='entries', key_column='digest', value_columns=('eml_url',),
+            time_column='last_used', max_bytes=int(max_mb * 1024 * 1024)
+        )
+
+    def lookup(self, digest: str) -> Optional[str]:
+        row = self._table.get(digest, touch=True)
+        return None if row is None else row[0]
+
+    def record(self, digest: str, eml_url: str) -> None:
+        self._table.put(digest, (eml_url,))
+
+    def forget(self, digest: str) -> None:
+        self._table.delete(digest)
+
+
+class BlobIndexDedupCache(DedupCache):
+    """
+    Dedup cache backed by blob index tags on the EML blobs themselves
+
+    Each converted EML is tagged with the digest of its source MSG, and
+    lookups use Find Blobs by Tags on the output container. Nothing is
+    stored outside the storage account, so the cache is shared by all
+    instances and disappears together with the EML files it points to.
+    """
+
+    def __init__(self, blob_service_client: 'BlobServiceClient', container: str):
+        """
+        Initialize the cache
+
+        Args:
+            blob_service_client: Service client for the storage account
+            container: Output container holding the tagged EML blobs
+        """
+        self.blob_service_client = blob_service_client
+        self.container = container
+
+    def lookup(self, digest: str) -> Optional[str]:
+        container_client = self.blob_service_client.get_container_client(self.container)
+        for blob in container_client.find_blobs_by_tags(f"\"{DIGEST_TAG}\" = '{digest}'"):
+            return container_client.get_blob_client(blob.name).url
+        return None
+
+    def record(self, digest: str, eml_url: str) -> None:
+        blob_client = blob_client_for_url(self.blob_service_client, eml_url)
+        tags = blob_client.get_blob_tags()
+        tags[DIGEST_TAG] = digest
+        blob_client.set_blob_tags(tags)
+
+    def forget(self, digest: str) -> None:
+        from azure.core.exceptions import ResourceNotFoundError
+        container_client = self.blob_service_client.get_container_client(self.container)
+        for blob in container_client.find_blobs_by_tags(f"\"{DIGEST_TAG}\" = '{digest}'"):
+            # Untag the EML the copy failed from, so later duplicates are
+            # converted instead of retrying the same copy
+            blob_client = container_client.get_blob_client(blob.name)
+            try:
+                tags = blob_client.get_blob_tags()
+                if tags.pop(DIGEST_TAG, None) == digest:
+                    blob_client.set_blob_tags(tags)
+            except ResourceNotFoundError:
+                # Deleted: the index drops its tags shortly
+                pass
+
+
+def create_dedup_cache(blob_service_client: 'BlobServiceClient',
+                       output_container: str) -> Optional[DedupCache]:
+    """
+    Create the dedup cache selected by the DEDUP_CACHE setting
+
+    Args:
+        blob_service_client: Service client for the storage account
+        output_container: Container the EML files are written to
+
+    Returns:
+        'local' -> LocalDedupCache, 'blob-index' -> BlobIndexDedupCache,
+        anything else (default 'none') -> None
+    """
+    mode = os.environ.get('DEDUP_CACHE', 'none').lower()
+
+    if mode == 'local':
+        return LocalDedupCache()
+    if mode == 'blob-index':
+        return BlobIndexDedupCache(blob_service_client, output_container)
+    return None
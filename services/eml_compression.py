@@ -0,0 +1,107 @@
+"""Streaming compression of EML output for storage with a Content-Encoding"""
+import os
+import zlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: only needed for EML_COMPRESSION=br
+    brotli = None
+
+
+# Content type of the EML blobs; the Content-Encoding names the codec
+EML_CONTENT_TYPE = 'message/rfc822'
+
+# Codecs by Content-Encoding name, with their default levels. gzip and
+# deflate take zlib levels 1-9, br takes Brotli qualities 0-11.
+COMPRESSION_CODECS = {
+    'gzip': 6,
+    'deflate': 6,
+    'br': 5,
+}
+
+# zlib window bits: 31 writes a gzip container, 15 a zlib (RFC 1950) stream,
+# which is what HTTP clients expect for Content-Encoding: deflate
+_ZLIB_WBITS = {'gzip': 31, 'deflate': 15}
+
+
+def compression_settings(codec: Optional[str] = None,
+                         level: Optional[int] = None) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Resolve the EML compression codec and level
+
+    Args:
+        codec: Content-Encoding name (default from env EML_COMPRESSION or
+            'none'); 'none' or an empty value disables compression
+        level: Compression level (default from env EML_COMPRESSION_LEVEL or
+            the codec's default)
+
+    Returns:
+        Tuple of (codec, level), or (None, None) when disabled
+
+    Raises:
+        ValueError: If the codec is unknown or its library is not installed
+    """
+    codec = (codec or os.environ.get('EML_COMPRESSION', 'none')).strip().lower()
+    if codec in ('', 'none'):
+        return None, None
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(
+            f"Unknown EML compression '{codec}' (expected none, "
+            f"{', '.join(COMPRESSION_CODECS)})"
+        )
+    if codec == 'br' and brotli is None:
+        raise ValueError("EML compression 'br' requires the brotli package")
+
+    if level is None:
+        level = int(os.environ.get('EML_COMPRESSION_LEVEL', COMPRESSION_CODECS[codec]))
+    return codec, level
+
+
+class ChunkCompressor:
+    """Compresses a stream chunk by chunk, holding only the codec's window"""
+
+    def __init__(self, codec: str, level: int):
+        """
+        Initialize the compressor
+
+        Args:
+            codec: Content-Encoding name (gzip, deflate or br)
+            level: Compression level for the codec
+        """
+        if codec == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+            self._compress = self._compressor.process
+            self._flush = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, _ZLIB_WBITS[codec])
+            self._compress = self._compressor.compress
+            self._flush = self._compressor.flush
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Compress one chunk; may return b'' while the codec buffers input"""
+        return self._compress(chunk)
+
+    def flush(self) -> bytes:
+        """Finish the stream and return the remaining compressed bytes"""
+        return self._flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], codec: str, level: int) -> Iterator[bytes]:
+    """
+    Compress a stream of chunks as they are produced
+
+    Args:
+        chunks: Uncompressed chunks (e.g. from MsgToEmlConverter.convert_stream)
+        codec: Content-Encoding name (gzip, deflate or br)
+        level: Compression level for the codec
+
+    Yields:
+        Non-empty compressed chunks, ending with the codec's trailer
+    """
+    compressor = ChunkCompressor(codec, level)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
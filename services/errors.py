@@ -0,0 +1,26 @@
+"""Conversion and storage exceptions, importable without their heavy dependencies
+
+function_app catches these in every trigger, and the storage services raise
+ConversionError for failed EML chunks; defining them here lets each module
+import them without importing extract_msg or azure.storage.blob.
+"""
+
+
+class ConversionError(Exception):
+    """Exception raised when MSG to EML conversion fails"""
+    pass
+
+
+class ValidationError(Exception):
+    """Exception raised when MSG file validation fails"""
+    pass
+
+
+class ParseTimeoutError(TimeoutError):
+    """Exception raised when an isolated parse is killed at its deadline"""
+    pass
+
+
+class BlobStorageError(Exception):
+    """Exception raised when blob storage operations fail"""
+    pass
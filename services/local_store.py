@@ -0,0 +1,168 @@
+"""Size-bounded tables in a local SQLite file, shared by the local caches"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+
+class SqliteLruTable:
+    """
+    Rows keyed by a text column in a local SQLite file, with LRU eviction
+
+    Each row has a key, value columns, a timestamp column and its size (the
+    UTF-8 length of its key and values). The timestamp is set when a row is
+    written and, for lookups with touch=True, when it is read; once the
+    table holds more than max_entries rows, or its rows more than max_bytes
+    bytes, the ones with the oldest timestamps are evicted. The total size
+    is kept by triggers in a one-row {table}_usage table, so it stays right
+    when several processes share the file. Safe to use from several threads.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int], table: str, key_column: str,
+                 value_columns: Sequence[str], time_column: str,
+                 max_bytes: Optional[int] = None):
+        """
+        Open the file, creating the table if needed
+
+        Args:
+            path: SQLite file path (its directory is created if missing)
+            max_entries: Maximum number of rows (None for no limit)
+            table: Table name
+            key_column: Name of the primary key column
+            value_columns: Names of the value columns
+            time_column: Name of the timestamp column
+            max_bytes: Maximum total size of the rows (None for no limit)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._table = table
+        self._key_column = key_column
+        self._value_columns = tuple(value_columns)
+        self._time_column = time_column
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        columns = ", ".join(f"{column} TEXT NOT NULL" for column in self._value_columns)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(f"""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key_column} TEXT PRIMARY KEY, {columns}, {time_column} REAL NOT NULL,
+                size INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS {table}_{time_column} ON {table} ({time_column});
+            CREATE TABLE IF NOT EXISTS {table}_usage (bytes INTEGER NOT NULL);
+            INSERT INTO {table}_usage (bytes)
+                SELECT COALESCE(SUM(size), 0) FROM {table}
+                WHERE NOT EXISTS (SELECT 1 FROM {table}_usage);
+            CREATE TRIGGER IF NOT EXISTS {table}_inserted AFTER INSERT ON {table} BEGIN
+                UPDATE {table}_usage SET bytes = bytes + NEW.size; END;
+            CREATE TRIGGER IF NOT EXISTS {table}_updated AFTER UPDATE OF size ON {table} BEGIN
+                UPDATE {table}_usage SET bytes = bytes + NEW.size - OLD.size; END;
+            CREATE TRIGGER IF NOT EXISTS {table}_deleted AFTER DELETE ON {table} BEGIN
+                UPDATE {table}_usage SET bytes = bytes - OLD.size; END;
+            COMMIT;
+        """)
+
+    def get(self, key: str, touch: bool = False) -> Optional[Tuple]:
+        """
+        Read a row
+
+        Args:
+            key: Row key
+            touch: Update the row's timestamp, so it is evicted last
+
+        Returns:
+            The value columns followed by the timestamp, or None if absent
+        """
+        columns = ", ".join(self._value_columns + (self._time_column,))
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {columns} FROM {self._table} WHERE {self._key_column} = ?", (key,)
+            ).fetchone()
+            if row is not None and touch:
+                self._connection.execute(
+                    f"UPDATE {self._table} SET {self._time_column} = ? "
+                    f"WHERE {self._key_column} = ?",
+                    (time.time(), key)
+                )
+                self._connection.commit()
+        return row
+
+    def put(self, key: str, values: Sequence[str]) -> None:
+        """
+        Write a row, evicting the oldest rows beyond max_entries or max_bytes
+
+        Args:
+            key: Row key
+            values: Values of the value columns, in order
+        """
+        columns = (self._key_column,) + self._value_columns + (self._time_column, 'size')
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        size = sum(len(value.encode('utf-8')) for value in (key, *values))
+        with self._lock:
+            # An upsert, not INSERT OR REPLACE: rows replaced by the latter
+            # do not fire the delete trigger
+            self._connection.execute(
+                f"INSERT INTO {self._table} ({', '.join(columns)}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({self._key_column}) DO UPDATE SET {updates}",
+                (key, *values, time.time(), size)
+            )
+            if self.max_entries is not None:
+                self._connection.execute(
+                    f"DELETE FROM {self._table} WHERE {self._key_column} IN ("
+                    f"SELECT {self._key_column} FROM {self._table} "
+                    f"ORDER BY {self._time_column} DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            if self.max_bytes is not None:
+                self._evict_to_max_bytes()
+            self._connection.commit()
+
+    def total_bytes(self) -> int:
+        """Return the total size of the rows"""
+        with self._lock:
+            return self._total_bytes()
+
+    def delete(self, key: str) -> None:
+        """
+        Remove a row, if present
+
+        Args:
+            key: Row key
+        """
+        with self._lock:
+            self._connection.execute(
+                f"DELETE FROM {self._table} WHERE {self._key_column} = ?", (key,)
+            )
+            self._connection.commit()
+
+    def _total_bytes(self) -> int:
+        return self._connection.execute(
+            f"SELECT bytes FROM {self._table}_usage"
+        ).fetchone()[0]
+
+    def _evict_to_max_bytes(self) -> None:
+        """Delete the oldest rows until the rest fit in max_bytes"""
+        excess = self._total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+
+        evicted = []
+        rows = self._connection.execute(
+            f"SELECT {self._key_column}, size FROM {self._table} ORDER BY {self._time_column}"
+        )
+        for key, size in rows:
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        rows.close()
+        self._connection.executemany(
+            f"DELETE FROM {self._table} WHERE {self._key_column} = ?", evicted
+        )
@@ -1,74 +1,216 @@
 """MSG to EML conversion service"""
+import binascii
 import io
+import mimetypes
+import multiprocessing
 import os
-from typing import Optional
-from extract_msg import Message
+import re
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from email.utils import encode_rfc2231
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+from models.conversion_models import ConversionJob, ConversionResult
+from .cfb import CfbFormatError, CfbHeader, check_structure
+from .errors import BlobStorageError, ConversionError, ParseTimeoutError, ValidationError
 
+if TYPE_CHECKING:
+    # extract_msg is imported on first parse (see msg_parser), not at startup
+    from extract_msg import Message
+    from .msg_reader import NativeMessage
 
-class ConversionError(Exception):
-    """Exception raised when MSG to EML conversion fails"""
-    pass
 
+# Number of characters (or bytes, for binary bodies) encoded per chunk by the
+# streaming EML writer
+EML_CHUNK_SIZE = 64 * 1024
 
-class ValidationError(Exception):
-    """Exception raised when MSG file validation fails"""
-    pass
+# Raw bytes base64-encoded per chunk for attachments. A multiple of 57 so each
+# chunk encodes to whole 76-character lines (RFC 2045 line length).
+BASE64_LINE_BYTES = 57
+BASE64_CHUNK_SIZE = BASE64_LINE_BYTES * 1152
+
+# MSG input: raw bytes, or a seekable binary stream (e.g. BlobRangeReader)
+MsgSource = Union[bytes, BinaryIO]
+
+# CFB stream names of the message bodies. The plain text body is a string
+# stream (PT_UNICODE or PT_STRING8 suffix).
+PLAIN_BODY_STREAM = '__substg1.0_1000'
+HTML_BODY_STREAM = '__substg1.0_10130102'
+
+# Leading bytes of a decompressed RTF body searched for the \fromhtml1 or
+# \fromtext control word that marks encapsulated HTML or plain text
+RTF_HEADER_SCAN_BYTES = 4096
+
+# Header lines are folded to this length where possible. RFC 5322 asks for
+# 78 characters; lines holding encoded words are limited to 76 (RFC 2047).
+HEADER_LINE_LENGTH = 76
+
+# UTF-8 bytes per RFC 2047 encoded word: "=?utf-8?b?" + 60 base64 characters
+# + "?=" stays within the 75-character limit
+ENCODED_WORD_BYTES = 45
+
+# Control characters (except tab) are replaced with spaces in header values
+_HEADER_CONTROL_PATTERN = re.compile(r'[\x00-\x08\x0a-\x1f]')
+
+# One address of a ';' (Outlook) or ',' (RFC 5322) separated list; quoted
+# names and angle-bracketed addresses may contain the separator
+_ADDRESS_PATTERNS = {
+    separator: re.compile(rf'(?:"(?:[^"\\]|\\.)*"|<[^>]*>|[^{separator}"<]+)+')
+    for separator in ';,'
+}
+_QUOTED_PAIR_PATTERN = re.compile(r'\\(.)')
+_PHRASE_SPECIALS_PATTERN = re.compile(r'[()<>@,;:\\".\[\]]')
+# ASCII text a reader would decode as an RFC 2047 encoded word; such values
+# are encoded themselves so they come back literally
+_ENCODED_WORD_PATTERN = re.compile(r'=\?[^?\s]*\?[^?\s]*\?[^?\s]*\?=')
+
+
+class ValidatedMsg:
+    """
+    MSG input that has passed validate_msg_format
+    
+    Passing this token instead of the raw input to the convert methods
+    skips the validation they would otherwise repeat.
+    """
+    
+    __slots__ = ('source', 'size', 'cfb_header')
+    
+    def __init__(self, source: MsgSource, size: int, cfb_header: CfbHeader):
+        """
+        Initialize the token
+        
+        Args:
+            source: The validated MSG content or stream
+            size: Size of the MSG file in bytes
+            cfb_header: Parsed CFB header of the file
+        """
+        self.source = source
+        self.size = size
+        self.cfb_header = cfb_header
+    
+    def with_source(self, source: MsgSource) -> 'ValidatedMsg':
+        """Return a token for another copy of the same file"""
+        return ValidatedMsg(source, self.size, self.cfb_header)
 
 
 class MsgToEmlConverter:
     """Converts Microsoft Outlook MSG files to standard EML format"""
     
-    def __init__(self, max_file_size_mb: Optional[int] = None):
+    def __init__(self, max_file_size_mb: Optional[int] = None,
+                 native_reader: Optional[bool] = None):
         """
         Initialize the converter
         
         Args:
             max_file_size_mb: Maximum file size in MB (default from env or 25 MB)
+            native_reader: Read messages extract_msg is not needed for with
+                the native CFB reader (default from env NATIVE_MSG_READER
+                or True)
         """
         self.max_file_size_mb = max_file_size_mb or int(
             os.environ.get('MAX_FILE_SIZE_MB', '25')
         )
+        if native_reader is None:
+            native_reader = os.environ.get('NATIVE_MSG_READER', 'true').lower() == 'true'
+        self.native_reader = native_reader
     
-    def validate_msg_format(self, msg_data: bytes) -> None:
+    def validate_msg_format(self, msg_data: Union[MsgSource, ValidatedMsg]) -> ValidatedMsg:
         """
         Validates that input data is a valid MSG file
         
+        Besides the size limit, the OLE/CFB structure is checked from the
+        first few KB (header, sector sizes, FAT and directory chain, and the
+        presence of MAPI property streams), so garbage and truncated files
+        are rejected before any parsing.
+        
         Args:
-            msg_data: Raw MSG file content
+            msg_data: Raw MSG file content, or a seekable stream over it
+                (only the size, header and directory start are read; the
+                position is restored). A ValidatedMsg is returned as-is.
+            
+        Returns:
+            ValidatedMsg token to pass to the convert methods
             
         Raises:
             ValidationError: If validation fails with descriptive error message
         """
+        if isinstance(msg_data, ValidatedMsg):
+            return msg_data
+        
+        if isinstance(msg_data, (bytes, bytearray, memoryview)):
+            file_size = len(msg_data)
+            read_at = lambda offset, length: bytes(msg_data[offset:offset + length])
+        else:
+            position = msg_data.tell()
+            file_size = msg_data.seek(0, io.SEEK_END)
+            read_at = lambda offset, length: self._read_stream_at(msg_data, offset, length)
+        
+        try:
+            return ValidatedMsg(msg_data, file_size, self._check_msg(read_at, file_size))
+        finally:
+            if not isinstance(msg_data, (bytes, bytearray, memoryview)):
+                msg_data.seek(position)
+    
+    def _check_msg(self, read_at, file_size: int) -> CfbHeader:
+        """
+        Check the size and CFB structure of an MSG file
+        
+        Args:
+            read_at: Function returning length bytes at an offset of the file
+            file_size: Size of the file in bytes
+            
+        Returns:
+            Parsed CFB header
+            
+        Raises:
+            ValidationError: If the file is empty, too large or malformed
+        """
         # Check if data is empty
-        if not msg_data:
+        if not file_size:
             raise ValidationError("MSG file is empty")
         
         # Validate file size
-        file_size_mb = len(msg_data) / (1024 * 1024)
+        file_size_mb = file_size / (1024 * 1024)
         if file_size_mb > self.max_file_size_mb:
             raise ValidationError(
                 f"File size {file_size_mb:.2f} MB exceeds maximum allowed "
                 f"size of {self.max_file_size_mb} MB"
             )
         
-        # Check MSG file header (MSG files are OLE/CFB format)
-        # OLE files start with signature: D0 CF 11 E0 A1 B1 1A E1
-        msg_signature = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
-        
-        if len(msg_data) < 8:
+        if file_size < 8:
             raise ValidationError("File is too small to be a valid MSG file")
         
-        if not msg_data[:8] == msg_signature:
-            raise ValidationError(
-                "Invalid MSG file format: file header does not match MSG signature"
-            )
-
-    def convert(self, msg_data: bytes) -> bytes:
+        # Check the OLE/CFB container (signature D0 CF 11 E0 A1 B1 1A E1)
+        try:
+            return check_structure(read_at, file_size)
+        except CfbFormatError as e:
+            raise ValidationError(f"Invalid MSG file format: {str(e)}") from e
+    
+    def _read_stream_at(self, stream: BinaryIO, offset: int, length: int) -> bytes:
+        """
+        Read bytes at an offset of a seekable stream
+        
+        Args:
+            stream: Seekable binary stream
+            offset: Position to read from
+            length: Number of bytes to read
+            
+        Returns:
+            Up to length bytes
+        """
+        stream.seek(offset)
+        return stream.read(length)
+    
+    def convert(self, msg_data: Union[MsgSource, ValidatedMsg]) -> bytes:
         """
         Converts MSG file bytes to EML format
         
         Args:
-            msg_data: Raw MSG file content
+            msg_data: Raw MSG file content, a seekable stream over it, or
+                the ValidatedMsg returned by validate_msg_format
             
         Returns:
             EML file content as bytes
@@ -77,31 +219,253 @@ class MsgToEmlConverter:
             ConversionError: If conversion fails
             ValidationError: If MSG file is invalid
         """
-        # Validate MSG format first
-        self.validate_msg_format(msg_data)
+        return b"".join(self.convert_stream(msg_data))
+    
+    def convert_stream(self, msg_data: Union[MsgSource, ValidatedMsg]) -> Iterator[bytes]:
+        """
+        Converts MSG file bytes to EML format, yielding encoded chunks
+        
+        The MSG file is validated and parsed before this method returns, so
+        format and parse errors surface immediately. The EML output itself is
+        generated lazily as the returned iterator is consumed, which keeps
+        peak memory independent of the message body size.
+        
+        Args:
+            msg_data: Raw MSG file content, or a seekable stream over it,
+                which the parser then reads from directly. Validation is
+                skipped for a ValidatedMsg from validate_msg_format.
+            
+        Returns:
+            Iterator over UTF-8 encoded EML chunks
+            
+        Raises:
+            ConversionError: If parsing fails, or (during iteration) if EML
+                generation fails
+            ValidationError: If MSG file is invalid
+            BlobStorageError: If reading a stream input fails
+        """
+        # Validate MSG format first (a no-op for a ValidatedMsg)
+        msg_data = self.validate_msg_format(msg_data).source
         
         try:
-            # Create a BytesIO object from the MSG data
-            msg_stream = io.BytesIO(msg_data)
+            # Parse the MSG file
+            msg = self._parse_message(msg_data)
             
-            # Parse the MSG file using extract_msg
-            msg = Message(msg_stream)
+        except Exception as e:
+            _raise_storage_failure(e)
+            raise ConversionError(f"Failed to convert MSG to EML: {str(e)}") from e
+        
+        return self._stream_eml(msg)
+    
+    def convert_isolated(self, msg_data: Union[MsgSource, ValidatedMsg],
+                         timeout: Optional[float]) -> Iterator[bytes]:
+        """
+        Converts an MSG file in a child process that is killed at the deadline
+        
+        extract_msg can hang or spin on malformed files, and a thread running
+        it cannot be stopped. Here the whole conversion runs in a separate
+        process that writes the EML to a temporary file; if it is still
+        running when the timeout expires it is killed, so a pathological
+        file costs at most the timeout instead of pinning the worker.
+        
+        The child is started from a fork server (see _child_context), never
+        forked from the calling process: a fork taken while another thread
+        holds a lock, such as an import lock held by the warm-up, would leave
+        the child deadlocked. The input is sent to the child, so streams
+        (e.g. BlobRangeReader) are read into memory first.
+        
+        Args:
+            msg_data: Raw MSG file content, a seekable stream over it, or
+                the ValidatedMsg returned by validate_msg_format (the child
+                then skips validation)
+            timeout: Seconds the conversion may take (None for no limit)
             
-            # Generate EML format output
-            eml_content = self._generate_eml(msg)
+        Returns:
+            Iterator over the EML chunks, read from the temporary file (which
+            is removed once the iterator is exhausted or closed)
             
-            # Close the message to free resources
-            msg.close()
+        Raises:
+            ConversionError: If conversion fails or the child process dies
+            ValidationError: If MSG file is invalid
+            ParseTimeoutError: If the conversion did not finish within timeout
+        """
+        context = _child_context()
+        source = msg_data.source if isinstance(msg_data, ValidatedMsg) else msg_data
+        if not isinstance(source, (bytes, bytearray)):
+            if isinstance(source, memoryview):
+                source = bytes(source)
+            else:
+                source.seek(0)
+                source = source.read()
+            msg_data = (msg_data.with_source(source)
+                        if isinstance(msg_data, ValidatedMsg) else source)
+        
+        fd, output_path = tempfile.mkstemp(suffix='.eml')
+        os.close(fd)
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_run_isolated_conversion,
+            args=(self.max_file_size_mb, msg_data, output_path, sender, self.native_reader),
+            daemon=True
+        )
+        
+        try:
+            process.start()
+            sender.close()
+            process.join(timeout)
             
-            return eml_content
+            if process.is_alive():
+                process.kill()
+                process.join()
+                raise ParseTimeoutError(
+                    f"MSG conversion did not finish within {timeout:.2f}s and was stopped"
+                )
             
-        except ValidationError:
-            # Re-raise validation errors as-is
+            try:
+                error = receiver.recv() if receiver.poll() else None
+            except EOFError:
+                # The child closed the pipe without reporting an error
+                error = None
+            if error is not None:
+                error_type, error_message = error
+                if error_type == ValidationError.__name__:
+                    raise ValidationError(error_message)
+                raise ConversionError(error_message)
+            
+            if process.exitcode != 0:
+                raise ConversionError(
+                    f"Failed to convert MSG to EML: conversion process exited "
+                    f"with code {process.exitcode}"
+                )
+            
+            return _TempFileChunks(output_path)
+            
+        except BaseException:
+            os.remove(output_path)
+            raise
+        finally:
+            receiver.close()
+    
+    def convert_many(self, jobs: Iterable[ConversionJob],
+                     max_workers: Optional[int] = None,
+                     max_in_flight: Optional[int] = None,
+                     connection_string: Optional[str] = None) -> Iterator[ConversionResult]:
+        """
+        Converts many MSG files in parallel across a process pool
+        
+        Parsing is CPU-bound and holds the GIL, so jobs are fanned out to
+        worker processes, started like isolated conversions (see
+        _child_context) so that a caller running other threads, such as
+        the Functions host, is never forked. Workers read their input and
+        write their output themselves; only job descriptions (with their
+        input_data, if given inline) and results cross process boundaries.
+        At most max_in_flight jobs are submitted at any time, which bounds
+        memory regardless of how many jobs are supplied, and results are
+        yielded in the order the jobs were given.
+        
+        Args:
+            jobs: Conversion jobs (may be a lazy iterator)
+            max_workers: Number of worker processes (default: CPU count)
+            max_in_flight: Maximum number of submitted, unreported jobs
+                (default: twice the number of workers)
+            connection_string: Azure Storage connection string for jobs that
+                use blob containers (default from env)
+            
+        Yields:
+            One ConversionResult per job, in job order
+        """
+        max_workers = max_workers or os.cpu_count() or 1
+        max_in_flight = max(max_in_flight or 2 * max_workers, 1)
+        
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=_child_context(),
+            initializer=_init_batch_worker,
+            initargs=(self.max_file_size_mb, connection_string, self.native_reader)
+        ) as executor:
+            in_flight = deque()
+            
+            for job in jobs:
+                if len(in_flight) >= max_in_flight:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(_run_batch_job, job))
+            
+            while in_flight:
+                yield in_flight.popleft().result()
+    
+    def _parse_message(self, msg_data: MsgSource) -> Union['Message', 'NativeMessage']:
+        """
+        Open an MSG file without decoding anything the EML may not need
+        
+        Messages without attachments whose strings are Unicode and whose
+        body is stored as plain text or HTML are read by the native CFB
+        reader (msg_reader), which decodes only the properties the EML is
+        written from, straight from the buffer. Other messages, and stream
+        inputs that are not files, are opened with extract_msg.
+        
+        extract_msg reads the body while opening a message, de-encapsulating
+        the RTF body when there is no plain text stream, and reads every
+        attachment payload when the attachment list is built. Here RTF
+        de-encapsulation is left to _read_bodies, which runs it only when no
+        HTML body is stored, and data attachments read their
+        payload in chunks as it is written.
+        
+        Args:
+            msg_data: Raw MSG file content, or a seekable stream over it
+            
+        Returns:
+            Parsed NativeMessage or extract_msg Message object
+        """
+        if self.native_reader:
+            from .msg_reader import UnsupportedMsgError, open_native_message
+            try:
+                return open_native_message(msg_data)
+            except UnsupportedMsgError:
+                pass
+        
+        # Wrap raw MSG data in a BytesIO object; streams are used as-is
+        if isinstance(msg_data, (bytes, bytearray, memoryview)):
+            msg_stream = io.BytesIO(msg_data)
+        else:
+            msg_stream = msg_data
+            msg_stream.seek(0)
+        
+        from .msg_parser import open_message
+        return open_message(msg_stream)
+    
+    def preload(self) -> None:
+        """
+        Import the MSG parser ahead of the first conversion
+        
+        extract_msg and its dependencies take a noticeable share of a cold
+        start to import; calling this from a warm-up hook moves that cost
+        off the first request. Isolated parses start from a fork
+        server that has imported it as well (see _child_context).
+        """
+        from . import msg_parser, msg_reader  # noqa: F401
+    
+    def _stream_eml(self, msg: 'Message') -> Iterator[bytes]:
+        """
+        Yield EML chunks for a parsed message and close it when done
+        
+        Args:
+            msg: Parsed Message object (owned by this generator)
+            
+        Yields:
+            UTF-8 encoded EML chunks
+        """
+        try:
+            yield from self._iter_eml(msg)
+        except ConversionError:
             raise
         except Exception as e:
-            raise ConversionError(f"Failed to convert MSG to EML: {str(e)}") from e
+            _raise_storage_failure(e)
+            raise ConversionError(f"Failed to generate EML format: {str(e)}") from e
+        finally:
+            # Close the message to free resources
+            msg.close()
     
-    def _generate_eml(self, msg: Message) -> bytes:
+    def _generate_eml(self, msg: 'Message') -> bytes:
         """
         Generate EML format from parsed MSG data
         
@@ -112,82 +476,723 @@ class MsgToEmlConverter:
             EML content as bytes
         """
         try:
-            # Build EML headers
-            eml_lines = []
-            
-            # Add standard email headers
-            if msg.sender:
-                eml_lines.append(f"From: {self._encode_header(msg.sender)}")
-            
-            if msg.to:
-                eml_lines.append(f"To: {self._encode_header(msg.to)}")
-            
-            if msg.cc:
-                eml_lines.append(f"Cc: {self._encode_header(msg.cc)}")
-            
-            if msg.subject:
-                eml_lines.append(f"Subject: {self._encode_header(msg.subject)}")
-            
-            if msg.date:
-                eml_lines.append(f"Date: {msg.date}")
-            
-            # Add message ID if available
-            if hasattr(msg, 'messageId') and msg.messageId:
-                eml_lines.append(f"Message-ID: {msg.messageId}")
-            
-            # Add MIME version
-            eml_lines.append("MIME-Version: 1.0")
-            
-            # Determine content type
-            if msg.htmlBody:
-                eml_lines.append("Content-Type: text/html; charset=utf-8")
-                eml_lines.append("Content-Transfer-Encoding: 8bit")
-                eml_lines.append("")  # Empty line before body
-                eml_lines.append(msg.htmlBody)
-            elif msg.body:
-                eml_lines.append("Content-Type: text/plain; charset=utf-8")
-                eml_lines.append("Content-Transfer-Encoding: 8bit")
-                eml_lines.append("")  # Empty line before body
-                eml_lines.append(msg.body)
-            else:
-                eml_lines.append("Content-Type: text/plain; charset=utf-8")
-                eml_lines.append("")
-                eml_lines.append("")
+            return b"".join(self._iter_eml(msg))
+        except Exception as e:
+            _raise_storage_failure(e)
+            raise ConversionError(f"Failed to generate EML format: {str(e)}") from e
+    
+    def _iter_eml(self, msg: 'Message') -> Iterator[bytes]:
+        """
+        Generate EML format from parsed MSG data as a sequence of chunks
+        
+        Messages with attachments are written as multipart/mixed; messages
+        with both a plain text and an HTML body carry both as
+        multipart/alternative. Headers are emitted as single chunks, bodies
+        in slices of EML_CHUNK_SIZE and attachments in base64 chunks of
+        BASE64_CHUNK_SIZE, so no full encoded copy of any part is built.
+        
+        Args:
+            msg: Parsed Message object
             
-            # Join all lines with CRLF (standard for email)
-            eml_content = "\r\n".join(eml_lines)
+        Yields:
+            UTF-8 encoded EML chunks
+        """
+        # Build EML headers
+        eml_lines = []
+        
+        # Add standard email headers
+        if msg.sender:
+            eml_lines.append(self._encode_header('From', msg.sender, addresses=True))
+        
+        if msg.to:
+            eml_lines.append(self._encode_header('To', msg.to, addresses=True))
+        
+        if msg.cc:
+            eml_lines.append(self._encode_header('Cc', msg.cc, addresses=True))
+        
+        if msg.subject:
+            eml_lines.append(self._encode_header('Subject', msg.subject))
+        
+        if msg.date:
+            eml_lines.append(f"Date: {msg.date}")
+        
+        # Add message ID if available
+        if hasattr(msg, 'messageId') and msg.messageId:
+            eml_lines.append(f"Message-ID: {msg.messageId}")
+        
+        # Add MIME version
+        eml_lines.append("MIME-Version: 1.0")
+        
+        attachments = [
+            attachment for attachment in (msg.attachments or [])
+            if self._is_supported_attachment(attachment)
+        ]
+        
+        if not attachments:
+            yield from self._iter_body_entity(msg, eml_lines)
+            return
+        
+        boundary = self._make_boundary()
+        eml_lines.append(f'Content-Type: multipart/mixed; boundary="{boundary}"')
+        yield from self._iter_entity(eml_lines, ())
+        yield b"This is a multi-part message in MIME format.\r\n"
+        
+        yield f"\r\n--{boundary}\r\n".encode('ascii')
+        yield from self._iter_body_entity(msg, [])
+        
+        for index, attachment in enumerate(attachments):
+            yield f"\r\n--{boundary}\r\n".encode('ascii')
+            yield from self._iter_attachment_entity(attachment, index)
+        
+        yield f"\r\n--{boundary}--\r\n".encode('ascii')
+    
+    def _iter_body_entity(self, msg: 'Message', headers: List[str]) -> Iterator[bytes]:
+        """
+        Generate the body entity: plain text, HTML, or multipart/alternative
+        
+        Args:
+            msg: Parsed Message object
+            headers: Header lines to emit ahead of the body's own headers
             
-            # Encode to bytes using UTF-8
-            return eml_content.encode('utf-8', errors='replace')
+        Yields:
+            UTF-8 encoded EML chunks
+        """
+        plain_body, html_body, rtf_body = self._read_bodies(msg)
+        
+        if plain_body and html_body:
+            boundary = self._make_boundary()
+            headers.append(f'Content-Type: multipart/alternative; boundary="{boundary}"')
+            yield from self._iter_entity(headers, ())
             
-        except Exception as e:
-            raise ConversionError(f"Failed to generate EML format: {str(e)}") from e
+            yield f"--{boundary}\r\n".encode('ascii')
+            yield from self._iter_entity(
+                ["Content-Type: text/plain; charset=utf-8",
+                 "Content-Transfer-Encoding: 8bit"],
+                self._iter_body_chunks(plain_body)
+            )
+            yield f"\r\n--{boundary}\r\n".encode('ascii')
+            yield from self._iter_entity(
+                ["Content-Type: text/html; charset=utf-8",
+                 "Content-Transfer-Encoding: 8bit"],
+                self._iter_body_chunks(html_body)
+            )
+            yield f"\r\n--{boundary}--\r\n".encode('ascii')
+        elif html_body:
+            headers.append("Content-Type: text/html; charset=utf-8")
+            headers.append("Content-Transfer-Encoding: 8bit")
+            yield from self._iter_entity(headers, self._iter_body_chunks(html_body))
+        elif plain_body:
+            headers.append("Content-Type: text/plain; charset=utf-8")
+            headers.append("Content-Transfer-Encoding: 8bit")
+            yield from self._iter_entity(headers, self._iter_body_chunks(plain_body))
+        elif rtf_body:
+            headers.append("Content-Type: text/rtf")
+            headers.append("Content-Transfer-Encoding: 8bit")
+            yield from self._iter_entity(headers, self._iter_body_chunks(rtf_body))
+        else:
+            headers.append("Content-Type: text/plain; charset=utf-8")
+            yield from self._iter_entity(headers, ())
+    
+    def _read_bodies(self, msg: 'Message') -> Tuple[Optional[str], Optional[Union[str, bytes]],
+                                                  Optional[bytes]]:
+        """
+        Read the message bodies that are stored, decoding only what is emitted
+        
+        The CFB directory is checked for the plain text and HTML streams
+        first; they are emitted as stored, and no body is synthesized from
+        another. Without an HTML stream, the RTF body is read: Outlook often
+        stores a plain text body next to RTF that encapsulates the HTML one
+        (\\fromhtml1), and that HTML is extracted and emitted with the plain
+        text. With neither plain text nor HTML, encapsulated text is also
+        extracted, and RTF that encapsulates nothing is returned as-is rather
+        than run through the de-encapsulator.
+        
+        Args:
+            msg: 'Message' opened by _parse_message
+            
+        Returns:
+            Tuple of (plain text body, HTML body, RTF body); at most the RTF
+            body or the other two are set
+        """
+        plain_body = msg.body if msg.sExists(PLAIN_BODY_STREAM) else None
+        html_body = msg.getStream(HTML_BODY_STREAM) if msg.exists(HTML_BODY_STREAM) else None
+        if html_body:
+            return plain_body, html_body, None
+        
+        rtf_body = msg.rtfBody
+        if not rtf_body:
+            return plain_body, None, None
+        
+        header = rtf_body[:RTF_HEADER_SCAN_BYTES]
+        if b'\\fromhtml' in header or (not plain_body and b'\\fromtext' in header):
+            deencapsulated = msg.deencapsulatedRtf
+            if deencapsulated is not None:
+                if deencapsulated.content_type == 'html':
+                    return plain_body, deencapsulated.html, None
+                if not plain_body:
+                    return deencapsulated.text, None, None
+        
+        if plain_body:
+            return plain_body, None, None
+        return None, None, rtf_body
     
-    def _encode_header(self, header_value: str) -> str:
+    def _iter_attachment_entity(self, attachment, index: int) -> Iterator[bytes]:
         """
-        Encode header value, handling special characters
+        Generate a MIME entity for a single attachment
+        
+        Embedded MSG attachments are written as message/rfc822 parts
+        containing their own converted EML; all other attachments are
+        base64-encoded.
         
         Args:
+            attachment: extract_msg attachment object
+            index: Position of the attachment, used for fallback naming
+            
+        Yields:
+            UTF-8 encoded EML chunks
+        """
+        # Data attachments opened by msg_parser read their payload in chunks
+        iter_data = getattr(attachment, 'iter_data', None)
+        data = None if iter_data else attachment.data
+        filename = (
+            getattr(attachment, 'longFilename', None)
+            or getattr(attachment, 'shortFilename', None)
+            or getattr(attachment, 'name', None)
+            or f"attachment{index + 1}"
+        )
+        
+        if iter_data is None and not isinstance(data, (bytes, bytearray)):
+            # Embedded message: convert it recursively
+            yield from self._iter_entity(
+                ["Content-Type: message/rfc822",
+                 f"Content-Disposition: attachment; {self._encode_param('filename', filename + '.eml')}"],
+                self._iter_eml(data)
+            )
+            return
+        
+        mime_type = (
+            getattr(attachment, 'mimetype', None)
+            or mimetypes.guess_type(filename)[0]
+            or 'application/octet-stream'
+        )
+        content_id = getattr(attachment, 'contentId', None)
+        disposition = 'inline' if content_id and getattr(attachment, 'hidden', False) else 'attachment'
+        
+        headers = [
+            f"Content-Type: {mime_type}; {self._encode_param('name', filename)}",
+            "Content-Transfer-Encoding: base64",
+            f"Content-Disposition: {disposition}; {self._encode_param('filename', filename)}",
+        ]
+        if content_id:
+            headers.append(f"Content-ID: <{content_id.strip('<>')}>")
+        
+        content = iter_data(BASE64_CHUNK_SIZE) if iter_data else [data]
+        yield from self._iter_entity(headers, self._iter_base64(content))
+    
+    def _is_supported_attachment(self, attachment) -> bool:
+        """
+        Check whether an attachment carries content that can be written
+        
+        Args:
+            attachment: extract_msg attachment object
+            
+        Returns:
+            True for binary attachments and embedded email messages
+        """
+        from extract_msg.enums import AttachmentType
+        if attachment.type == AttachmentType.DATA:
+            # Don't read the payload just to check its type
+            return True
+        
+        data = attachment.data
+        return isinstance(data, (bytes, bytearray)) or hasattr(data, 'htmlBody')
+    
+    def _iter_entity(self, headers: List[str], content: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Generate a MIME entity from header lines and encoded content chunks
+        
+        Args:
+            headers: Header lines (without line endings)
+            content: Encoded body chunks
+            
+        Yields:
+            The header block followed by the content chunks
+        """
+        # Headers end with an empty line before the body (CRLF is standard
+        # for email)
+        yield "".join(f"{line}\r\n" for line in headers).encode('utf-8', errors='replace') + b"\r\n"
+        yield from content
+    
+    def _iter_base64(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Base64-encode binary data in fixed-size chunks
+        
+        Args:
+            chunks: Raw attachment content, in pieces of any size
+            
+        Yields:
+            Base64 chunks made of CRLF-terminated 76-character lines
+        """
+        line_length = BASE64_LINE_BYTES // 3 * 4
+        # Bytes left over from the previous piece, encoded with the next one
+        # so that lines stay BASE64_LINE_BYTES long
+        pending = b''
+        for chunk in chunks:
+            view = memoryview(pending + chunk if pending else chunk)
+            end = len(view) - len(view) % BASE64_CHUNK_SIZE
+            for start in range(0, end, BASE64_CHUNK_SIZE):
+                yield self._encode_base64_lines(view[start:start + BASE64_CHUNK_SIZE],
+                                                line_length)
+            pending = bytes(view[end:])
+        if pending:
+            yield self._encode_base64_lines(pending, line_length)
+    
+    def _encode_base64_lines(self, data: bytes, line_length: int) -> bytes:
+        """Base64-encode data as CRLF-terminated lines of line_length characters"""
+        encoded = binascii.b2a_base64(data, newline=False)
+        return b"\r\n".join([
+            encoded[offset:offset + line_length]
+            for offset in range(0, len(encoded), line_length)
+        ]) + b"\r\n"
+    
+    def _make_boundary(self) -> str:
+        """
+        Generate a MIME boundary that cannot occur in encoded content
+        
+        Returns:
+            Boundary string
+        """
+        return f"----=_Part_{uuid.uuid4().hex}"
+    
+    def _encode_param(self, name: str, value: str) -> str:
+        """
+        Format a MIME header parameter, using RFC 2231 for non-ASCII values
+        
+        Args:
+            name: Parameter name
+            value: Raw parameter value
+            
+        Returns:
+            Parameter string such as 'filename="report.pdf"'
+        """
+        value = self._sanitize_header(value)
+        if value.isascii():
+            escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+            return f'{name}="{escaped}"'
+        return f"{name}*={encode_rfc2231(value, 'utf-8')}"
+    
+    def _iter_body_chunks(self, body: Union[str, bytes]) -> Iterator[bytes]:
+        """
+        Encode a message body in fixed-size slices
+        
+        Args:
+            body: Body text, or already-encoded body bytes (extract_msg
+                returns the HTML body as bytes)
+            
+        Yields:
+            UTF-8 encoded body chunks
+        """
+        if isinstance(body, str):
+            for start in range(0, len(body), EML_CHUNK_SIZE):
+                yield body[start:start + EML_CHUNK_SIZE].encode('utf-8', errors='replace')
+        else:
+            view = memoryview(body)
+            for start in range(0, len(view), EML_CHUNK_SIZE):
+                yield bytes(view[start:start + EML_CHUNK_SIZE])
+    
+    def _encode_header(self, name: str, header_value: str, addresses: bool = False) -> str:
+        """
+        Format a header line, RFC 2047 encoding non-ASCII text and folding
+        long values
+        
+        Args:
+            name: Header name (e.g. 'Subject')
             header_value: Raw header value
+            addresses: Whether the value is an address list (From, To, Cc);
+                only display names are encoded, and lines are folded between
+                addresses
             
         Returns:
-            Encoded header value safe for EML format
+            Header line, folded with CRLF + space where longer than
+            HEADER_LINE_LENGTH
+        """
+        value = self._sanitize_header(header_value)
+        
+        if addresses:
+            tokens = self._address_tokens(value)
+        elif value.isascii() and not _ENCODED_WORD_PATTERN.search(value):
+            if len(name) + 2 + len(value) <= HEADER_LINE_LENGTH:
+                return f"{name}: {value}"
+            tokens = value.split(' ')
+        else:
+            # The first word fills the rest of the "Name: " line
+            tokens = self._encoded_words(value, len(name) + 2)
+        
+        return self._fold_header(f"{name}:", tokens)
+    
+    def _sanitize_header(self, header_value: str) -> str:
+        """
+        Replace control characters (except tab) in a header value with spaces
+        
+        Args:
+            header_value: Raw header value
+            
+        Returns:
+            Header value without line breaks or other control characters
         """
         if not header_value:
             return ""
+        return _HEADER_CONTROL_PATTERN.sub(' ', header_value)
+    
+    def _address_tokens(self, value: str) -> List[str]:
+        """
+        Split an address list into foldable tokens
         
-        # Replace any problematic characters
-        # Remove or replace control characters except tab
-        encoded = ''.join(
-            char if (ord(char) >= 32 or char == '\t') else ' '
-            for char in header_value
-        )
+        Outlook separates recipients with ';'; they are written with ',' as
+        RFC 5322 requires. Non-ASCII display names, and ASCII ones that look
+        like encoded words, become encoded words; other ASCII names containing
+        specials are quoted. A bare address is kept as is (non-ASCII ones as
+        UTF-8, RFC 6532), since encoding an addr-spec would break it.
+        
+        Args:
+            value: Sanitized address list
+            
+        Returns:
+            Tokens to be joined with single spaces; each address but the last
+            ends with ','
+        """
+        pattern = _ADDRESS_PATTERNS[';' if ';' in value else ',']
+        tokens = []
+        for match in pattern.finditer(value):
+            address = match.group().strip()
+            if not address:
+                continue
+            if tokens:
+                tokens[-1] += ','
+            
+            bracket = address.rfind('<') if address.endswith('>') else -1
+            if bracket < 0 and '@' in address:
+                tokens.append(address)
+                continue
+            
+            name = address[:bracket].rstrip() if bracket >= 0 else address
+            if address.isascii() and not _ENCODED_WORD_PATTERN.search(name):
+                if bracket > 0 and name and name[0] != '"' and _PHRASE_SPECIALS_PATTERN.search(name):
+                    escaped = name.replace('\\', '\\\\').replace('"', '\\"')
+                    address = f'"{escaped}" {address[bracket:]}'
+                tokens.append(address)
+                continue
+            
+            if len(name) >= 2 and name[0] == name[-1] == '"':
+                name = _QUOTED_PAIR_PATTERN.sub(r'\1', name[1:-1])
+            if name:
+                tokens.extend(self._encoded_words(name))
+            if bracket >= 0:
+                tokens.append(address[bracket:])
+        return tokens
+    
+    def _encoded_words(self, text: str, offset: int = 1) -> List[str]:
+        """
+        Encode text as RFC 2047 encoded words
+        
+        Args:
+            text: Text to encode
+            offset: Characters already on the line of the first word
+            
+        Returns:
+            Base64 ("b") encoded words of at most 75 characters, each holding
+            whole UTF-8 characters
+        """
+        data = text.encode('utf-8', errors='replace')
+        # Bytes that fit into the first word's line, or a full word if too few
+        first_bytes = (HEADER_LINE_LENGTH - offset - 12) // 4 * 3
+        word_bytes = first_bytes if first_bytes >= 6 else ENCODED_WORD_BYTES
+        if len(data) <= word_bytes:
+            return [f"=?utf-8?b?{binascii.b2a_base64(data, newline=False).decode('ascii')}?="]
+        
+        words = []
+        start = 0
+        while start < len(data):
+            end = min(start + word_bytes, len(data))
+            # Don't split a multi-byte character across words
+            while end < len(data) and data[end] & 0xC0 == 0x80:
+                end -= 1
+            encoded = binascii.b2a_base64(data[start:end], newline=False).decode('ascii')
+            words.append(f"=?utf-8?b?{encoded}?=")
+            start = end
+            word_bytes = ENCODED_WORD_BYTES
+        return words
+    
+    def _fold_header(self, prefix: str, tokens: List[str]) -> str:
+        """
+        Join header tokens with spaces, folding before a token that would
+        make the line longer than HEADER_LINE_LENGTH
+        
+        Args:
+            prefix: Header name with colon
+            tokens: Tokens that must not be broken
+            
+        Returns:
+            Header line, possibly spanning several CRLF-joined lines
+        """
+        parts = [prefix]
+        line_length = len(prefix)
+        can_fold = False
+        for token in tokens:
+            # A continuation line must not consist of whitespace only
+            if can_fold and token and line_length + 1 + len(token) > HEADER_LINE_LENGTH:
+                parts.append("\r\n ")
+                line_length = 1
+            else:
+                parts.append(" ")
+                line_length += 1
+            parts.append(token)
+            line_length += len(token)
+            can_fold = True
+        return "".join(parts)
+
+
+# Modules imported once by the fork server that isolated conversions and
+# WarmWorkerPool workers are started from, so that each child starts with
+# the parser already loaded
+WARM_MODULES = ['services.msg_converter', 'services.msg_parser', 'services.msg_reader']
+
+
+def _raise_storage_failure(error: BaseException) -> None:
+    """
+    Re-raise the BlobStorageError an exception was caused by, if any
+    
+    A stream input (e.g. BlobRangeReader) whose read fails mid-parse raises
+    BlobStorageError, possibly wrapped by the parser. That is a storage
+    failure for the caller to retry, not a fault of the file, so it is not
+    reported as a ConversionError.
+    
+    Args:
+        error: Exception raised while parsing or generating the EML
+    """
+    while error is not None:
+        if isinstance(error, BlobStorageError):
+            raise error
+        error = error.__cause__ or error.__context__
+
+
+def _child_context():
+    """
+    Return the multiprocessing context conversion children are started with
+    
+    A fork server forks children from a single-threaded process that has
+    the parser loaded, which is both fast and safe to use from a process
+    running other threads. Platforms without one spawn children, which
+    import the parser themselves.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(WARM_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+# Per-process state for convert_many workers
+_batch_converter: Optional[MsgToEmlConverter] = None
+_batch_blob_service = None
+_batch_connection_string: Optional[str] = None
+
+
+def _init_batch_worker(max_file_size_mb: int, connection_string: Optional[str],
+                       native_reader: bool = True) -> None:
+    """
+    Initialize a convert_many (or WarmWorkerPool) worker process
+    
+    The MSG parser is imported here, so that the first job does not pay
+    for it.
+    
+    Args:
+        max_file_size_mb: Maximum file size in MB for the worker's converter
+        connection_string: Azure Storage connection string, if any
+        native_reader: Whether the worker's converter uses the native reader
+    """
+    global _batch_converter, _batch_connection_string
+    _batch_converter = MsgToEmlConverter(max_file_size_mb, native_reader)
+    _batch_connection_string = connection_string
+    _batch_converter.preload()
+
+
+def _get_batch_blob_service():
+    """
+    Return the worker's BlobStorageService, creating it on first use
+    
+    Returns:
+        BlobStorageService instance
+    """
+    global _batch_blob_service
+    if _batch_blob_service is None:
+        # Imported here: blob_storage depends on this module
+        from .blob_storage import BlobStorageService
+        _batch_blob_service = BlobStorageService(_batch_connection_string)
+    return _batch_blob_service
+
+
+def _run_batch_job(job: ConversionJob) -> ConversionResult:
+    """
+    Run a single conversion job inside a convert_many worker
+    
+    Args:
+        job: Conversion job
+        
+    Returns:
+        ConversionResult describing the outcome (errors are captured, not raised)
+    """
+    start_time = time.time()
+    input_size = 0
+    
+    try:
+        converter = _batch_converter or MsgToEmlConverter()
+        
+        # Open the input
+        if job.input_path:
+            input_size = os.path.getsize(job.input_path)
+            msg_data = open(job.input_path, 'rb')
+        elif job.input_container:
+            msg_data = _get_batch_blob_service().open_blob_reader(
+                job.input_container, job.filename
+            )
+            input_size = msg_data.size
+        elif job.input_data is not None:
+            input_size = len(job.input_data)
+            msg_data = io.BytesIO(job.input_data)
+        else:
+            raise ValueError(f"Conversion job for '{job.filename}' has no input")
         
-        # Ensure proper encoding for non-ASCII characters
         try:
-            # Try to encode as ASCII first
-            encoded.encode('ascii')
-            return encoded
-        except UnicodeEncodeError:
-            # If non-ASCII characters present, they'll be handled by UTF-8 encoding
-            return encoded
+            chunks = _CountingIterator(converter.convert_stream(msg_data))
+            
+            # Write the output
+            if job.output_path:
+                output_location = _write_eml_file(job.output_path, chunks)
+            elif job.output_container:
+                output_location = _get_batch_blob_service().upload_eml(
+                    job.output_container, job.filename, chunks
+                )
+            else:
+                raise ValueError(f"Conversion job for '{job.filename}' has no output")
+        finally:
+            msg_data.close()
+        
+        return ConversionResult(
+            success=True,
+            filename=job.filename,
+            input_size_bytes=input_size,
+            output_size_bytes=chunks.byte_count,
+            duration_seconds=time.time() - start_time,
+            output_blob_url=output_location,
+            error_message=None,
+            timestamp=datetime.utcnow()
+        )
+        
+    except Exception as e:
+        return ConversionResult(
+            success=False,
+            filename=job.filename,
+            input_size_bytes=input_size,
+            output_size_bytes=None,
+            duration_seconds=time.time() - start_time,
+            output_blob_url=None,
+            error_message=f"{type(e).__name__}: {str(e)}",
+            timestamp=datetime.utcnow()
+        )
+
+
+def _run_isolated_conversion(max_file_size_mb: int, msg_data: Union[bytes, ValidatedMsg],
+                             output_path: str, connection, native_reader: bool = True) -> None:
+    """
+    Convert one MSG file to output_path inside a convert_isolated child
+    
+    Args:
+        max_file_size_mb: Maximum file size in MB for the converter
+        msg_data: Raw MSG file content, or a ValidatedMsg wrapping it
+        output_path: File to write the EML to
+        connection: Pipe end for reporting an error as (type name, message)
+        native_reader: Whether the child's converter uses the native reader
+    """
+    try:
+        converter = MsgToEmlConverter(max_file_size_mb, native_reader)
+        _write_eml_file(output_path, converter.convert_stream(msg_data))
+    except Exception as e:
+        connection.send((type(e).__name__, str(e)))
+    finally:
+        connection.close()
+
+
+def _write_eml_file(output_path: str, chunks: Iterable[bytes]) -> str:
+    """
+    Write EML chunks to a local file, replacing it only once complete
+    
+    Args:
+        output_path: Destination file path
+        chunks: EML chunks
+        
+    Returns:
+        Destination file path
+    """
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    temp_path = f"{output_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temp_path, 'wb') as output_file:
+            for chunk in chunks:
+                output_file.write(chunk)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    return output_path
+
+
+class _CountingIterator:
+    """Iterator wrapper that counts the bytes passing through it"""
+    
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self.byte_count = 0
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> bytes:
+        chunk = next(self._chunks)
+        self.byte_count += len(chunk)
+        return chunk
+
+
+class _TempFileChunks:
+    """Iterator over a temporary file in EML_CHUNK_SIZE chunks that owns the file
+    
+    The file is deleted once the iterator is exhausted, closed or garbage
+    collected, including when it is dropped without ever being read.
+    """
+    
+    def __init__(self, path: str):
+        self._path = path
+        self._file = open(path, 'rb')
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> bytes:
+        chunk = self._file.read(EML_CHUNK_SIZE) if not self._file.closed else b""
+        if not chunk:
+            self.close()
+            raise StopIteration
+        return chunk
+    
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._path)
+    
+    def __del__(self):
+        self.close()
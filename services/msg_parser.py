@@ -0,0 +1,143 @@
+"""extract_msg setup that opens MSG files without decoding unused content
+
+Kept apart from msg_converter so that importing the converter does not
+import extract_msg and its dependency tree; this module is imported on the
+first parse, or ahead of it by MsgToEmlConverter.preload().
+"""
+import io
+from typing import BinaryIO, Iterator, Optional
+from extract_msg import Message
+from extract_msg.attachments import Attachment, initStandardAttachment
+from extract_msg.attachments.attachment_base import AttachmentBase
+from extract_msg.enums import PropertiesType
+from extract_msg.properties import PropertiesStore
+
+from .cfb import CfbStreamReader
+
+
+# CFB stream names of attachment payloads and attachment properties
+ATTACHMENT_DATA_STREAM = '__substg1.0_37010102'
+ATTACHMENT_PROPERTIES_STREAM = '__properties_version1.0'
+
+
+def open_message(msg_stream: BinaryIO) -> Message:
+    """
+    Open an MSG file with lazy RTF de-encapsulation and attachment reads
+    
+    Args:
+        msg_stream: Seekable stream positioned at the start of the MSG file
+        
+    Returns:
+        Parsed Message object
+    """
+    payloads = _PayloadReader(msg_stream)
+    return Message(
+        msg_stream,
+        deencapsulationFunc=_skip_rtf_deencapsulation,
+        initAttachment=lambda msg, dir_: _init_lazy_attachment(msg, dir_, payloads)
+    )
+
+
+def _skip_rtf_deencapsulation(rtf_body: bytes, body_type) -> None:
+    """
+    deencapsulationFunc for extract_msg that leaves the RTF body alone
+    
+    Installed so that opening a message does not de-encapsulate its RTF
+    body; MsgToEmlConverter._read_bodies decides whether that is needed.
+    
+    Args:
+        rtf_body: Decompressed RTF body
+        body_type: Requested body type (extract_msg DeencapType)
+        
+    Returns:
+        None (nothing de-encapsulated)
+    """
+    return None
+
+
+class _PayloadReader:
+    """Chunked reader over the MSG stream, shared by a message's attachments
+    
+    The CfbStreamReader is created on the first payload read, so messages
+    without large attachments do not read the header a second time.
+    """
+    
+    def __init__(self, msg_stream: BinaryIO):
+        self._stream = msg_stream
+        self._reader: Optional[CfbStreamReader] = None
+    
+    def reader(self) -> CfbStreamReader:
+        """Return the stream reader, reading the header on first use"""
+        if self._reader is None:
+            self._reader = CfbStreamReader(self._read_at, self._stream.seek(0, io.SEEK_END))
+        return self._reader
+    
+    def _read_at(self, offset: int, length: int) -> bytes:
+        # extract_msg seeks before each of its own reads, so the position
+        # can be moved between chunks
+        self._stream.seek(offset)
+        return self._stream.read(length)
+
+
+class _LazyDataAttachment(Attachment):
+    """Data attachment that reads its payload on every access instead of on open
+    
+    extract_msg's Attachment reads the payload when the attachment list is
+    built, holding all payloads in memory at once. This one reads it when
+    the attachment is written and keeps no reference to it; iter_data reads
+    it in chunks, so not even one whole payload is held.
+    """
+    
+    def __init__(self, msg: Message, dir_: str, propStore: PropertiesStore,
+                 payloads: _PayloadReader):
+        AttachmentBase.__init__(self, msg, dir_, propStore)
+        self._payloads = payloads
+    
+    @property
+    def data(self) -> Optional[bytes]:
+        return self.getStream(ATTACHMENT_DATA_STREAM)
+    
+    def iter_data(self, chunk_size: int) -> Iterator[bytes]:
+        """
+        Yield the payload in chunks read straight from the MSG stream
+        
+        Payloads below the mini stream cutoff (4 KB) are read whole through
+        extract_msg.
+        
+        Args:
+            chunk_size: Largest chunk to read at once
+            
+        Yields:
+            Consecutive pieces of the payload
+        """
+        entry = self.msg._getOleEntry([self.dir, ATTACHMENT_DATA_STREAM])
+        reader = self._payloads.reader()
+        if entry.size < reader.header.mini_stream_cutoff:
+            yield self.data
+            return
+        yield from reader.iter_stream(entry.isectStart, entry.size, chunk_size)
+
+
+def _init_lazy_attachment(msg: Message, dir_: str, payloads: _PayloadReader) -> AttachmentBase:
+    """
+    initAttachment function for extract_msg that defers data payload reads
+    
+    Args:
+        msg: Message the attachment belongs to
+        dir_: CFB storage of the attachment
+        payloads: Chunked reader over the MSG stream
+        
+    Returns:
+        _LazyDataAttachment for data attachments, extract_msg's own
+        attachment class otherwise
+    """
+    if msg.exists([dir_, ATTACHMENT_DATA_STREAM]):
+        properties = PropertiesStore(
+            msg.getStream([dir_, ATTACHMENT_PROPERTIES_STREAM]),
+            PropertiesType.ATTACHMENT
+        )
+        # Attachments without an attach method are repaired by extract_msg
+        if '37050003' in properties:
+            return _LazyDataAttachment(msg, dir_, properties, payloads)
+    
+    return initStandardAttachment(msg, dir_)
@@ -0,0 +1,371 @@
+"""Native reader of the MSG properties written to EML, without extract_msg
+
+Covers the common case: a Unicode message without attachments whose body
+is stored as plain text and/or HTML. Only the streams the EML writer
+uses are read: the property streams, the transport headers, sender,
+subject, Message-ID, the To/Cc recipients and the bodies. Everything
+else (ANSI strings, attachments, RTF bodies without an HTML stream,
+unusual dates) raises UnsupportedMsgError, and MsgToEmlConverter opens
+the file with extract_msg instead. Values are derived as extract_msg derives them, so
+either path writes the same EML.
+"""
+import email.header
+import mmap
+import struct
+from datetime import datetime, timezone
+from email import policy
+from email.parser import HeaderParser
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from .cfb import STORAGE_OBJECT, CfbFormatError, CfbReader, DirectoryEntry
+
+
+# Property stream of a storage: a header (32 bytes for the top-level
+# message, 8 for recipients) followed by 16-byte fixed-size properties
+PROPERTIES_STREAM = '__properties_version1.0'
+MESSAGE_PROPERTIES_HEADER_SIZE = 32
+RECIPIENT_PROPERTIES_HEADER_SIZE = 8
+
+# Storages of recipients and attachments
+RECIPIENT_STORAGE_PREFIX = '__recip_version1.0_'
+ATTACHMENT_STORAGE_PREFIX = '__attach_version1.0_'
+
+# Property tags (ID and type) read from the property streams
+PR_MESSAGE_FLAGS = 0x0E070003
+PR_STORE_SUPPORT_MASK = 0x340D0003
+PR_CLIENT_SUBMIT_TIME = 0x00390040
+PR_RECIPIENT_TYPE = 0x0C150003
+
+# PR_MESSAGE_FLAGS bit of unsent messages; PR_STORE_SUPPORT_MASK bit of
+# stores whose strings are Unicode
+MSGFLAG_UNSENT = 0x8
+STORE_UNICODE_OK = 0x40000
+
+# PR_RECIPIENT_TYPE values (low 4 bits)
+MAPI_TO = 1
+MAPI_CC = 2
+MAPI_BCC = 3
+
+# Stream name suffixes of Unicode and ANSI string properties
+UNICODE_STRING_TYPE = '001F'
+ANSI_STRING_TYPE = '001E'
+
+# String property streams, without the type suffix
+TRANSPORT_HEADERS_STREAM = '__substg1.0_007D'
+SUBJECT_STREAM = '__substg1.0_0037'
+SENDER_NAME_STREAM = '__substg1.0_0C1A'
+SENDER_SMTP_ADDRESS_STREAM = '__substg1.0_5D01'
+MESSAGE_ID_STREAM = '__substg1.0_1035'
+PLAIN_BODY_STREAM = '__substg1.0_1000'
+RECIPIENT_NAME_STREAM = '__substg1.0_3001'
+RECIPIENT_EMAIL_STREAM = '__substg1.0_3003'
+RECIPIENT_SMTP_ADDRESS_STREAM = '__substg1.0_39FE'
+
+# Binary property streams of the HTML body and the compressed RTF body
+HTML_BODY_STREAM = '__substg1.0_10130102'
+RTF_BODY_STREAM = '__substg1.0_10090102'
+
+# Prefix Outlook puts before some transport header blocks
+TRANSPORT_HEADERS_PREFIX = 'Microsoft Mail Internet Headers Version 2.0'
+
+# FILETIME range read as a plain UTC timestamp; extract_msg maps times
+# before 1970 and its "null date" sentinels (around year 4500) to special
+# values, which are left to it
+FILETIME_UNIX_EPOCH = 116444736000000000
+FILETIME_NULL_DATES = 915000000000000000
+
+# Separator between the recipients of a To or Cc list
+RECIPIENT_SEPARATOR = ';'
+
+_PROPERTY_ENTRY = struct.Struct('<IIQ')
+
+
+class UnsupportedMsgError(Exception):
+    """Raised when a message needs extract_msg to be converted faithfully"""
+    pass
+
+
+class NativeMessage:
+    """
+    Properties of an MSG file read directly from its CFB container
+
+    Exposes the subset of the extract_msg Message interface used by
+    MsgToEmlConverter, so the EML writer handles both alike.
+    """
+
+    __slots__ = ('sender', 'to', 'cc', 'subject', 'date', 'messageId', 'attachments',
+                 '_reader', '_streams', '_mmap', '_bodies')
+
+    def __init__(self, reader: CfbReader, streams: Dict[str, DirectoryEntry],
+                 mapped: Optional[mmap.mmap] = None):
+        """
+        Initialize the message
+
+        Args:
+            reader: Reader over the MSG file
+            streams: Entries of the root storage by lower-case name
+            mapped: Memory map the reader works on, closed with the message
+        """
+        self._reader = reader
+        self._streams = streams
+        self._mmap = mapped
+        self._bodies: Dict[str, Union[memoryview, bytes]] = {}
+        self.attachments: List = []
+
+    @property
+    def body(self) -> Optional[str]:
+        """The plain text body, if stored"""
+        data = self.getStream(PLAIN_BODY_STREAM + UNICODE_STRING_TYPE)
+        return None if data is None else str(data, 'utf-16-le')
+
+    def exists(self, name: str) -> bool:
+        """Return True if a stream of the root storage exists"""
+        return name.lower() in self._streams
+
+    def sExists(self, name: str) -> bool:
+        """Return True if a string stream (name without type suffix) exists"""
+        return self.exists(name + UNICODE_STRING_TYPE) or self.exists(name + ANSI_STRING_TYPE)
+
+    def getStream(self, name: str) -> Optional[Union[memoryview, bytes]]:
+        """Return the content of a stream of the root storage, if it exists"""
+        name = name.lower()
+        if name in self._bodies:
+            return self._bodies[name]
+        entry = self._streams.get(name)
+        return None if entry is None else self._reader.read_stream(entry)
+
+    # The RTF body is only needed without an HTML stream, and such messages
+    # are left to extract_msg
+    rtfBody = None
+    deencapsulatedRtf = None
+
+    def close(self) -> None:
+        """Release the file buffer"""
+        self._bodies.clear()
+        self._reader.close()
+        _close_map(self._mmap)
+
+    def _string(self, name: str,
+                streams: Optional[Dict[str, DirectoryEntry]] = None) -> Optional[str]:
+        """Decode a Unicode string stream (name without type suffix), if it exists"""
+        entry = (self._streams if streams is None else streams).get(
+            (name + UNICODE_STRING_TYPE).lower()
+        )
+        if entry is None:
+            return None
+        return str(self._reader.read_stream(entry), 'utf-16-le')
+
+
+class _Recipient:
+    """A To, Cc or Bcc recipient as formatted by extract_msg"""
+
+    __slots__ = ('recipient_type', 'formatted')
+
+
+def open_native_message(msg_data: Union[bytes, bytearray, memoryview, BinaryIO]) -> NativeMessage:
+    """
+    Read the EML-relevant properties of an MSG file
+
+    Bytes are read in place; a file stream is memory-mapped. Other streams
+    (e.g. BlobRangeReader) are not read into memory for this.
+
+    Args:
+        msg_data: Raw MSG file content, or a file opened in binary mode
+
+    Returns:
+        NativeMessage with sender, recipients, subject, date and Message-ID
+        decoded; bodies are read when accessed
+
+    Raises:
+        UnsupportedMsgError: If the input or message needs extract_msg
+    """
+    mapped = None
+    if not isinstance(msg_data, (bytes, bytearray, memoryview)):
+        try:
+            mapped = mmap.mmap(msg_data.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError) as e:
+            raise UnsupportedMsgError("input is not an in-memory or mappable file") from e
+
+    reader = None
+    try:
+        reader = CfbReader(msg_data if mapped is None else mapped)
+        return _read_message(reader, mapped)
+    except (UnsupportedMsgError, CfbFormatError, ValueError, struct.error) as e:
+        if reader is not None:
+            reader.close()
+        _close_map(mapped)
+        if isinstance(e, UnsupportedMsgError):
+            raise
+        raise UnsupportedMsgError(f"cannot read MSG natively: {str(e)}") from e
+
+
+def _read_message(reader: CfbReader, mapped: Optional[mmap.mmap]) -> NativeMessage:
+    """Read the header properties of a message, or raise UnsupportedMsgError"""
+    streams = reader.children(reader.root)
+    if any(name.startswith(ATTACHMENT_STORAGE_PREFIX) for name in streams):
+        raise UnsupportedMsgError("message has attachments")
+    if PROPERTIES_STREAM not in streams:
+        raise UnsupportedMsgError("message has no property stream")
+
+    properties = _read_properties(reader, streams[PROPERTIES_STREAM],
+                                  MESSAGE_PROPERTIES_HEADER_SIZE)
+    recipient_storages = [
+        streams[name] for name in sorted(streams)
+        if name.startswith(RECIPIENT_STORAGE_PREFIX) and streams[name].object_type == STORAGE_OBJECT
+    ]
+    recipient_streams = [reader.children(storage) for storage in recipient_storages]
+
+    if not _strings_are_unicode(properties, [streams] + recipient_streams):
+        raise UnsupportedMsgError("message strings are not Unicode")
+    if (PLAIN_BODY_STREAM + ANSI_STRING_TYPE).lower() in streams:
+        raise UnsupportedMsgError("plain text body is not Unicode")
+    if RTF_BODY_STREAM.lower() in streams and HTML_BODY_STREAM.lower() not in streams:
+        # The RTF body may encapsulate the HTML body
+        raise UnsupportedMsgError("message has an RTF body and no HTML stream")
+
+    msg = NativeMessage(reader, streams, mapped)
+    for name in ((PLAIN_BODY_STREAM + UNICODE_STRING_TYPE).lower(), HTML_BODY_STREAM.lower()):
+        if name in streams:
+            # Located now (as views, not copies) so that a broken sector
+            # chain sends the file to extract_msg rather than failing later
+            msg._bodies[name] = reader.read_stream(streams[name])
+    if not any(msg._bodies.values()):
+        raise UnsupportedMsgError("message has no plain text or HTML body")
+
+    msg.subject = msg._string(SUBJECT_STREAM)
+    msg.date = _submit_time(properties)
+
+    header_text = msg._string(TRANSPORT_HEADERS_STREAM)
+    header = None
+    if header_text:
+        if header_text.startswith(TRANSPORT_HEADERS_PREFIX):
+            header_text = header_text[len(TRANSPORT_HEADERS_PREFIX):].lstrip()
+        header = HeaderParser(policy=policy.compat32).parsestr(header_text)
+
+    recipients = None
+
+    def recipients_of(recipient_type: int) -> Optional[str]:
+        nonlocal recipients
+        if recipients is None:
+            recipients = [_read_recipient(msg, reader, entries) for entries in recipient_streams]
+        found = [recipient.formatted for recipient in recipients
+                 if recipient.recipient_type == recipient_type]
+        return (RECIPIENT_SEPARATOR + ' ').join(found) if found else None
+
+    if header is not None:
+        value = header['from']
+        msg.sender = _decode_rfc2047(value) if value is not None else _sender(msg)
+        msg.to = _recipient_field(header['to'], recipients_of, MAPI_TO)
+        msg.cc = _recipient_field(header['cc'], recipients_of, MAPI_CC)
+        value = header['message-id']
+        msg.messageId = value if value is not None else msg._string(MESSAGE_ID_STREAM)
+    else:
+        msg.sender = _sender(msg)
+        msg.to = _recipient_field(None, recipients_of, MAPI_TO)
+        msg.cc = _recipient_field(None, recipients_of, MAPI_CC)
+        msg.messageId = msg._string(MESSAGE_ID_STREAM)
+    return msg
+
+
+def _close_map(mapped: Optional[mmap.mmap]) -> None:
+    """Close a memory map unless views of it are still referenced"""
+    if mapped is not None:
+        try:
+            mapped.close()
+        except BufferError:
+            # A body view is still held; the map is closed when collected
+            pass
+
+
+def _read_properties(reader: CfbReader, entry: DirectoryEntry, header_size: int) -> Dict[int, int]:
+    """Return the values of the fixed-size properties in a property stream by tag"""
+    data = reader.read_stream(entry)
+    end = header_size + (len(data) - header_size) // _PROPERTY_ENTRY.size * _PROPERTY_ENTRY.size
+    return {tag: value for tag, _flags, value in _PROPERTY_ENTRY.iter_unpack(data[header_size:end])}
+
+
+def _strings_are_unicode(properties: Dict[int, int],
+                         storages: List[Dict[str, DirectoryEntry]]) -> bool:
+    """Tell whether string properties are stored as Unicode, as extract_msg decides it"""
+    if PR_STORE_SUPPORT_MASK in properties:
+        return bool(properties[PR_STORE_SUPPORT_MASK] & STORE_UNICODE_OK)
+    return any(name.endswith(UNICODE_STRING_TYPE.lower())
+               for entries in storages for name in entries)
+
+
+def _submit_time(properties: Dict[int, int]) -> Optional[datetime]:
+    """Return the send time of a sent message in the local time zone"""
+    if properties.get(PR_MESSAGE_FLAGS, 0) & MSGFLAG_UNSENT:
+        return None
+    filetime = properties.get(PR_CLIENT_SUBMIT_TIME)
+    if filetime is None:
+        return None
+    if not FILETIME_UNIX_EPOCH <= filetime <= FILETIME_NULL_DATES:
+        raise UnsupportedMsgError("message has a special or pre-1970 submit time")
+    timestamp = (filetime - FILETIME_UNIX_EPOCH) / 10000000.0
+    return datetime.fromtimestamp(timestamp, timezone.utc).astimezone()
+
+
+def _sender(msg: NativeMessage) -> Optional[str]:
+    """Format the sender from its display name and SMTP address streams"""
+    name = msg._string(SENDER_NAME_STREAM)
+    address = msg._string(SENDER_SMTP_ADDRESS_STREAM)
+    if name is None:
+        return address
+    return name if address is None else f"{name} <{address}>"
+
+
+def _read_recipient(msg: NativeMessage, reader: CfbReader,
+                    streams: Dict[str, DirectoryEntry]) -> _Recipient:
+    """Read the type and formatted address of a recipient storage"""
+    recipient_type = 0
+    if PROPERTIES_STREAM in streams:
+        properties = _read_properties(reader, streams[PROPERTIES_STREAM],
+                                      RECIPIENT_PROPERTIES_HEADER_SIZE)
+        recipient_type = properties.get(PR_RECIPIENT_TYPE, 0) & 0xF
+    if recipient_type > MAPI_BCC:
+        raise UnsupportedMsgError(f"unknown recipient type {recipient_type}")
+
+    address = msg._string(RECIPIENT_SMTP_ADDRESS_STREAM, streams)
+    if not address:
+        address = msg._string(RECIPIENT_EMAIL_STREAM, streams)
+    recipient = _Recipient()
+    recipient.recipient_type = recipient_type
+    recipient.formatted = f"{msg._string(RECIPIENT_NAME_STREAM, streams)} <{address}>"
+    return recipient
+
+
+def _recipient_field(header_value: Optional[str], recipients_of,
+                     recipient_type: int) -> Optional[str]:
+    """
+    Build a To or Cc value from the transport header, else from the recipients
+
+    Args:
+        header_value: Value of the field in the transport headers, if any
+        recipients_of: Function joining the recipients of a type
+        recipient_type: MAPI_TO or MAPI_CC
+
+    Returns:
+        Field value on a single line, or None
+    """
+    value = None
+    if header_value:
+        value = _decode_rfc2047(header_value).replace(',', RECIPIENT_SEPARATOR)
+    if not value:
+        value = recipients_of(recipient_type)
+
+    if value:
+        value = value.replace(' \r\n\t', ' ').replace('\r\n\t ', ' ').replace('\r\n\t', ' ')
+        value = value.replace('\r\n', ' ').replace('\r', ' ').replace('\n', ' ')
+        while '  ' in value:
+            value = value.replace('  ', ' ')
+    return value
+
+
+def _decode_rfc2047(encoded: str) -> str:
+    """Decode RFC 2047 encoded words in a header value, as extract_msg does"""
+    encoded = encoded.replace('\r\n', '')
+    return ''.join(
+        text.decode(charset or 'raw-unicode-escape') if isinstance(text, bytes) else text
+        for text, charset in email.header.decode_header(encoded)
+    )
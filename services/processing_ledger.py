@@ -0,0 +1,276 @@
+"""Ledger of conversion stages completed per MSG blob version, for resuming retries"""
+import hashlib
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Optional
+
+from models.conversion_models import ProcessingCheckpoint
+from .local_store import SqliteLruTable
+from .storage_transport import blob_client_for_url
+
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobServiceClient
+
+
+# Stages recorded in the ledger, in pipeline order
+STAGE_UPLOADED = 'uploaded'
+STAGE_ARCHIVED = 'archived'
+
+# Blob index tags on an EML: the ledger key of the MSG version it was
+# converted from, and the last stage completed for that version
+SOURCE_TAG = 'msg_source_version'
+STAGE_TAG = 'msg_stage'
+
+# Defaults for the local on-disk ledger
+DEFAULT_LOCAL_LEDGER_PATH = os.path.join(tempfile.gettempdir(), 'msg_ledger.sqlite3')
+DEFAULT_LOCAL_LEDGER_MAX_ENTRIES = 100000
+
+
+def ledger_key(container: str, filename: str, etag: str) -> str:
+    """
+    Compute the ledger key of one version of an MSG blob
+
+    A blob replaced under the same name gets a new ETag, and so a new key:
+    it is converted again rather than resumed.
+
+    Args:
+        container: Container holding the MSG blob
+        filename: MSG blob name
+        etag: ETag of the blob version (with or without quotes)
+
+    Returns:
+        Hex-encoded SHA-256 of the blob path and ETag, which is also a
+        valid blob index tag value
+    """
+    etag = etag.strip('"')
+    return hashlib.sha256(f"{container}/{filename}\n{etag}".encode('utf-8')).hexdigest()
+
+
+class ProcessingLedger(ABC):
+    """
+    Records the last stage completed for each MSG blob version
+
+    The conversion of a blob is retried as a whole when any stage fails
+    (the Functions runtime re-runs the trigger, the queue worker makes the
+    message visible again). A retry that finds a checkpoint resumes after
+    it: an EML already uploaded is not parsed and uploaded again under a
+    uuid-suffixed name, only the archive step is repeated.
+    """
+
+    @abstractmethod
+    def lookup(self, key: str) -> Optional[ProcessingCheckpoint]:
+        """
+        Find the checkpoint of an MSG blob version
+
+        Args:
+            key: Ledger key (see ledger_key)
+
+        Returns:
+            Last checkpoint recorded, or None if no stage has completed
+        """
+
+    @abstractmethod
+    def checkpoint(self, key: str, stage: str, output_url: str) -> None:
+        """
+        Record a completed stage
+
+        Args:
+            key: Ledger key (see ledger_key)
+            stage: STAGE_UPLOADED or STAGE_ARCHIVED
+            output_url: URL of the EML blob the conversion produced
+        """
+
+    def upload_tags(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Blob index tags to write with the EML upload
+
+        Args:
+            key: Ledger key (see ledger_key)
+
+        Returns:
+            Tags that record the upload stage atomically with the EML
+            itself, or None if the ledger is stored elsewhere
+        """
+        return None
+
+    @abstractmethod
+    def forget(self, key: str) -> None:
+        """
+        Remove the checkpoint of an MSG blob version
+
+        Args:
+            key: Ledger key (see ledger_key)
+        """
+
+
+class LocalProcessingLedger(ProcessingLedger):
+    """
+    Processing ledger stored in a local SQLite file
+
+    Only retries on the same machine see its checkpoints, which suits the
+    queue worker and local development. The number of entries is bounded
+    by max_entries; the least recently updated entries are evicted first.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        """
+        Initialize the ledger
+
+        Args:
+            path: SQLite file path (default from env or msg_ledger.sqlite3 in
+                the temp directory)
+            max_entries: Maximum number of entries (default from env or 100000)
+        """
+        self._table = SqliteLruTable(
+            path or os.environ.get('PROCESSING_LEDGER_PATH', DEFAULT_LOCAL_LEDGER_PATH),
+            max_entries or int(
+                os.environ.get('PROCESSING_LEDGER_MAX_ENTRIES', DEFAULT_LOCAL_LEDGER_MAX_ENTRIES)
+            ),
+            table='checkpoints', key_column='key', value_columns=('stage', 'output_url'),
+            time_column='updated'
+        )
+
+    def lookup(self, key: str) -> Optional[ProcessingCheckpoint]:
+        row = self._table.get(key)
+        if row is None:
+            return None
+        return ProcessingCheckpoint(
+            stage=row[0],
+            output_blob_url=row[1],
+            timestamp=datetime.fromtimestamp(row[2], timezone.utc)
+        )
+
+    def checkpoint(self, key: str, stage: str, output_url: str) -> None:
+        self._table.put(key, (stage, output_url))
+
+    def forget(self, key: str) -> None:
+        self._table.delete(key)
+
+
+class BlobIndexProcessingLedger(ProcessingLedger):
+    """
+    Processing ledger backed by blob index tags on the EML blobs
+
+    The EML is uploaded with its source key and the 'uploaded' stage as
+    index tags, so an EML never exists without its checkpoint; later
+    stages update the stage tag. Lookups use Find Blobs by Tags on the
+    output container, so checkpoints are shared by all instances. The tag
+    index is updated asynchronously (usually within seconds); a retry that
+    arrives before it catches up converts the MSG again, as it would
+    without a ledger.
+    """
+
+    def __init__(self, blob_service_client: 'BlobServiceClient', container: str):
+        """
+        Initialize the ledger
+
+        Args:
+            blob_service_client: Service client for the storage account
+            container: Output container holding the tagged EML blobs
+        """
+        self.blob_service_client = blob_service_client
+        self.container = container
+
+    def lookup(self, key: str) -> Optional[ProcessingCheckpoint]:
+        container_client = self.blob_service_client.get_container_client(self.container)
+        for blob in container_client.find_blobs_by_tags(f"\"{SOURCE_TAG}\" = '{key}'"):
+            blob_client = container_client.get_blob_client(blob.name)
+            tags = blob_client.get_blob_tags()
+            return ProcessingCheckpoint(
+                stage=tags.get(STAGE_TAG, STAGE_UPLOADED),
+                output_blob_url=blob_client.url,
+                timestamp=datetime.now(timezone.utc)
+            )
+        return None
+
+    def checkpoint(self, key: str, stage: str, output_url: str) -> None:
+        if stage == STAGE_UPLOADED:
+            # Written with the EML itself (see upload_tags)
+            return
+
+        blob_client = blob_client_for_url(self.blob_service_client, output_url)
+        # Set Blob Tags replaces all tags, so keep the others (e.g. the
+        # dedup cache's digest)
+        tags = blob_client.get_blob_tags()
+        tags[SOURCE_TAG] = key
+        tags[STAGE_TAG] = stage
+        blob_client.set_blob_tags(tags)
+
+    def upload_tags(self, key: str) -> Optional[Dict[str, str]]:
+        return {SOURCE_TAG: key, STAGE_TAG: STAGE_UPLOADED}
+
+    def forget(self, key: str) -> None:
+        # Tags live on the EML blob; a stale entry means the blob is gone
+        pass
+
+
+def lookup_checkpoint(ledger: Optional[ProcessingLedger], key: Optional[str],
+                      filename: str) -> Optional[ProcessingCheckpoint]:
+    """
+    Find where a conversion left off; ledger failures only cost the resume
+
+    Args:
+        ledger: Processing ledger (None when disabled)
+        key: Ledger key of the MSG blob version (None when disabled)
+        filename: MSG filename, for logging
+
+    Returns:
+        Last checkpoint of the blob version, or None to convert it afresh
+    """
+    if ledger is None or key is None:
+        return None
+    try:
+        checkpoint = ledger.lookup(key)
+    except Exception as e:
+        logging.warning(f"Processing ledger lookup failed for {filename}: {e}")
+        return None
+
+    if checkpoint is not None:
+        logging.info(f"Resuming {filename} after stage '{checkpoint.stage}': "
+                     f"{checkpoint.output_blob_url}")
+    return checkpoint
+
+
+def record_checkpoint(ledger: Optional[ProcessingLedger], key: Optional[str],
+                      stage: str, output_url: str) -> None:
+    """
+    Record a completed stage; failures only cost the resume of a later retry
+
+    Args:
+        ledger: Processing ledger (None when disabled)
+        key: Ledger key of the MSG blob version (None when disabled)
+        stage: STAGE_UPLOADED or STAGE_ARCHIVED
+        output_url: URL of the EML blob the conversion produced
+    """
+    if ledger is None or key is None:
+        return
+    try:
+        ledger.checkpoint(key, stage, output_url)
+    except Exception as e:
+        logging.warning(f"Failed to record stage '{stage}' of {output_url} "
+                        f"in processing ledger: {e}")
+
+
+def create_processing_ledger(blob_service_client: 'BlobServiceClient',
+                             output_container: str) -> Optional[ProcessingLedger]:
+    """
+    Create the processing ledger selected by the PROCESSING_LEDGER setting
+
+    Args:
+        blob_service_client: Service client for the storage account
+        output_container: Container the EML files are written to
+
+    Returns:
+        'local' -> LocalProcessingLedger, 'blob-index' ->
+        BlobIndexProcessingLedger, anything else (default 'none') -> None
+    """
+    mode = os.environ.get('PROCESSING_LEDGER', 'none').lower()
+
+    if mode == 'local':
+        return LocalProcessingLedger()
+    if mode == 'blob-index':
+        return BlobIndexProcessingLedger(blob_service_client, output_container)
+    return None
@@ -0,0 +1,535 @@
+"""Storage Queue worker that converts MSG files announced by blob notifications"""
+import base64
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+from azure.storage.queue import QueueClient, QueueMessage
+
+from models.conversion_models import ConversionJob, ConversionResult
+from utils.deadline import Deadline
+from utils.logging import ConversionLogger, correlated
+from utils.metrics import StageTimer
+from .blob_storage import BlobStorageService
+from .errors import (
+    BlobStorageError, ConversionError, ParseTimeoutError, ValidationError
+)
+from .msg_converter import MsgToEmlConverter
+from .processing_ledger import (
+    STAGE_ARCHIVED, STAGE_UPLOADED, ProcessingLedger, create_processing_ledger, ledger_key,
+    lookup_checkpoint, record_checkpoint
+)
+
+
+DEFAULT_QUEUE_NAME = 'msg-conversion'
+
+# Messages received per Get Messages request (the service maximum is 32)
+MAX_MESSAGES_PER_REQUEST = 32
+
+# Defaults for the worker settings (see QueueConversionWorker)
+DEFAULT_QUEUE_MAX_CONCURRENCY = os.cpu_count() or 4
+DEFAULT_VISIBILITY_TIMEOUT_SECONDS = 60
+DEFAULT_MAX_DEQUEUE_COUNT = 5
+DEFAULT_RETRY_DELAY_SECONDS = 30
+DEFAULT_QUEUE_CONVERSION_TIMEOUT_SECONDS = 300
+
+# Backoff for polling an empty queue
+POLL_INITIAL_SECONDS = 0.5
+POLL_MAX_SECONDS = 10.0
+
+BLOB_CREATED_EVENT = 'Microsoft.Storage.BlobCreated'
+BLOB_SUBJECT_PREFIX = '/blobServices/default/containers/'
+
+# Outcomes of a processed message
+DELETE = 'delete'
+RETRY = 'retry'
+
+
+def parse_blob_notification(content: str, default_container: str) -> Optional[ConversionJob]:
+    """
+    Turn a queue message into the conversion job it announces
+
+    Accepted messages are Event Grid BlobCreated events (Event Grid or
+    CloudEvents schema, single or batched in a JSON array), JSON objects
+    with "container" and "name" (and optionally "size") keys, and plain
+    "container/name" or blob name strings. Base64-encoded messages, as written by the Functions
+    queue output binding, are decoded first.
+
+    Args:
+        content: Message content
+        default_container: Container assumed for bare blob names
+
+    Returns:
+        ConversionJob with filename and input_container (and input_size
+        when the message carries it), or None if the message announces
+        something else (other event types, deletions)
+    """
+    content = (content or '').strip()
+    if not content:
+        return None
+
+    if content[0] not in '{[':
+        try:
+            decoded = base64.b64decode(content, validate=True).decode('utf-8').strip()
+            if decoded[:1] in ('{', '[') or decoded.lower().endswith('.msg'):
+                content = decoded
+        except (binascii.Error, UnicodeDecodeError):
+            pass
+
+    if content[0] not in '{[':
+        container, _, name = content.rpartition('/')
+        return ConversionJob(filename=name, input_container=container or default_container)
+
+    try:
+        document = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+
+    # Event Grid delivers one event per queue message, but accept arrays
+    event = document[0] if isinstance(document, list) and document else document
+    if not isinstance(event, dict):
+        return None
+
+    if 'name' in event and 'eventType' not in event and 'type' not in event:
+        return ConversionJob(filename=event['name'],
+                             input_container=event.get('container') or default_container,
+                             input_size=event.get('size'))
+
+    if (event.get('eventType') or event.get('type')) != BLOB_CREATED_EVENT:
+        return None
+
+    data = event.get('data') or {}
+    subject = event.get('subject') or ''
+    if subject.startswith(BLOB_SUBJECT_PREFIX) and '/blobs/' in subject:
+        container, _, name = subject[len(BLOB_SUBJECT_PREFIX):].partition('/blobs/')
+        return ConversionJob(filename=name, input_container=container,
+                             input_size=data.get('contentLength'))
+
+    # No usable subject: fall back to the blob URL. Azurite URLs carry the
+    # account name as the first path segment.
+    url = data.get('url')
+    if not url:
+        return None
+    segments = unquote(urlparse(url).path).lstrip('/').split('/')
+    if segments and segments[0] == 'devstoreaccount1':
+        segments = segments[1:]
+    if len(segments) < 2:
+        return None
+    return ConversionJob(filename='/'.join(segments[1:]), input_container=segments[0],
+                         input_size=data.get('contentLength'))
+
+
+class _MessageLease:
+    """A received message whose visibility timeout is kept extended while it is processed"""
+
+    def __init__(self, message: QueueMessage, visibility_timeout: int):
+        """
+        Initialize the lease
+
+        Args:
+            message: Received queue message
+            visibility_timeout: Visibility timeout the message was received with
+        """
+        self.message = message
+        self.pop_receipt = message.pop_receipt
+        self.expires_at = time.monotonic() + visibility_timeout
+
+
+class QueueConversionWorker:
+    """
+    Converts MSG files announced on a Storage Queue
+
+    Messages are received in batches of up to 32 while fewer than
+    max_concurrency conversions are running, and each is converted on a
+    worker thread (the parse itself runs in a child process when
+    ISOLATE_PARSING is on, so conversions run in parallel). Every message
+    is acknowledged on its own: it is deleted once its MSG is converted and
+    archived, or moved to the failed container, and its visibility timeout
+    is extended while it is being processed. Messages that fail with
+    storage or other transient errors are made visible again after
+    retry_delay and moved to the failed container after max_dequeue_count
+    attempts.
+
+    All queue requests are made by the thread that runs the worker, so a
+    message is never renewed and deleted at the same time.
+    """
+
+    def __init__(self, queue_client: Optional[QueueClient], blob_service: BlobStorageService,
+                 converter: Optional[MsgToEmlConverter] = None,
+                 max_concurrency: Optional[int] = None,
+                 visibility_timeout: Optional[int] = None,
+                 max_dequeue_count: Optional[int] = None,
+                 retry_delay: Optional[int] = None,
+                 conversion_timeout: Optional[float] = None,
+                 ledger: Optional[ProcessingLedger] = None):
+        """
+        Initialize the worker
+
+        Args:
+            queue_client: Client of the notification queue (only used by
+                run(); None for a worker that is handed jobs by process_job)
+            blob_service: Blob storage service for input and output containers
+            converter: MSG converter (default: a new MsgToEmlConverter)
+            max_concurrency: Maximum conversions in flight (default from env
+                QUEUE_MAX_CONCURRENCY or the CPU count)
+            visibility_timeout: Seconds a received message stays invisible
+                before it must be renewed (default from env or 60)
+            max_dequeue_count: Attempts before a failing message is given up
+                (default from env or 5)
+            retry_delay: Seconds before a failed attempt is retried
+                (default from env or 30)
+            conversion_timeout: Time budget in seconds per conversion
+                (default from env or 300)
+            ledger: Processing ledger that lets a retried message resume
+                after the last completed stage (default: the one selected by
+                env PROCESSING_LEDGER, if any)
+        """
+        self.queue_client = queue_client
+        self.blob_service = blob_service
+        self.converter = converter or MsgToEmlConverter()
+        self.conversion_logger = ConversionLogger()
+
+        self.max_concurrency = max_concurrency or int(
+            os.environ.get('QUEUE_MAX_CONCURRENCY', DEFAULT_QUEUE_MAX_CONCURRENCY)
+        )
+        self.visibility_timeout = visibility_timeout or int(
+            os.environ.get('QUEUE_VISIBILITY_TIMEOUT_SECONDS', DEFAULT_VISIBILITY_TIMEOUT_SECONDS)
+        )
+        self.max_dequeue_count = max_dequeue_count or int(
+            os.environ.get('QUEUE_MAX_DEQUEUE_COUNT', DEFAULT_MAX_DEQUEUE_COUNT)
+        )
+        self.retry_delay = retry_delay if retry_delay is not None else int(
+            os.environ.get('QUEUE_RETRY_DELAY_SECONDS', DEFAULT_RETRY_DELAY_SECONDS)
+        )
+        self.conversion_timeout = conversion_timeout or float(
+            os.environ.get('QUEUE_CONVERSION_TIMEOUT_SECONDS',
+                           DEFAULT_QUEUE_CONVERSION_TIMEOUT_SECONDS)
+        )
+
+        self.input_container = os.environ.get('INPUT_CONTAINER', 'msg-input')
+        self.output_container = os.environ.get('OUTPUT_CONTAINER', 'eml-output')
+        self.archive_container = os.environ.get('ARCHIVE_CONTAINER', 'msg-archive')
+        self.failed_container = os.environ.get('FAILED_CONTAINER', 'msg-failed')
+        self.isolate_parsing = os.environ.get('ISOLATE_PARSING', 'false').lower() == 'true'
+        self.stream_input_threshold = int(
+            float(os.environ.get('STREAM_INPUT_THRESHOLD_MB', '8')) * 1024 * 1024
+        )
+        self.ledger = ledger or create_processing_ledger(
+            blob_service.blob_service_client, self.output_container
+        )
+
+    def run(self, stop_event: Optional[threading.Event] = None,
+            drain: bool = False) -> List[ConversionResult]:
+        """
+        Receive and convert messages until stopped
+
+        Args:
+            stop_event: Event that ends the loop once set; conversions in
+                flight are finished first
+            drain: Return as soon as the queue is empty and nothing is in
+                flight (for one-off runs and tests)
+
+        Returns:
+            Results of the conversions finished while running (only
+            collected when drain is set, so a long-running worker does not
+            accumulate them)
+        """
+        stop_event = stop_event or threading.Event()
+        results: List[ConversionResult] = []
+        in_flight: Dict[Future, _MessageLease] = {}
+        idle_seconds = POLL_INITIAL_SECONDS
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while in_flight or not stop_event.is_set():
+                receiving = not stop_event.is_set() and len(in_flight) < self.max_concurrency
+                if receiving:
+                    leases = self._receive(self.max_concurrency - len(in_flight))
+                    for lease in leases:
+                        in_flight[executor.submit(self._process, lease.message)] = lease
+                    if leases:
+                        idle_seconds = POLL_INITIAL_SECONDS
+
+                if not in_flight:
+                    if drain:
+                        break
+                    stop_event.wait(idle_seconds)
+                    idle_seconds = min(idle_seconds * 2, POLL_MAX_SECONDS)
+                    continue
+
+                # Wake up in time to renew the lease that expires first, and
+                # poll again meanwhile while there is room for more messages
+                renew_in = min(lease.expires_at for lease in in_flight.values()) \
+                    - time.monotonic() - self.visibility_timeout / 2
+                timeout = max(renew_in, 0)
+                if receiving:
+                    timeout = min(timeout, idle_seconds)
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                if receiving and not leases:
+                    idle_seconds = min(idle_seconds * 2, POLL_MAX_SECONDS)
+
+                for future in done:
+                    lease = in_flight.pop(future)
+                    outcome, result = future.result()
+                    self._acknowledge(lease, outcome)
+                    if drain and result is not None:
+                        results.append(result)
+
+                self._renew_leases(in_flight.values())
+
+        return results
+
+    def _receive(self, count: int) -> List[_MessageLease]:
+        """
+        Receive up to count messages
+
+        Args:
+            count: Maximum number of messages
+
+        Returns:
+            Leases of the received messages (empty if the queue is empty or
+            the request failed)
+        """
+        try:
+            messages = self.queue_client.receive_messages(
+                messages_per_page=min(count, MAX_MESSAGES_PER_REQUEST),
+                max_messages=count,
+                visibility_timeout=self.visibility_timeout
+            )
+            return [_MessageLease(message, self.visibility_timeout) for message in messages]
+        except Exception as e:
+            logging.error(f"Failed to receive queue messages: {str(e)}")
+            return []
+
+    def _renew_leases(self, leases) -> None:
+        """Extend the visibility timeout of messages that are halfway to expiry"""
+        now = time.monotonic()
+        for lease in leases:
+            if lease.expires_at - now > self.visibility_timeout / 2:
+                continue
+            try:
+                updated = self.queue_client.update_message(
+                    lease.message.id, lease.pop_receipt,
+                    visibility_timeout=self.visibility_timeout
+                )
+                lease.pop_receipt = updated.pop_receipt
+                lease.expires_at = time.monotonic() + self.visibility_timeout
+            except Exception as e:
+                # The message will reappear and may be converted twice; the
+                # archive step fails for the second attempt
+                logging.warning(f"Failed to extend visibility of message {lease.message.id}: {e}")
+
+    def _acknowledge(self, lease: _MessageLease, outcome: str) -> None:
+        """
+        Delete a processed message, or schedule its retry
+
+        Args:
+            lease: Lease of the processed message
+            outcome: DELETE or RETRY
+        """
+        try:
+            if outcome == DELETE:
+                self.queue_client.delete_message(lease.message.id, lease.pop_receipt)
+            else:
+                self.queue_client.update_message(
+                    lease.message.id, lease.pop_receipt,
+                    visibility_timeout=self.retry_delay
+                )
+        except Exception as e:
+            logging.warning(f"Failed to acknowledge message {lease.message.id}: {e}")
+
+    @correlated
+    def _process(self, message: QueueMessage):
+        """
+        Convert the MSG file announced by one message
+
+        Runs on a worker thread and does not touch the queue.
+
+        Args:
+            message: Received queue message
+
+        Returns:
+            Tuple of the outcome (DELETE or RETRY) and the ConversionResult
+            (None for messages that announce no conversion)
+        """
+        job = parse_blob_notification(message.content, self.input_container)
+        if job is None or job.input_container != self.input_container \
+                or not job.filename.lower().endswith('.msg'):
+            logging.info(f"Ignoring queue message {message.id}: no MSG upload to "
+                         f"container '{self.input_container}'")
+            return DELETE, None
+
+        return self.process_job(job, message.dequeue_count)
+
+    def process_job(self, job: ConversionJob, dequeue_count: Optional[int] = None):
+        """
+        Convert the MSG file of one job and decide what becomes of its message
+
+        Files that are at fault are moved to the failed container; transient
+        failures are retried until the message has been dequeued
+        max_dequeue_count times. Also used by the heavy-lane queue trigger of
+        the function app, whose messages are delivered by the Functions host.
+
+        Args:
+            job: Job announced by the message
+            dequeue_count: Number of times the message has been delivered
+
+        Returns:
+            Tuple of the outcome (DELETE or RETRY) and the ConversionResult
+            (None if an earlier delivery already converted the file)
+        """
+        filename = job.filename
+        start_time = time.time()
+
+        try:
+            result = self.convert_blob(filename)
+            self.conversion_logger.log_conversion_success(
+                filename, result.duration_seconds, result.output_blob_url
+            )
+            return DELETE, result
+
+        except (ValidationError, ConversionError, ParseTimeoutError) as e:
+            # The file itself is at fault: retrying won't help. Other
+            # timeouts (slow or throttled storage) are retried below.
+            self.conversion_logger.log_conversion_failure(filename, e, time.time() - start_time)
+            self._move_to_failed(filename)
+            return DELETE, self._failure(filename, start_time, e)
+
+        except BlobStorageError as e:
+            if not self._input_exists(filename):
+                # Converted and archived by an earlier delivery of this message
+                logging.info(f"MSG file {filename} no longer in '{self.input_container}', skipping")
+                return DELETE, None
+            return self._retry_or_give_up(dequeue_count, filename, start_time, e)
+
+        except Exception as e:
+            return self._retry_or_give_up(dequeue_count, filename, start_time, e)
+
+    def convert_blob(self, filename: str) -> ConversionResult:
+        """
+        Convert one MSG blob from the input container and archive it
+
+        With a processing ledger, a blob version whose EML was uploaded by an
+        earlier attempt is only archived.
+
+        Args:
+            filename: MSG blob name in the input container
+
+        Returns:
+            ConversionResult of the successful conversion
+
+        Raises:
+            ValidationError: If the MSG file is invalid
+            ConversionError: If the MSG file cannot be converted
+            ParseTimeoutError: If the isolated parse was killed at the deadline
+            TimeoutError: If the conversion otherwise runs out of time
+            BlobStorageError: If reading, uploading or archiving fails
+        """
+        start_time = time.time()
+        deadline = Deadline(self.conversion_timeout)
+        timer = StageTimer()
+
+        reader = self.blob_service.open_blob_reader(self.input_container, filename)
+        try:
+            input_size = reader.size
+            self.conversion_logger.log_conversion_start(filename, input_size)
+
+            source_key = ledger_key(self.input_container, filename, reader.etag) \
+                if self.ledger else None
+            checkpoint = lookup_checkpoint(self.ledger, source_key, filename)
+
+            if checkpoint is None:
+                # Small inputs are fetched whole with a single GET; larger
+                # ones are parsed from the reader's ranged, paged reads
+                msg_data = reader.readall() if input_size <= self.stream_input_threshold \
+                    else reader
+                validated_msg = self.converter.validate_msg_format(msg_data)
+
+                if self.isolate_parsing:
+                    eml_content = self.converter.convert_isolated(
+                        validated_msg, deadline.remaining()
+                    )
+                else:
+                    eml_content = self.converter.convert_stream(validated_msg)
+
+                output_url = self.blob_service.upload_eml(
+                    self.output_container, filename,
+                    timer.timed_chunks('generate', eml_content),
+                    timeout=deadline.remaining(),
+                    tags=self.ledger.upload_tags(source_key) if self.ledger else None
+                )
+                record_checkpoint(self.ledger, source_key, STAGE_UPLOADED, output_url)
+            else:
+                output_url = checkpoint.output_blob_url
+        finally:
+            reader.close()
+
+        if checkpoint is None or checkpoint.stage != STAGE_ARCHIVED:
+            deadline.check("after upload")
+            self.blob_service.archive_msg(
+                self.input_container, filename, self.archive_container,
+                timeout=deadline.remaining()
+            )
+            record_checkpoint(self.ledger, source_key, STAGE_ARCHIVED, output_url)
+
+        return ConversionResult(
+            success=True,
+            filename=filename,
+            input_size_bytes=input_size,
+            output_size_bytes=timer.bytes_out,
+            duration_seconds=time.time() - start_time,
+            output_blob_url=output_url,
+            error_message=None,
+            timestamp=datetime.utcnow()
+        )
+
+    def _retry_or_give_up(self, dequeue_count: Optional[int], filename: str,
+                          start_time: float, error: Exception):
+        """Retry a transient failure, or move the MSG to failed after max_dequeue_count attempts"""
+        self.conversion_logger.log_conversion_failure(filename, error, time.time() - start_time)
+
+        if (dequeue_count or 0) < self.max_dequeue_count:
+            logging.warning(
+                f"Attempt {dequeue_count} for {filename} failed, "
+                f"retrying in {self.retry_delay}s: {str(error)}"
+            )
+            return RETRY, self._failure(filename, start_time, error)
+
+        logging.error(f"Giving up on {filename} after {dequeue_count} attempts")
+        self._move_to_failed(filename)
+        return DELETE, self._failure(filename, start_time, error)
+
+    def _input_exists(self, filename: str) -> bool:
+        """Check whether an MSG file is still in the input container (True if unknown)"""
+        try:
+            return self.blob_service.blob_service_client.get_blob_client(
+                self.input_container, filename
+            ).exists()
+        except Exception:
+            return True
+
+    def _move_to_failed(self, filename: str) -> None:
+        """Move an MSG file to the failed container, logging (not raising) errors"""
+        try:
+            self.blob_service.move_to_failed(self.input_container, filename, self.failed_container)
+        except BlobStorageError as move_error:
+            logging.error(f"Failed to move {filename} to failed container: {move_error}")
+
+    def _failure(self, filename: str, start_time: float, error: Exception) -> ConversionResult:
+        """Build the ConversionResult of a failed attempt"""
+        return ConversionResult(
+            success=False,
+            filename=filename,
+            input_size_bytes=0,
+            output_size_bytes=None,
+            duration_seconds=time.time() - start_time,
+            output_blob_url=None,
+            error_message=f"{type(error).__name__}: {str(error)}",
+            timestamp=datetime.utcnow()
+        )
@@ -0,0 +1,171 @@
+"""Pooled HTTP transports and retry settings shared by the Azure Storage clients"""
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import unquote
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobClient, BlobServiceClient
+
+
+# Connections kept open per storage host. requests defaults to 10, which is
+# fewer than concurrent block uploads plus copies use, so extra connections
+# were opened and discarded (with a TLS handshake each) under load.
+DEFAULT_POOL_MAXSIZE = 32
+
+# Seconds an idle pooled connection is kept alive (aiohttp transport only;
+# requests keeps connections until the server closes them)
+DEFAULT_KEEPALIVE_SECONDS = 60
+
+# Socket timeouts per request, in seconds
+DEFAULT_CONNECTION_TIMEOUT_SECONDS = 10
+DEFAULT_READ_TIMEOUT_SECONDS = 120
+
+# Exponential retry: the SDK default starts at 15 seconds, longer than a
+# conversion's whole time budget
+DEFAULT_RETRY_TOTAL = 3
+DEFAULT_RETRY_INITIAL_BACKOFF_SECONDS = 1
+DEFAULT_RETRY_INCREMENT_BASE = 2
+DEFAULT_RETRY_JITTER_SECONDS = 1
+
+# Sync transports, one per process: a forked child must not share the
+# parent's sockets
+_sync_transports: Dict[int, RequestsTransport] = {}
+_sync_transports_lock = threading.Lock()
+
+
+def pool_maxsize() -> int:
+    """Return the connection pool size per host from STORAGE_POOL_MAXSIZE"""
+    return int(os.environ.get('STORAGE_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE))
+
+
+def transport_timeouts() -> Dict[str, float]:
+    """
+    Return the socket timeouts for storage transports
+
+    Returns:
+        connection_timeout and read_timeout in seconds, from
+        STORAGE_CONNECTION_TIMEOUT_SECONDS and STORAGE_READ_TIMEOUT_SECONDS
+    """
+    return {
+        'connection_timeout': float(os.environ.get(
+            'STORAGE_CONNECTION_TIMEOUT_SECONDS', DEFAULT_CONNECTION_TIMEOUT_SECONDS
+        )),
+        'read_timeout': float(os.environ.get(
+            'STORAGE_READ_TIMEOUT_SECONDS', DEFAULT_READ_TIMEOUT_SECONDS
+        )),
+    }
+
+
+def retry_settings() -> Dict[str, int]:
+    """
+    Return the exponential retry settings for storage clients
+
+    Blob and queue clients each take an ExponentialRetry from their own
+    package, built from these keyword arguments.
+
+    Returns:
+        Keyword arguments for ExponentialRetry, from STORAGE_RETRY_TOTAL,
+        STORAGE_RETRY_INITIAL_BACKOFF_SECONDS, STORAGE_RETRY_INCREMENT_BASE
+        and STORAGE_RETRY_JITTER_SECONDS
+    """
+    return {
+        'retry_total': int(os.environ.get('STORAGE_RETRY_TOTAL', DEFAULT_RETRY_TOTAL)),
+        'initial_backoff': int(os.environ.get(
+            'STORAGE_RETRY_INITIAL_BACKOFF_SECONDS', DEFAULT_RETRY_INITIAL_BACKOFF_SECONDS
+        )),
+        'increment_base': int(os.environ.get(
+            'STORAGE_RETRY_INCREMENT_BASE', DEFAULT_RETRY_INCREMENT_BASE
+        )),
+        'random_jitter_range': int(os.environ.get(
+            'STORAGE_RETRY_JITTER_SECONDS', DEFAULT_RETRY_JITTER_SECONDS
+        )),
+    }
+
+
+def get_sync_transport() -> RequestsTransport:
+    """
+    Return this process's shared requests transport, creating it on first use
+
+    All sync storage clients of a process send their requests through this
+    transport, so they share one sized pool of keep-alive connections.
+
+    Returns:
+        RequestsTransport over a pooled requests.Session
+    """
+    pid = os.getpid()
+    transport = _sync_transports.get(pid)
+    if transport is not None:
+        return transport
+
+    with _sync_transports_lock:
+        transport = _sync_transports.get(pid)
+        if transport is None:
+            size = pool_maxsize()
+            # Retries are done by the storage retry policy, not by urllib3
+            adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size, max_retries=0)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            transport = RequestsTransport(session=session, session_owner=False,
+                                          **transport_timeouts())
+            _sync_transports.clear()
+            _sync_transports[pid] = transport
+    return transport
+
+
+def blob_client_for_url(blob_service_client: 'BlobServiceClient', url: str) -> 'BlobClient':
+    """
+    Return a client for a blob URL of the service client's account
+
+    Unlike BlobClient.from_blob_url, the client shares the service client's
+    pipeline: its pooled transport, retry policy and credential.
+
+    Args:
+        blob_service_client: Service client for the storage account
+        url: Blob URL in that account (a query string is ignored)
+
+    Returns:
+        BlobClient for the blob
+
+    Raises:
+        ValueError: If the URL is not a blob of the service client's account
+    """
+    account_url = blob_service_client.url.split('?', 1)[0].rstrip('/') + '/'
+    blob_path = url.split('?', 1)[0]
+    if not blob_path.startswith(account_url):
+        raise ValueError(f"{url} is not a blob of {account_url}")
+    container, _, blob_name = unquote(blob_path[len(account_url):]).partition('/')
+    if not blob_name:
+        raise ValueError(f"{url} is not a blob URL")
+    return blob_service_client.get_blob_client(container, blob_name)
+
+
+def create_async_transport(keepalive_seconds: Optional[float] = None):
+    """
+    Create a pooled aiohttp transport for async storage clients
+
+    Must be called from the event loop the clients will run on.
+
+    Args:
+        keepalive_seconds: Idle keep-alive per connection (default from env
+            STORAGE_KEEPALIVE_SECONDS or 60)
+
+    Returns:
+        AioHttpTransport owning an aiohttp session with a sized connector
+    """
+    # Imported here: aiohttp is only needed by the async trigger
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    keepalive = keepalive_seconds or float(
+        os.environ.get('STORAGE_KEEPALIVE_SECONDS', DEFAULT_KEEPALIVE_SECONDS)
+    )
+    connector = aiohttp.TCPConnector(limit=pool_maxsize(), keepalive_timeout=keepalive)
+    session = aiohttp.ClientSession(connector=connector)
+    return AioHttpTransport(session=session, session_owner=True, **transport_timeouts())
@@ -0,0 +1,278 @@
+"""Long-lived pool of warm conversion processes, recycled to bound leak growth"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Optional, Tuple
+
+from models.conversion_models import ConversionJob, ConversionResult
+from utils.metrics import resident_memory_mb
+from .errors import ParseTimeoutError
+from .msg_converter import (
+    MsgToEmlConverter, _child_context, _init_batch_worker, _run_batch_job
+)
+
+
+# Defaults for the pool settings (see WarmWorkerPool)
+DEFAULT_WORKER_MAX_JOBS = 1000
+DEFAULT_WORKER_MAX_RSS_MB = 512
+DEFAULT_WORKER_JOB_TIMEOUT_SECONDS = 300
+
+# Seconds a retiring worker is given to exit before it is killed
+WORKER_EXIT_TIMEOUT_SECONDS = 5
+
+
+class WarmWorkerPool:
+    """
+    Converts jobs on a fixed set of long-lived, pre-warmed worker processes
+
+    Each worker imports the MSG parser once and then converts job after
+    job, so a small message costs only its conversion instead of a process
+    start and the extract_msg import. Workers are started from a fork
+    server that has the parser loaded (where the platform has one), so
+    starting one is cheap as well.
+
+    Leaks in a long-running worker are bounded by recycling: a worker
+    retires after max_jobs_per_worker jobs, or as soon as its RSS exceeds
+    max_rss_mb after a job, and is replaced before its slot takes the next
+    job. A job that runs past job_timeout has its worker killed and
+    replaced, and fails with a ParseTimeoutError, like convert_isolated.
+    """
+
+    def __init__(self, workers: Optional[int] = None,
+                 max_jobs_per_worker: Optional[int] = None,
+                 max_rss_mb: Optional[float] = None,
+                 job_timeout: Optional[float] = None,
+                 converter: Optional[MsgToEmlConverter] = None,
+                 connection_string: Optional[str] = None):
+        """
+        Initialize the pool and start its workers
+
+        Args:
+            workers: Number of worker processes (default from env
+                WORKER_POOL_SIZE or the CPU count)
+            max_jobs_per_worker: Jobs after which a worker is replaced
+                (default from env WORKER_MAX_JOBS or 1000)
+            max_rss_mb: RSS in MB above which a worker is replaced after its
+                current job (default from env WORKER_MAX_RSS_MB or 512;
+                0 disables the check)
+            job_timeout: Seconds a job may take before its worker is killed
+                (default from env WORKER_JOB_TIMEOUT_SECONDS or 300)
+            converter: Converter whose settings the workers use (default:
+                a new MsgToEmlConverter)
+            connection_string: Azure Storage connection string for jobs that
+                use blob containers (default from env)
+        """
+        converter = converter or MsgToEmlConverter()
+        self.workers = workers or int(os.environ.get('WORKER_POOL_SIZE', os.cpu_count() or 1))
+        self.max_jobs_per_worker = max_jobs_per_worker or int(
+            os.environ.get('WORKER_MAX_JOBS', DEFAULT_WORKER_MAX_JOBS)
+        )
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else float(
+            os.environ.get('WORKER_MAX_RSS_MB', DEFAULT_WORKER_MAX_RSS_MB)
+        )
+        self.job_timeout = job_timeout or float(
+            os.environ.get('WORKER_JOB_TIMEOUT_SECONDS', DEFAULT_WORKER_JOB_TIMEOUT_SECONDS)
+        )
+        self._worker_args = (converter.max_file_size_mb, connection_string,
+                             converter.native_reader, self.max_jobs_per_worker, self.max_rss_mb)
+
+        self.jobs_completed = 0
+        self.workers_recycled = 0
+        self._stats_lock = threading.Lock()
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._closed = False
+        self._context = _child_context()
+
+        self._slots = [
+            threading.Thread(target=self._run_slot, name=f'worker-slot-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for slot in self._slots:
+            slot.start()
+
+    def submit(self, job: ConversionJob) -> 'Future[ConversionResult]':
+        """
+        Queue a job for the next free worker
+
+        Args:
+            job: Conversion job
+
+        Returns:
+            Future resolving to the job's ConversionResult (errors are
+            captured in the result, not raised)
+
+        Raises:
+            RuntimeError: If the pool has been closed
+        """
+        if self._closed:
+            raise RuntimeError("Worker pool is closed")
+        future: 'Future[ConversionResult]' = Future()
+        self._jobs.put((job, future))
+        return future
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stop the workers once the queued jobs are done
+
+        Args:
+            wait: Block until every worker has exited
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._slots:
+            self._jobs.put(None)
+        if wait:
+            for slot in self._slots:
+                slot.join()
+
+    def __enter__(self) -> 'WarmWorkerPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _run_slot(self) -> None:
+        """Feed queued jobs to one worker process, replacing it when it retires or fails"""
+        worker = self._start_worker()
+        try:
+            while True:
+                item = self._jobs.get()
+                if item is None:
+                    break
+                job, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                if worker is None:
+                    worker = self._start_worker()
+                process, connection = worker
+                start_time = time.time()
+
+                try:
+                    connection.send(job)
+                    if not connection.poll(self.job_timeout):
+                        raise ParseTimeoutError(
+                            f"MSG conversion did not finish within {self.job_timeout:.2f}s "
+                            f"and was stopped"
+                        )
+                    result, retire = connection.recv()
+                except (TimeoutError, EOFError, OSError) as e:
+                    # The worker hung or died: kill it and start afresh
+                    self._stop_worker(worker, kill=True)
+                    worker = None
+                    if isinstance(e, EOFError):
+                        e = RuntimeError(
+                            f"Worker process exited with code {process.exitcode}"
+                        )
+                    future.set_result(_failure(job, start_time, e))
+                    continue
+
+                with self._stats_lock:
+                    self.jobs_completed += 1
+                future.set_result(result)
+
+                if retire:
+                    # Replace the worker now, so the next job finds a warm one
+                    self._stop_worker(worker)
+                    with self._stats_lock:
+                        self.workers_recycled += 1
+                    worker = self._start_worker()
+        finally:
+            if worker is not None:
+                self._stop_worker(worker)
+
+    def _start_worker(self) -> Tuple[multiprocessing.Process, object]:
+        """Start one worker process and return it with the parent's end of its pipe"""
+        connection, child_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=_serve_jobs, args=(child_connection,) + self._worker_args, daemon=True
+        )
+        process.start()
+        child_connection.close()
+        return process, connection
+
+    def _stop_worker(self, worker: Tuple[multiprocessing.Process, object],
+                     kill: bool = False) -> None:
+        """Ask a worker to exit (or kill it) and reap it"""
+        process, connection = worker
+        if not kill:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            process.join(WORKER_EXIT_TIMEOUT_SECONDS)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        connection.close()
+
+
+def _serve_jobs(connection, max_file_size_mb: int, connection_string: Optional[str],
+                native_reader: bool, max_jobs: int, max_rss_mb: float) -> None:
+    """
+    Convert jobs received over a pipe until told to stop or retired
+
+    Each result is sent back with a flag telling the pool whether the worker
+    has retired (after max_jobs jobs, or with an RSS above max_rss_mb).
+
+    Args:
+        connection: Pipe end receiving jobs (None to stop) and sending
+            (ConversionResult, retired) tuples
+        max_file_size_mb: Maximum file size in MB for the worker's converter
+        connection_string: Azure Storage connection string, if any
+        native_reader: Whether the worker's converter uses the native reader
+        max_jobs: Jobs after which the worker retires
+        max_rss_mb: RSS in MB above which the worker retires (0: no limit)
+    """
+    # Ctrl+C reaches the whole process group; the pool decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    _init_batch_worker(max_file_size_mb, connection_string, native_reader)
+    jobs_done = 0
+
+    try:
+        while True:
+            try:
+                job = connection.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+
+            result = _run_batch_job(job)
+            jobs_done += 1
+
+            retire = jobs_done >= max_jobs
+            if not retire and max_rss_mb:
+                rss_mb = resident_memory_mb()
+                retire = rss_mb is not None and rss_mb > max_rss_mb
+                if retire:
+                    logging.info(f"Worker {os.getpid()} retiring at {rss_mb:.1f} MB RSS "
+                                 f"after {jobs_done} jobs")
+
+            connection.send((result, retire))
+            if retire:
+                break
+    finally:
+        connection.close()
+
+
+def _failure(job: ConversionJob, start_time: float, error: Exception) -> ConversionResult:
+    """Build the ConversionResult of a job whose worker hung or died"""
+    return ConversionResult(
+        success=False,
+        filename=job.filename,
+        input_size_bytes=0,
+        output_size_bytes=None,
+        duration_seconds=time.time() - start_time,
+        output_blob_url=None,
+        error_message=f"{type(error).__name__}: {str(error)}",
+        timestamp=datetime.utcnow()
+    )
@@ -1,5 +1,6 @@
-"""Script to create required blob containers in Azurite"""
+"""Script to create required blob containers and the notification queue in Azurite"""
 from azure.storage.blob import BlobServiceClient
+from azure.storage.queue import QueueServiceClient
 
 # Connection string for Azurite with custom ports
 connection_string = "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:10001/devstoreaccount1;QueueEndpoint=http://127.0.0.1:10002/devstoreaccount1;TableEndpoint=http://127.0.0.1:10003/devstoreaccount1;"
@@ -12,6 +13,9 @@ containers = [
     "msg-failed"
 ]
 
+# Notification queue for the queue-driven worker
+queue_name = "msg-conversion"
+
 try:
     # Create blob service client
     blob_service_client = BlobServiceClient.from_connection_string(connection_string)
@@ -29,6 +33,17 @@ try:
             else:
                 print(f"✗ Error creating {container_name}: {e}")
     
+    # Create the queue read by run_queue_worker.py
+    queue_service_client = QueueServiceClient.from_connection_string(connection_string)
+    try:
+        queue_service_client.create_queue(queue_name)
+        print(f"✓ Created queue: {queue_name}")
+    except Exception as e:
+        if "QueueAlreadyExists" in str(e):
+            print(f"✓ Queue already exists: {queue_name}")
+        else:
+            print(f"✗ Error creating queue {queue_name}: {e}")
+    
     print("\n✅ All containers ready!")
     print("\nYou can now run: func start")
     
@@ -5,7 +5,7 @@ Tests only the conversion logic without Azure Function or Blob Storage
 
 import sys
 from pathlib import Path
-from services.msg_converter import MSGConverter
+from services.msg_converter import MsgToEmlConverter
 
 def test_conversion(msg_file_path: str):
     """Test MSG to EML conversion with a local file"""
@@ -33,14 +33,14 @@ def test_conversion(msg_file_path: str):
         return
     
     # Initialize converter
-    converter = MSGConverter()
+    converter = MsgToEmlConverter()
     
     # Test conversion
     print("\n🔄 Converting MSG to EML...")
     print("-" * 60)
     
     try:
-        eml_content = converter.convert_msg_to_eml(msg_data, msg_path.name)
+        eml_content = converter.convert(msg_data).decode('utf-8', errors='replace')
         
         print("✅ CONVERSION SUCCESSFUL!")
         print()
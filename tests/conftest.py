@@ -0,0 +1,24 @@
+"""Shared pytest fixtures"""
+import io
+import os
+import sys
+
+import pytest
+
+# Tests import the repo's packages the way the function app does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import build_msg  # noqa: E402
+
+
+@pytest.fixture
+def make_msg():
+    """Build an MSG file in memory with benchmarks.corpus.build_msg"""
+    def make(body=None, html=None, rtf=None, attachments=(), subject='Test message',
+             sender=('Alice Example', 'alice@example.com'),
+             recipients=(('Bob Example', 'bob@example.com'),)) -> bytes:
+        output = io.BytesIO()
+        build_msg(output, subject, sender, list(recipients), body=body, html=html, rtf=rtf,
+                  attachments=attachments)
+        return output.getvalue()
+    return make
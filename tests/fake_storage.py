@@ -0,0 +1,175 @@
+"""In-memory stand-ins for the blob clients used by the storage services"""
+import asyncio
+from types import SimpleNamespace
+from urllib.parse import unquote, urlparse
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+from services.blob_storage import BlobStorageService
+
+ACCOUNT_URL = 'http://127.0.0.1:10000/devstoreaccount1'
+
+
+class FakeAccount:
+    """
+    Committed and staged blobs by (container, name), with a log of the
+    requests, the timeouts of async requests and per-request async delays
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.staged = {}
+        self.requests = []
+        self.timeouts = []
+        self.delays = {}
+        self._etags = 0
+
+    def container(self, name):
+        return FakeContainerClient(self, name)
+
+    def async_container(self, name):
+        return FakeAsyncContainerClient(self, name)
+
+    def put(self, container, name, data):
+        self._etags += 1
+        self.blobs[(container, name)] = SimpleNamespace(data=bytes(data),
+                                                        etag=f'"0x{self._etags}"')
+
+    def names(self, container):
+        return sorted(name for owner, name in self.blobs if owner == container)
+
+    def resolve(self, url):
+        path = unquote(urlparse(url).path)[len('/devstoreaccount1/'):]
+        container, _, name = path.partition('/')
+        return self.blobs.get((container, name))
+
+
+class FakeContainerClient:
+    def __init__(self, account, name):
+        self.account = account
+        self.container_name = name
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self.account, self.container_name, name)
+
+    def delete_blobs(self, *blobs, raise_on_any_failure=True):
+        self.account.requests.append(('delete_blobs', self.container_name, len(blobs)))
+        responses = []
+        for blob in blobs:
+            stored = self.account.blobs.get((self.container_name, blob['name']))
+            if stored is None:
+                responses.append(SimpleNamespace(status_code=404))
+            elif stored.etag != blob['etag']:
+                responses.append(SimpleNamespace(status_code=412))
+            else:
+                del self.account.blobs[(self.container_name, blob['name'])]
+                responses.append(SimpleNamespace(status_code=202))
+        return responses
+
+
+class FakeBlobClient:
+    account_name = 'devstoreaccount1'
+
+    def __init__(self, account, container, name):
+        self.account = account
+        self.container_name = container
+        self.blob_name = name
+
+    @property
+    def url(self):
+        return f'{ACCOUNT_URL}/{self.container_name}/{self.blob_name}'
+
+    @property
+    def _key(self):
+        return (self.container_name, self.blob_name)
+
+    def _request(self, operation):
+        self.account.requests.append((operation, self.container_name, self.blob_name))
+
+    def exists(self, **kwargs):
+        self._request('exists')
+        return self._key in self.account.blobs
+
+    def get_blob_properties(self, **kwargs):
+        stored = self.account.blobs.get(self._key)
+        if stored is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        return SimpleNamespace(size=len(stored.data), etag=stored.etag)
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        self._request('upload_blob')
+        if not overwrite and self._key in self.account.blobs:
+            raise ResourceExistsError("The specified blob already exists.")
+        self.account.put(self.container_name, self.blob_name, data)
+        return {'etag': self.account.blobs[self._key].etag}
+
+    def upload_blob_from_url(self, source_url, overwrite=False, source_etag=None, **kwargs):
+        self._request('upload_blob_from_url')
+        if not overwrite and self._key in self.account.blobs:
+            raise ResourceExistsError("The specified blob already exists.")
+        source = self.account.resolve(source_url)
+        if source is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        if source_etag is not None and source.etag != source_etag:
+            raise ResourceModifiedError("The source condition is not met.")
+        self.account.put(self.container_name, self.blob_name, source.data)
+
+    def stage_block(self, block_id, data, **kwargs):
+        self._request('stage_block')
+        self.account.staged.setdefault(self._key, {})[block_id] = bytes(data)
+
+    def commit_block_list(self, blocks, match_condition=None, **kwargs):
+        self._request('commit_block_list')
+        if match_condition == MatchConditions.IfMissing and self._key in self.account.blobs:
+            raise ResourceExistsError("The specified blob already exists.")
+        staged = self.account.staged.pop(self._key, {})
+        self.account.put(self.container_name, self.blob_name,
+                         b''.join(staged[block.id] for block in blocks))
+
+    def delete_blob(self, etag=None, match_condition=None, **kwargs):
+        self._request('delete_blob')
+        stored = self.account.blobs.get(self._key)
+        if stored is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        if match_condition == MatchConditions.IfNotModified and stored.etag != etag:
+            raise ResourceModifiedError("The condition specified is not met.")
+        del self.account.blobs[self._key]
+
+
+def fake_blob_service(account, containers, **kwargs):
+    """A BlobStorageService whose container clients are backed by account"""
+    service = BlobStorageService('UseDevelopmentStorage=true', eml_compression='none', **kwargs)
+    for name in containers:
+        service._container_clients[name] = account.container(name)
+    return service
+
+
+class FakeAsyncContainerClient(FakeContainerClient):
+    def get_blob_client(self, name):
+        return FakeAsyncBlobClient(FakeBlobClient(self.account, self.container_name, name))
+
+
+class FakeAsyncBlobClient:
+    """Async view of a FakeBlobClient that records each request's timeout"""
+
+    def __init__(self, blob_client):
+        self._blob_client = blob_client
+
+    def __getattr__(self, name):
+        attribute = getattr(self._blob_client, name)
+        if not callable(attribute):
+            return attribute
+
+        async def request(*args, **kwargs):
+            account = self._blob_client.account
+            account.timeouts.append((name, kwargs.get('timeout')))
+            try:
+                await asyncio.sleep(account.delays.get(name, 0))
+            except asyncio.CancelledError:
+                # A cancelled request takes a moment to unwind (e.g. closing
+                # its connection)
+                await asyncio.sleep(0.05)
+                raise
+            return attribute(*args, **kwargs)
+        return request
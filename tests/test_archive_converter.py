@@ -0,0 +1,81 @@
+"""Tests for ZipArchiveConverter member handling and its manifest"""
+import io
+import json
+import zipfile
+
+import pytest
+
+from fake_storage import FakeAccount, fake_blob_service
+from services import msg_converter
+from services.archive_converter import ZipArchiveConverter
+from services.errors import ValidationError
+from services.msg_converter import MsgToEmlConverter
+
+
+class InlineConverter(MsgToEmlConverter):
+    """Runs convert_many jobs in this process, so they write to the fake account"""
+
+    def convert_many(self, jobs, max_workers=None, max_in_flight=None, connection_string=None):
+        for job in jobs:
+            yield msg_converter._run_batch_job(job)
+
+
+@pytest.fixture
+def account(monkeypatch):
+    account = FakeAccount()
+    monkeypatch.setattr(msg_converter, '_batch_blob_service',
+                        fake_blob_service(account, ['eml-output']))
+    return account
+
+
+def _zip(members):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    output.seek(0)
+    return output
+
+
+def test_msg_members_are_converted_in_archive_order(account, make_msg):
+    archive = _zip([
+        ('a.msg', make_msg(body='First')),
+        ('notes.txt', b'not a message'),
+        ('__MACOSX/._a.msg', b'resource fork'),
+        ('../escape.msg', make_msg()),
+        ('bad.msg', b'not an msg file' * 100),
+        ('big.msg', bytes(1024 * 1024 + 1)),
+        ('sub/b.msg', make_msg(body='Second')),
+    ])
+    converter = ZipArchiveConverter(fake_blob_service(account, ['eml-output']),
+                                    converter=InlineConverter(max_file_size_mb=1))
+
+    manifest = converter.convert_archive(archive, 'batches/june.zip', 'eml-output')
+
+    assert [result.filename for result in manifest.members] == [
+        'batches/june/a.msg', 'batches/june/bad.msg', 'batches/june/big.msg',
+        'batches/june/sub/b.msg'
+    ]
+    assert [result.success for result in manifest.members] == [True, False, False, True]
+    assert 'exceeds maximum' in manifest.members[2].error_message
+    assert manifest.skipped_members == ['notes.txt', '__MACOSX/._a.msg', '../escape.msg']
+    assert account.names('eml-output') == [
+        'batches/june.manifest.json', 'batches/june/a.eml', 'batches/june/sub/b.eml'
+    ]
+    assert b'Second' in account.blobs[('eml-output', 'batches/june/sub/b.eml')].data
+
+    document = json.loads(account.blobs[('eml-output', 'batches/june.manifest.json')].data)
+    assert (document['converted'], document['failed']) == (2, 2)
+    assert manifest.manifest_blob_url.endswith('/eml-output/batches/june.manifest.json')
+
+
+def test_invalid_or_oversized_archive_is_rejected(account, make_msg):
+    converter = ZipArchiveConverter(fake_blob_service(account, ['eml-output']),
+                                    converter=InlineConverter(), max_members=2)
+
+    with pytest.raises(ValidationError, match='Invalid zip archive'):
+        converter.convert_archive(io.BytesIO(b'not a zip file'), 'bad.zip', 'eml-output')
+    with pytest.raises(ValidationError, match='more than the maximum of 2'):
+        converter.convert_archive(_zip([(f'mail{index}.msg', make_msg()) for index in range(3)]),
+                                  'many.zip', 'eml-output')
+    assert account.names('eml-output') == []
@@ -0,0 +1,146 @@
+"""Tests for streamed EML uploads, block IDs, EML name allocation and batch archiving"""
+import base64
+import uuid
+
+import pytest
+
+from fake_storage import FakeAccount, fake_blob_service
+from services.blob_storage import BLOB_BATCH_SIZE, EmlNameAllocator, make_block_id
+from services.errors import BlobStorageError, ConversionError
+
+BLOCK_SIZE = 1024
+
+
+@pytest.fixture
+def account():
+    return FakeAccount()
+
+
+@pytest.fixture
+def storage(account):
+    return fake_blob_service(account, ['eml-output'], upload_block_size_mb=BLOCK_SIZE / 2 ** 20,
+                             upload_max_concurrency=2)
+
+
+def _chunks(count, fail_at=None):
+    """Yield count chunks of half a block, raising ConversionError at chunk fail_at"""
+    for index in range(count):
+        if index == fail_at:
+            raise ConversionError("Failed to generate EML format: broken attachment")
+        yield bytes([index]) * (BLOCK_SIZE // 2)
+
+
+def test_block_ids_have_constant_length():
+    upload_id = uuid.uuid4().hex
+
+    lengths = {len(make_block_id(upload_id, index)) for index in (0, 9, 10, 99_999_999)}
+
+    assert len(lengths) == 1
+
+
+def test_block_ids_differ_between_uploads():
+    first = make_block_id(uuid.uuid4().hex, 0)
+    second = make_block_id(uuid.uuid4().hex, 0)
+
+    assert first != second
+
+
+def test_block_ids_fit_the_service_limit():
+    # The service accepts block IDs of up to 64 bytes before encoding
+    assert len(base64.b64decode(make_block_id(uuid.uuid4().hex, 12345))) <= 64
+
+
+def test_name_allocator_skips_recently_written_names():
+    names = EmlNameAllocator(cache_size=2)
+    assert next(names.candidates('mail.msg')) == 'mail.eml'
+
+    names.remember('mail.eml')
+    candidates = list(names.candidates('mail.msg'))
+
+    assert 'mail.eml' not in candidates
+    assert all(name.startswith('mail_') for name in candidates)
+
+
+
+def test_block_upload_creates_the_blob_only_at_commit(account, storage):
+    url = storage.upload_eml('eml-output', 'mail.msg', _chunks(7))
+
+    assert url.endswith('/eml-output/mail.eml')
+    assert account.blobs[('eml-output', 'mail.eml')].data == b''.join(_chunks(7))
+    # No empty reservation: the only write that creates the blob is the commit
+    assert ('upload_blob', 'eml-output', 'mail.eml') not in account.requests
+    assert account.requests[-1] == ('commit_block_list', 'eml-output', 'mail.eml')
+
+
+def test_failed_block_upload_leaves_no_blob(account, storage):
+    with pytest.raises(ConversionError):
+        storage.upload_eml('eml-output', 'mail.msg', _chunks(7, fail_at=5))
+
+    assert account.names('eml-output') == []
+    assert ('stage_block', 'eml-output', 'mail.eml') in account.requests
+
+
+def test_name_taken_while_staging_fails_the_upload_and_the_retry_renames(account, storage):
+    def chunks_racing_another_writer():
+        yield from _chunks(4)
+        account.put('eml-output', 'mail.eml', b'other writer')
+        yield from _chunks(2)
+
+    with pytest.raises(BlobStorageError, match='was taken'):
+        storage.upload_eml('eml-output', 'mail.msg', chunks_racing_another_writer())
+    assert account.blobs[('eml-output', 'mail.eml')].data == b'other writer'
+
+    url = storage.upload_eml('eml-output', 'mail.msg', _chunks(6))
+
+    assert url.rsplit('/', 1)[1].startswith('mail_')
+    assert account.blobs[('eml-output', 'mail.eml')].data == b'other writer'
+
+
+def test_taken_name_falls_back_to_a_unique_name(account, storage):
+    account.put('eml-output', 'mail.eml', b'earlier upload')
+
+    url = storage.upload_eml('eml-output', 'mail.msg', b'Subject: new')
+
+    name = url.rsplit('/', 1)[1]
+    assert name.startswith('mail_') and name.endswith('.eml')
+    assert account.blobs[('eml-output', name)].data == b'Subject: new'
+    assert account.blobs[('eml-output', 'mail.eml')].data == b'earlier upload'
+    # No existence probe: the conditional Put itself detects the conflict
+    assert [request[0] for request in account.requests] == ['upload_blob', 'upload_blob']
+
+
+def test_recently_written_name_is_not_tried_again(account, storage):
+    storage.upload_eml('eml-output', 'mail.msg', b'first')
+    storage.upload_eml('eml-output', 'mail.msg', b'second')
+
+    assert [request[0] for request in account.requests] == ['upload_blob', 'upload_blob']
+    assert len(account.names('eml-output')) == 2
+
+
+def test_archive_many_deletes_sources_in_batches(account, monkeypatch):
+    storage = fake_blob_service(account, ['msg-input', 'msg-archive'])
+    filenames = [f'mail{index}.msg' for index in range(BLOB_BATCH_SIZE + 44)]
+    for filename in filenames:
+        account.put('msg-input', filename, filename.encode())
+
+    copy_blob = storage._copy_blob
+
+    def copy_then_overwrite(source_blob_client, dest_blob_client, deadline):
+        etag = copy_blob(source_blob_client, dest_blob_client, deadline)
+        if source_blob_client.blob_name == 'mail7.msg':
+            # Replaced after it was copied: the conditional delete keeps it
+            account.put('msg-input', 'mail7.msg', b'new version')
+        return etag
+
+    monkeypatch.setattr(storage, '_copy_blob', copy_then_overwrite)
+
+    failures = storage.archive_many('msg-input', filenames + ['missing.msg'], 'msg-archive')
+
+    assert sorted(failures) == ['mail7.msg', 'missing.msg']
+    assert 'status 412' in failures['mail7.msg']
+    assert account.names('msg-input') == ['mail7.msg']
+    assert len(account.names('msg-archive')) == len(filenames)
+    deletes = [request for request in account.requests if request[0] != 'upload_blob_from_url']
+    assert deletes == [('delete_blobs', 'msg-input', BLOB_BATCH_SIZE),
+                       ('delete_blobs', 'msg-input', 44)]
+
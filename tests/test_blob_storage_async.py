@@ -0,0 +1,84 @@
+"""Tests for AsyncBlobStorageService uploads, archive copies and cancellation"""
+import asyncio
+
+import pytest
+
+from fake_storage import FakeAccount
+from services.blob_storage_async import AsyncBlobStorageService
+from services.errors import ConversionError
+
+BLOCK_SIZE = 1024
+CONTAINERS = ('msg-input', 'eml-output', 'msg-archive')
+
+
+def _run(account, scenario):
+    """Run scenario(service) on a new event loop, with containers backed by account"""
+    async def main():
+        service = AsyncBlobStorageService(
+            'UseDevelopmentStorage=true', upload_block_size_mb=BLOCK_SIZE / 2 ** 20,
+            upload_max_concurrency=2, eml_compression='none'
+        )
+        service._container_clients[asyncio.get_running_loop()] = {
+            name: account.async_container(name) for name in CONTAINERS
+        }
+        try:
+            return await scenario(service)
+        finally:
+            await service.close()
+
+    return asyncio.run(main())
+
+
+async def _chunks(count, fail_at=None):
+    for index in range(count):
+        if index == fail_at:
+            raise ConversionError("Failed to generate EML format: broken attachment")
+        yield bytes([index]) * (BLOCK_SIZE // 2)
+
+
+@pytest.fixture
+def account():
+    account = FakeAccount()
+    account.put('msg-input', 'mail.msg', b'MSG content')
+    return account
+
+
+def test_upload_and_archive_sends_deadline_timeouts(account):
+    url = _run(account, lambda service: service.upload_and_archive(
+        'eml-output', 'mail.msg', _chunks(5), 'msg-input', 'msg-archive', timeout=30
+    ))
+
+    assert url.endswith('/eml-output/mail.eml')
+    assert account.names('msg-input') == []
+    assert len(account.names('msg-archive')) == 1
+    operations = {operation for operation, _ in account.timeouts}
+    assert {'exists', 'stage_block', 'commit_block_list', 'get_blob_properties',
+            'upload_blob_from_url', 'delete_blob'} <= operations
+    assert all(timeout is not None and 1 <= timeout <= 30 for _, timeout in account.timeouts)
+
+
+def test_failed_upload_removes_the_archive_copy(account):
+    with pytest.raises(ConversionError):
+        _run(account, lambda service: service.upload_and_archive(
+            'eml-output', 'mail.msg', _chunks(5, fail_at=3), 'msg-input', 'msg-archive'
+        ))
+
+    assert account.names('msg-input') == ['mail.msg']
+    assert account.names('msg-archive') == []
+    assert account.names('eml-output') == []
+
+
+def test_cancelled_upload_waits_for_its_requests(account):
+    account.delays['stage_block'] = 10
+
+    async def scenario(service):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(service.upload_and_archive(
+                'eml-output', 'mail.msg', _chunks(5), 'msg-input', 'msg-archive'
+            ), timeout=0.2)
+        # Nothing started by the upload is left running
+        return [task for task in asyncio.all_tasks()
+                if task is not asyncio.current_task() and not task.done()]
+
+    assert _run(account, scenario) == []
+    assert account.names('eml-output') == []
@@ -0,0 +1,247 @@
+"""Tests for the CFB structure checks and CfbReader"""
+import io
+import struct
+
+import olefile
+import pytest
+
+from benchmarks.corpus import build_msg
+from services.cfb import (
+    CFB_SIGNATURE, DIRECTORY_ENTRY_SIZE, ENDOFCHAIN, FATSECT, FREESECT, HEADER_DIFAT_ENTRIES,
+    HEADER_SIZE, NOSTREAM, ROOT_STORAGE_OBJECT, STREAM_OBJECT, CfbFormatError, CfbReader,
+    CfbStreamReader, check_structure, parse_header
+)
+
+SECTOR_SIZE = 512
+FAT_ENTRIES_PER_SECTOR = SECTOR_SIZE // 4
+
+
+def _header(num_fat_sectors=1, difat=(), first_directory_sector=0, num_difat_sectors=0):
+    """Build a version 3 CFB header with 512-byte sectors"""
+    header = bytearray(HEADER_SIZE)
+    header[:8] = CFB_SIGNATURE
+    struct.pack_into('<HHHHH6xIIIIIIIII', header, 0x18, 0x3E, 3, 0xFFFE, 9, 6,
+                     0, num_fat_sectors, first_directory_sector, 0, 4096,
+                     ENDOFCHAIN, 0, ENDOFCHAIN, num_difat_sectors)
+    entries = list(difat) + [FREESECT] * (HEADER_DIFAT_ENTRIES - len(difat))
+    struct.pack_into(f'<{HEADER_DIFAT_ENTRIES}I', header, 0x4C, *entries)
+    return bytes(header)
+
+
+def _directory_sector(*entries):
+    """Build a directory sector from (name, object type, child) tuples"""
+    sector = bytearray(SECTOR_SIZE)
+    for slot, (name, object_type, child) in enumerate(entries):
+        encoded = (name + '\0').encode('utf-16-le')
+        struct.pack_into('<64sHBxIII36xIQ', sector, slot * DIRECTORY_ENTRY_SIZE,
+                         encoded, len(encoded), object_type, NOSTREAM, NOSTREAM, child,
+                         ENDOFCHAIN, 0)
+    return bytes(sector)
+
+
+def _fat_sector(links):
+    """Build a FAT sector from a {sector: next sector} mapping"""
+    entries = [links.get(sector, FREESECT) for sector in range(FAT_ENTRIES_PER_SECTOR)]
+    return struct.pack(f'<{FAT_ENTRIES_PER_SECTOR}I', *entries)
+
+
+def _root_and_property_stream():
+    """A directory sector holding the root and one property stream"""
+    return _directory_sector(('Root Entry', ROOT_STORAGE_OBJECT, 1),
+                             ('__substg1.0_0037001F', STREAM_OBJECT, NOSTREAM))
+
+
+def _read_at(data):
+    return lambda offset, length: data[offset:offset + length]
+
+
+def _msg(attachments=()):
+    output = io.BytesIO()
+    build_msg(output, 'Subject', ('Alice', 'alice@example.com'), [('Bob', 'bob@example.com')],
+              body='Hello', attachments=attachments)
+    return output.getvalue()
+
+
+@pytest.fixture(scope='module')
+def difat_msg():
+    """An MSG file with more FAT sectors than the header lists (about 9 MB)"""
+    attachment = bytes(range(256)) * 36000
+    return _msg([('large.bin', attachment, 'application/octet-stream')]), attachment
+
+
+def test_minimal_container_passes():
+    data = _header(difat=(1,)) + _root_and_property_stream() + _fat_sector(
+        {0: ENDOFCHAIN, 1: FATSECT}
+    )
+
+    check_structure(_read_at(data), len(data))
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'not an msg file' + bytes(600), 'does not match MSG signature'),
+    (CFB_SIGNATURE + bytes(100), 'too small'),
+])
+def test_bad_or_truncated_header_is_rejected(data, message):
+    with pytest.raises(CfbFormatError, match=message):
+        check_structure(_read_at(data), len(data))
+    with pytest.raises(CfbFormatError, match=message):
+        CfbReader(data)
+
+
+def test_truncated_file_is_rejected():
+    data = _msg()[:HEADER_SIZE + SECTOR_SIZE]
+
+    with pytest.raises(CfbFormatError):
+        check_structure(_read_at(data), len(data))
+    with pytest.raises(CfbFormatError):
+        CfbReader(data)
+
+
+def test_fat_that_does_not_mark_itself_is_rejected():
+    data = _header(difat=(1,)) + _root_and_property_stream() + _fat_sector({0: ENDOFCHAIN})
+
+    with pytest.raises(CfbFormatError, match='does not mark its own sectors'):
+        check_structure(_read_at(data), len(data))
+
+
+def test_unmarked_later_fat_sector_is_rejected():
+    # Sector 2 is listed as the second FAT sector but marked as free
+    def container(links):
+        return (_header(num_fat_sectors=2, difat=(1, 2)) + _root_and_property_stream()
+                + _fat_sector(links) + _fat_sector({}))
+
+    data = container({0: ENDOFCHAIN, 1: FATSECT})
+    with pytest.raises(CfbFormatError, match='does not mark its own sectors'):
+        check_structure(_read_at(data), len(data))
+
+    data = container({0: ENDOFCHAIN, 1: FATSECT, 2: FATSECT})
+    check_structure(_read_at(data), len(data))
+
+
+def test_looping_directory_chain_is_rejected():
+    # Directory sectors 0 and 1 link to each other; neither holds a property
+    # stream, so the check has to follow the chain until it loops
+    data = (_header(difat=(2,))
+            + _directory_sector(('Root Entry', ROOT_STORAGE_OBJECT, NOSTREAM))
+            + _directory_sector()
+            + _fat_sector({0: 1, 1: 0, 2: FATSECT}))
+
+    with pytest.raises(CfbFormatError, match='loop'):
+        check_structure(_read_at(data), len(data))
+    with pytest.raises(CfbFormatError, match='loop'):
+        CfbReader(data)
+
+
+def test_self_linked_fat_entry_is_rejected():
+    data = _header(difat=(1,)) + _root_and_property_stream() + _fat_sector(
+        {0: 0, 1: FATSECT}
+    )
+
+    with pytest.raises(CfbFormatError, match='loop'):
+        CfbReader(data)
+
+
+def test_looping_directory_tree_is_rejected():
+    # The property stream lists itself as its left sibling
+    directory = bytearray(_root_and_property_stream())
+    struct.pack_into('<I', directory, DIRECTORY_ENTRY_SIZE + 68, 1)
+    data = _header(difat=(1,)) + bytes(directory) + _fat_sector({0: ENDOFCHAIN, 1: FATSECT})
+
+    reader = CfbReader(data)
+    with pytest.raises(CfbFormatError, match='loop'):
+        reader.children(reader.root)
+
+
+def test_fat_entry_in_difat_listed_sector_is_not_checked():
+    # The first FAT sector sits so far into the file that its own FAT entry
+    # is in a FAT sector listed in a DIFAT sector, which the quick check
+    # does not read
+    first_fat_sector = HEADER_DIFAT_ENTRIES * FAT_ENTRIES_PER_SECTOR + 10
+    num_fat_sectors = HEADER_DIFAT_ENTRIES + 1
+    sectors = {0: _root_and_property_stream(), first_fat_sector: _fat_sector(
+        {0: ENDOFCHAIN, **{sector: FATSECT for sector in range(1, HEADER_DIFAT_ENTRIES)}}
+    )}
+    header = _header(num_fat_sectors=num_fat_sectors,
+                     difat=[first_fat_sector] + list(range(1, HEADER_DIFAT_ENTRIES)),
+                     num_difat_sectors=1)
+    file_size = (first_fat_sector + 2) * SECTOR_SIZE
+
+    def read_at(offset, length):
+        if offset == 0:
+            return header[:length]
+        return sectors.get(offset // SECTOR_SIZE - 1, bytes(SECTOR_SIZE))[:length]
+
+    check_structure(read_at, file_size)
+
+
+def test_difat_file_is_read(difat_msg):
+    data, attachment = difat_msg
+    header = parse_header(data[:HEADER_SIZE], len(data))
+    assert header.num_fat_sectors > HEADER_DIFAT_ENTRIES
+    assert header.num_difat_sectors >= 1
+
+    check_structure(_read_at(data), len(data))
+    reader = CfbReader(data)
+    storage = reader.children(reader.root)['__attach_version1.0_#00000000']
+    stream = reader.children(storage)['__substg1.0_37010102']
+    assert bytes(reader.read_stream(stream)) == attachment
+
+
+def test_stream_reader_follows_difat_sectors_in_chunks(difat_msg):
+    data, attachment = difat_msg
+    reader = CfbReader(data)
+    storage = reader.children(reader.root)['__attach_version1.0_#00000000']
+    stream = reader.children(storage)['__substg1.0_37010102']
+    reads = []
+
+    def read_at(offset, length):
+        reads.append(length)
+        return data[offset:offset + length]
+
+    chunks = list(CfbStreamReader(read_at, len(data)).iter_stream(
+        stream.start_sector, stream.size, 100000
+    ))
+
+    assert b''.join(chunks) == attachment
+    assert max(len(chunk) for chunk in chunks) <= 100000
+    assert max(reads) <= 100000
+
+
+def test_stream_reader_rejects_a_short_chain():
+    data = _header(difat=(1,)) + _root_and_property_stream() + _fat_sector(
+        {0: ENDOFCHAIN, 1: FATSECT}
+    )
+
+    with pytest.raises(CfbFormatError, match='invalid sector'):
+        list(CfbStreamReader(_read_at(data), len(data)).iter_stream(0, 2 * SECTOR_SIZE, 4096))
+
+
+def test_difat_file_without_difat_sectors_is_rejected(difat_msg):
+    data = bytearray(difat_msg[0])
+    struct.pack_into('<I', data, 0x48, 0)  # DIFAT sector count
+
+    with pytest.raises(CfbFormatError, match='more than the file can hold'):
+        parse_header(bytes(data[:HEADER_SIZE]), len(data))
+
+
+def test_read_stream_matches_olefile_for_mini_and_regular_streams():
+    data = _msg([('small.txt', b'tiny attachment', 'text/plain'),
+                 ('large.bin', bytes(range(256)) * 40, 'application/octet-stream')])
+    reader = CfbReader(data)
+    ole = olefile.OleFileIO(data)
+    cutoff = reader.header.mini_stream_cutoff
+
+    sizes = []
+    pending = [(reader.root, [])]
+    while pending:
+        storage, path = pending.pop()
+        for entry in reader.children(storage).values():
+            if entry.object_type == STREAM_OBJECT:
+                assert bytes(reader.read_stream(entry)) == \
+                    ole.openstream(path + [entry.name]).read()
+                sizes.append(entry.size)
+            else:
+                pending.append((entry, path + [entry.name]))
+
+    assert any(0 < size < cutoff for size in sizes)
+    assert any(size >= cutoff for size in sizes)
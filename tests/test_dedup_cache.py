@@ -0,0 +1,99 @@
+"""Tests for the local dedup cache and the server-side copy of duplicates"""
+import itertools
+
+import pytest
+
+import function_app
+from fake_storage import FakeAccount, fake_blob_service
+from services import local_store
+from services.dedup_cache import LocalDedupCache, compute_msg_digest
+
+EML = b'Subject: Test message\r\n\r\nHello\r\n'
+
+
+@pytest.fixture(autouse=True)
+def _clock(monkeypatch):
+    # One tick per write, so the LRU order does not depend on the clock's
+    # resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(local_store.time, 'time', lambda: float(next(ticks)))
+
+
+def _digest(index):
+    return compute_msg_digest(b'MSG %d' % index)
+
+
+def _url(index):
+    return f'https://example/eml-output/mail{index}.eml'
+
+
+def _entry_size(index):
+    return len(_digest(index)) + len(_url(index))
+
+
+def test_entries_are_evicted_down_to_the_byte_budget(tmp_path):
+    budget = 5 * _entry_size(0)
+    cache = LocalDedupCache(str(tmp_path / 'dedup.sqlite3'), max_mb=budget / 2 ** 20)
+
+    for index in range(4):
+        cache.record(_digest(index), _url(index))
+    # Entry 0 becomes the most recently used, so 1 and 2 go first
+    assert cache.lookup(_digest(0)) == _url(0)
+    for index in range(4, 7):
+        cache.record(_digest(index), _url(index))
+
+    kept = [index for index in range(7) if cache.lookup(_digest(index))]
+    assert kept == [0, 3, 4, 5, 6]
+    assert cache._table.total_bytes() == sum(_entry_size(index) for index in kept)
+
+
+def test_total_bytes_follow_updates_and_deletes(tmp_path):
+    path = str(tmp_path / 'dedup.sqlite3')
+    cache = LocalDedupCache(path, max_mb=1)
+
+    cache.record(_digest(0), _url(0))
+    cache.record(_digest(1), _url(1))
+    cache.record(_digest(0), _url(0) + '?copy')
+    cache.forget(_digest(1))
+
+    expected = _entry_size(0) + len('?copy')
+    assert cache._table.total_bytes() == expected
+    # A second process opening the file sees the same total
+    assert LocalDedupCache(path, max_mb=1)._table.total_bytes() == expected
+
+
+@pytest.fixture
+def account():
+    account = FakeAccount()
+    account.put('eml-output', 'first.eml', EML)
+    return account
+
+
+@pytest.fixture
+def dedup(account, tmp_path, monkeypatch):
+    cache = LocalDedupCache(str(tmp_path / 'dedup.sqlite3'))
+    monkeypatch.setattr(function_app, 'blob_service', fake_blob_service(account, ['eml-output']))
+    monkeypatch.setattr(function_app, 'dedup_cache', cache)
+    return cache
+
+
+def test_duplicate_is_copied_server_side(account, dedup):
+    first_url = function_app.blob_service._get_container_client('eml-output') \
+        .get_blob_client('first.eml').url
+    dedup.record(_digest(0), first_url)
+
+    url = function_app._copy_duplicate_eml(_digest(0), 'second.msg')
+
+    assert url.endswith('/eml-output/second.eml')
+    assert account.blobs[('eml-output', 'second.eml')].data == EML
+    # Nothing was uploaded: the only write is the copy from the first EML
+    writes = [operation for operation, *_ in account.requests if operation != 'exists']
+    assert writes == ['upload_blob_from_url']
+
+
+def test_copy_of_a_deleted_eml_drops_the_entry(account, dedup):
+    dedup.record(_digest(0), 'http://127.0.0.1:10000/devstoreaccount1/eml-output/gone.eml')
+
+    assert function_app._copy_duplicate_eml(_digest(0), 'second.msg') is None
+    assert dedup.lookup(_digest(0)) is None
+    assert account.names('eml-output') == ['first.eml']
@@ -0,0 +1,46 @@
+"""Tests for streaming EML compression"""
+import gzip
+import zlib
+
+import pytest
+
+from services.eml_compression import COMPRESSION_CODECS, compress_chunks, compression_settings
+
+
+CHUNKS = [b'From: a@example.com\r\n', b'', b'Subject: test\r\n\r\n', b'body line\r\n' * 5000,
+          bytes(range(256)) * 64]
+
+
+def _decompress(codec, data):
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'deflate':
+        return zlib.decompress(data)
+    brotli = pytest.importorskip('brotli')
+    return brotli.decompress(data)
+
+
+@pytest.mark.parametrize('codec', sorted(COMPRESSION_CODECS))
+def test_compress_chunks_round_trip(codec):
+    if codec == 'br':
+        pytest.importorskip('brotli')
+
+    compressed = list(compress_chunks(iter(CHUNKS), codec, COMPRESSION_CODECS[codec]))
+
+    assert all(compressed[:-1])
+    assert _decompress(codec, b''.join(compressed)) == b''.join(CHUNKS)
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'deflate'])
+def test_compress_chunks_round_trip_empty_input(codec):
+    assert _decompress(codec, b''.join(compress_chunks(iter([]), codec, 1))) == b''
+
+
+def test_compression_settings(monkeypatch):
+    monkeypatch.delenv('EML_COMPRESSION_LEVEL', raising=False)
+
+    assert compression_settings('none') == (None, None)
+    assert compression_settings('GZIP') == ('gzip', 6)
+    assert compression_settings('deflate', 9) == ('deflate', 9)
+    with pytest.raises(ValueError):
+        compression_settings('lzma')
@@ -0,0 +1,66 @@
+"""Tests for ConversionLogger output and its handlers"""
+import io
+import json
+import logging
+import threading
+import uuid
+
+import pytest
+
+from utils.logging import ConversionLogger, correlation_scope
+
+
+class _Recorder(logging.Handler):
+    """Records each record with the thread that handled it"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record, threading.get_ident()))
+
+
+@pytest.fixture
+def root_handler():
+    handler = _Recorder()
+    logging.getLogger().addHandler(handler)
+    yield handler
+    logging.getLogger().removeHandler(handler)
+
+
+@pytest.fixture
+def conversion_logger(monkeypatch):
+    monkeypatch.setenv('CONVERSION_LOG_LEVEL', 'INFO')
+    monkeypatch.setenv('CONVERSION_LOG_FORMAT', 'json')
+    conversion_logger = ConversionLogger(f'test_conversion_{uuid.uuid4().hex}')
+    yield conversion_logger
+    conversion_logger.logger.handlers[0]._stop()
+
+
+def test_root_handlers_run_on_the_calling_thread(conversion_logger, root_handler):
+    with correlation_scope('abc123'):
+        conversion_logger.log_conversion_success('mail.msg', 0.5, 'https://example/mail.eml')
+
+    (record, thread), = root_handler.records
+    # The host's handler can tie the record to the invocation running here
+    assert thread == threading.get_ident()
+    assert record.correlation_id == 'abc123'
+    assert record.custom_dimensions['event'] == 'conversion_succeeded'
+
+
+def test_stderr_output_is_written_by_the_listener(conversion_logger, root_handler):
+    queue_handler = conversion_logger.logger.handlers[0]
+    output = io.StringIO()
+    stream_handler, = queue_handler._handlers
+    stream_handler.setStream(output)
+
+    with correlation_scope('abc123'):
+        conversion_logger.log_conversion_start('mail.msg', 2 * 1024 * 1024)
+    queue_handler._stop()
+
+    entry = json.loads(output.getvalue())
+    assert entry['event'] == 'conversion_started'
+    assert entry['correlation_id'] == 'abc123'
+    assert entry['message'] == 'Conversion started - filename: mail.msg, file_size: 2.00 MB'
+    assert len(root_handler.records) == 1
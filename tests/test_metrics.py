@@ -0,0 +1,73 @@
+"""Tests for StageTimer and the logging metrics sink"""
+import logging
+from datetime import datetime, timezone
+
+import pytest
+
+from models.conversion_models import ConversionMetrics
+from utils import metrics
+from utils.logging import correlation_scope
+from utils.metrics import LoggingMetricsSink, StageTimer
+
+
+class _Clock:
+    """perf_counter stand-in advanced by hand (in binary fractions, so sums are exact)"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(metrics.time, 'perf_counter', clock)
+    return clock
+
+
+def test_nested_stage_time_is_not_counted_twice(clock):
+    timer = StageTimer()
+
+    with timer.stage('convert'):
+        clock.now += 0.125
+        with timer.stage('parse'):
+            clock.now += 0.25
+        clock.now += 0.0625
+
+    assert timer.durations_ms() == {'convert': 187, 'parse': 250}
+
+
+def test_timed_chunks_count_only_production_time_and_bytes(clock):
+    timer = StageTimer()
+
+    def produce():
+        for size in (10, 20, 30):
+            clock.now += 0.015625
+            yield b'x' * size
+
+    with timer.stage('upload'):
+        for _ in timer.timed_chunks('generate', produce()):
+            # Time the consumer spends on a chunk is its own stage's
+            clock.now += 0.125
+
+    assert timer.durations_ms() == {'generate': 46, 'upload': 375}
+    assert timer.bytes_out == 60
+
+
+def test_logging_sink_flattens_stage_durations(caplog):
+    sink = LoggingMetricsSink('test_metrics_sink')
+    conversion = ConversionMetrics(
+        filename='mail.msg', file_size_mb=1.5, conversion_duration_ms=420, status='success',
+        error_type=None, timestamp=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        stage_durations_ms={'parse': 120, 'upload': 300}, bytes_in=1572864, bytes_out=2000000
+    )
+
+    with caplog.at_level(logging.INFO, logger='test_metrics_sink'), correlation_scope('abc123'):
+        sink.emit(conversion)
+
+    dimensions = caplog.records[-1].custom_dimensions
+    assert dimensions['stage_parse_ms'] == 120 and dimensions['stage_upload_ms'] == 300
+    assert dimensions['bytes_out'] == 2000000
+    assert dimensions['correlation_id'] == 'abc123'
@@ -0,0 +1,221 @@
+"""Tests for MsgToEmlConverter bodies, headers, attachments, reader parity and convert_many"""
+import email
+import io
+import re
+import tempfile
+import tracemalloc
+from email import policy
+from email.header import decode_header, make_header
+
+import pytest
+
+from benchmarks.corpus import build_from_spec, default_specs
+from models.conversion_models import ConversionJob
+from services.errors import ParseTimeoutError, ValidationError
+from services.msg_converter import MsgToEmlConverter
+from services.msg_reader import open_native_message
+
+
+FROMHTML_RTF = (b'{\\rtf1\\ansi\\ansicpg1252\\fromhtml1 \\deff0{\\fonttbl{\\f0\\fswiss Arial;}}'
+                b'{\\*\\htmltag1 <html>}{\\*\\htmltag2 <body>}Hello '
+                b'{\\*\\htmltag3 <b>}bold{\\*\\htmltag4 </b>}'
+                b'{\\*\\htmltag5 </body>}{\\*\\htmltag6 </html>}}')
+
+
+def _parts(eml: bytes):
+    """Return the content type and decoded content of each leaf part"""
+    message = email.message_from_bytes(eml, policy=policy.default)
+    return {part.get_content_type(): part.get_content() for part in message.walk()
+            if not part.is_multipart()}
+
+
+@pytest.mark.parametrize('native_reader', [False, True])
+def test_plain_body_with_fromhtml_rtf_keeps_html(make_msg, native_reader):
+    msg_data = make_msg(body='Hello bold', rtf=FROMHTML_RTF)
+
+    parts = _parts(MsgToEmlConverter(native_reader=native_reader).convert(msg_data))
+
+    assert parts['text/plain'].strip() == 'Hello bold'
+    assert '<b>bold</b>' in parts['text/html']
+
+
+@pytest.mark.parametrize('native_reader', [False, True])
+def test_html_stream_wins_over_rtf(make_msg, native_reader):
+    msg_data = make_msg(body='Hello', html=b'<html><body><i>stored</i></body></html>',
+                        rtf=FROMHTML_RTF)
+
+    parts = _parts(MsgToEmlConverter(native_reader=native_reader).convert(msg_data))
+
+    assert '<i>stored</i>' in parts['text/html']
+    assert parts['text/plain'].strip() == 'Hello'
+
+
+def test_plain_body_with_plain_rtf_stays_plain(make_msg):
+    msg_data = make_msg(body='Just text', rtf=b'{\\rtf1\\ansi Just text}')
+
+    parts = _parts(MsgToEmlConverter(native_reader=False).convert(msg_data))
+
+    assert list(parts) == ['text/plain']
+
+
+def test_native_reader_leaves_rtf_without_html_to_extract_msg(make_msg):
+    from services.msg_reader import UnsupportedMsgError
+
+    with pytest.raises(UnsupportedMsgError):
+        open_native_message(make_msg(body='Hello bold', rtf=FROMHTML_RTF))
+    open_native_message(make_msg(body='Hello', html=b'<p>Hello</p>', rtf=FROMHTML_RTF)).close()
+
+
+def _decoded(header_line: str) -> str:
+    """Return a header line's value as a reader decodes it"""
+    value = header_line.split(': ', 1)[1].replace('\r\n', '')
+    return str(make_header(decode_header(value)))
+
+
+@pytest.mark.parametrize('name, value, addresses', [
+    ('Subject', 'Re: =?utf-8?b?SGk=?= there', False),
+    ('From', '=?utf-8?q?Evil?= <evil@example.com>', True),
+])
+def test_ascii_encoded_word_lookalikes_are_encoded(name, value, addresses):
+    line = MsgToEmlConverter()._encode_header(name, value, addresses=addresses)
+
+    assert '=?utf-8?b?' in line
+    assert _decoded(line) == value
+
+
+def test_bare_non_ascii_address_keeps_addr_spec():
+    line = MsgToEmlConverter()._encode_header(
+        'To', 'jörg@exämple.de; Bob <bob@example.com>', addresses=True
+    )
+
+    assert line == 'To: jörg@exämple.de, Bob <bob@example.com>'
+
+
+def test_non_ascii_display_name_is_encoded():
+    line = MsgToEmlConverter()._encode_header('To', '"Jörg, M" <j@example.com>', addresses=True)
+
+    assert line.endswith(' <j@example.com>')
+    assert _decoded(line) == 'Jörg, M <j@example.com>'
+
+
+def _normalize_boundaries(eml: bytes) -> bytes:
+    """Replace the random MIME boundaries by their order of appearance"""
+    names = {}
+    return re.sub(rb'----=_Part_[0-9a-f]{32}',
+                  lambda match: b'boundary-%d' % names.setdefault(match.group(), len(names)), eml)
+
+
+@pytest.mark.parametrize('spec', default_specs(scale=0.02), ids=lambda spec: spec.name)
+def test_native_reader_matches_extract_msg(spec):
+    output = io.BytesIO()
+    build_from_spec(spec, output)
+    msg_data = output.getvalue()
+    if spec.body_format != 'rtf' and not spec.attachment_count:
+        # Read natively, not through the extract_msg fallback
+        open_native_message(msg_data).close()
+
+    native = MsgToEmlConverter(native_reader=True).convert(msg_data)
+    extracted = MsgToEmlConverter(native_reader=False).convert(msg_data)
+
+    assert _normalize_boundaries(native) == _normalize_boundaries(extracted)
+
+
+def test_native_reader_matches_extract_msg_with_unicode_headers(make_msg):
+    msg_data = make_msg(
+        body='Grüße\nzweite Zeile', html='<p>Grüße</p>'.encode('utf-8'),
+        subject='Grüße aus Köln =?utf-8?q?x?=', sender=('Jörg Ä', 'joerg@example.com'),
+        recipients=(('Müller, Anna', 'anna@example.com'), ('Bob', 'bob@example.com'))
+    )
+    open_native_message(msg_data).close()
+
+    native = MsgToEmlConverter(native_reader=True).convert(msg_data)
+    extracted = MsgToEmlConverter(native_reader=False).convert(msg_data)
+
+    assert _normalize_boundaries(native) == _normalize_boundaries(extracted)
+
+
+def test_attachment_payloads_are_read_in_chunks(make_msg):
+    small = b'tiny attachment'
+    large = bytes(range(256)) * 16000
+    stream = io.BytesIO(make_msg(body='Hello', attachments=[
+        ('small.txt', small, 'text/plain'), ('large.bin', large, 'application/octet-stream')
+    ]))
+
+    converter = MsgToEmlConverter(native_reader=False)
+    converter.preload()
+    tracemalloc.start()
+    try:
+        for _ in converter.convert_stream(stream):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Memory follows the chunk size: no copy of the 4 MB payload, or of its
+    # encoding, is held at once
+    assert peak < len(large) // 4
+
+    stream.seek(0)
+    eml = MsgToEmlConverter(native_reader=False).convert(stream.read())
+    message = email.message_from_bytes(eml, policy=policy.default)
+    parts = {part.get_filename(): part for part in message.iter_attachments()}
+    assert parts['small.txt'].get_payload(decode=True) == small
+    assert parts['large.bin'].get_payload(decode=True) == large
+    # Lines stay whole across the chunks the payload was read in
+    lines = parts['large.bin'].get_payload().splitlines()
+    assert all(len(line) == 76 for line in lines[:-1])
+
+
+def test_convert_many_keeps_job_order_and_bounds_jobs_in_flight(make_msg, tmp_path):
+    # A large message first, so later jobs finish before it
+    large = make_msg(body='Hello ' * 200000)
+    small = make_msg(body='Hello')
+    pulled = []
+
+    def jobs():
+        for index in range(8):
+            pulled.append(index)
+            msg_data = b'not an msg file' * 100 if index == 3 else large if index == 0 else small
+            yield ConversionJob(filename=f'mail{index}.msg', input_data=msg_data,
+                                output_path=str(tmp_path / f'mail{index}.eml'))
+
+    results = []
+    for result in MsgToEmlConverter().convert_many(jobs(), max_workers=2, max_in_flight=3):
+        # The job that made room for another is pulled before a result is yielded
+        assert len(pulled) <= len(results) + 3 + 1
+        results.append(result)
+
+    assert [result.filename for result in results] == [f'mail{index}.msg' for index in range(8)]
+    assert [result.success for result in results] == [index != 3 for index in range(8)]
+    assert (tmp_path / 'mail0.eml').read_bytes().count(b'Hello') == 200000
+
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    """Directory the isolated conversions write their temporary EML files to"""
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+
+def test_isolated_conversion_matches_in_process_conversion(make_msg, temp_dir):
+    msg_data = make_msg(body='Hello', attachments=[('a.bin', bytes(5000), 'application/pdf')])
+    converter = MsgToEmlConverter()
+
+    isolated = b''.join(converter.convert_isolated(converter.validate_msg_format(msg_data), 60))
+
+    assert _normalize_boundaries(isolated) == _normalize_boundaries(converter.convert(msg_data))
+    assert list(temp_dir.glob('*.eml')) == []
+
+
+def test_isolated_conversion_is_stopped_at_the_deadline(make_msg, temp_dir):
+    msg_data = make_msg(body='Hello ' * 200000)
+
+    with pytest.raises(ParseTimeoutError, match='did not finish within 0.00s'):
+        MsgToEmlConverter().convert_isolated(msg_data, 0.001)
+    assert list(temp_dir.glob('*.eml')) == []
+
+
+def test_isolated_conversion_reports_invalid_files(temp_dir):
+    with pytest.raises(ValidationError):
+        MsgToEmlConverter().convert_isolated(b'not an msg file' * 100, 60)
+    assert list(temp_dir.glob('*.eml')) == []
+
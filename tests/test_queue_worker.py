@@ -0,0 +1,235 @@
+"""Tests for QueueConversionWorker message routing, resumed retries and polling"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import ResourceModifiedError
+
+from models.conversion_models import ConversionJob
+from services.blob_reader import BlobRangeReader
+from services.errors import BlobStorageError
+from services.msg_converter import MsgToEmlConverter
+from services.processing_ledger import (
+    STAGE_ARCHIVED, STAGE_UPLOADED, LocalProcessingLedger, ledger_key
+)
+from services.queue_worker import DELETE, RETRY, QueueConversionWorker
+
+# Small pages and a one-page cache make the parser fetch the blob in many
+# ranged GETs, so a failure can be injected part-way through
+PAGE_SIZE = 512
+
+
+class FakeBlobClient:
+    """Blob client serving ranged GETs from memory, optionally failing after a number of them"""
+
+    def __init__(self, name, data, fail_after=None):
+        self.blob_name = name
+        self.data = data
+        self.fail_after = fail_after
+        self.downloads = 0
+
+    def get_blob_properties(self):
+        return SimpleNamespace(size=len(self.data), etag='"0x1"')
+
+    def download_blob(self, offset, length, etag, match_condition):
+        self.downloads += 1
+        if self.fail_after is not None and self.downloads > self.fail_after:
+            raise ResourceModifiedError("The condition specified using HTTP conditional "
+                                        "header(s) is not met.")
+        return SimpleNamespace(readall=lambda: self.data[offset:offset + length])
+
+    def exists(self):
+        return True
+
+
+class FakeBlobService:
+    """Stand-in for BlobStorageService that records uploads, archives and moves"""
+
+    def __init__(self, blobs, upload_error=None, archive_errors=()):
+        self.blobs = blobs
+        self.upload_error = upload_error
+        self.archive_errors = list(archive_errors)
+        self.uploads = 0
+        self.uploaded = {}
+        self.archived = []
+        self.failed = []
+
+    @property
+    def blob_service_client(self):
+        return self
+
+    def get_blob_client(self, container, name):
+        return self.blobs[name]
+
+    def open_blob_reader(self, container, filename):
+        return BlobRangeReader(self.blobs[filename], page_size=PAGE_SIZE, cache_pages=1)
+
+    def upload_eml(self, container, filename, chunks, timeout=None, tags=None):
+        if self.upload_error:
+            raise self.upload_error
+        self.uploads += 1
+        self.uploaded[filename] = b''.join(chunks)
+        return f'https://example/{container}/{filename[:-4]}.eml'
+
+    def archive_msg(self, source_container, filename, archive_container, timeout=None):
+        if self.archive_errors:
+            raise self.archive_errors.pop(0)
+        self.archived.append(filename)
+
+    def move_to_failed(self, source_container, filename, failed_container):
+        self.failed.append(filename)
+
+
+class FakeQueueClient:
+    """Queue client delivering one batch of messages per receive call"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.deleted = []
+        self.updated = []
+
+    def receive_messages(self, messages_per_page, max_messages, visibility_timeout):
+        return self.batches.pop(0)[:max_messages] if self.batches else []
+
+    def delete_message(self, message_id, pop_receipt):
+        self.deleted.append(message_id)
+
+    def update_message(self, message_id, pop_receipt, visibility_timeout):
+        self.updated.append((message_id, visibility_timeout))
+        return SimpleNamespace(pop_receipt=pop_receipt)
+
+
+def _message(name, dequeue_count=1):
+    return SimpleNamespace(id=name, pop_receipt='receipt', content=f'msg-input/{name}',
+                           dequeue_count=dequeue_count)
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch):
+    monkeypatch.setenv('INPUT_CONTAINER', 'msg-input')
+    monkeypatch.setenv('OUTPUT_CONTAINER', 'eml-output')
+    monkeypatch.setenv('STREAM_INPUT_THRESHOLD_MB', '0')  # always parse from the reader
+    monkeypatch.delenv('PROCESSING_LEDGER', raising=False)
+    monkeypatch.delenv('ISOLATE_PARSING', raising=False)
+
+
+@pytest.fixture
+def msg_data(make_msg):
+    return make_msg(body='Hello ' * 200,
+                    attachments=[('report.bin', bytes(range(256)) * 20, 'application/pdf')])
+
+
+def _worker(queue_client, blob_service, **kwargs):
+    return QueueConversionWorker(queue_client, blob_service, MsgToEmlConverter(),
+                                 max_dequeue_count=3, retry_delay=7, **kwargs)
+
+
+def test_converted_message_is_deleted(msg_data):
+    blobs = FakeBlobService({'mail.msg': FakeBlobClient('mail.msg', msg_data)})
+    queue = FakeQueueClient([[_message('mail.msg')]])
+
+    results = _worker(queue, blobs).run(drain=True)
+
+    assert [result.success for result in results] == [True]
+    assert b'Subject: Test message' in blobs.uploaded['mail.msg']
+    assert blobs.archived == ['mail.msg'] and blobs.failed == []
+    assert queue.deleted == ['mail.msg'] and queue.updated == []
+
+
+def test_invalid_file_is_moved_to_failed_and_deleted():
+    blobs = FakeBlobService({'bad.msg': FakeBlobClient('bad.msg', b'not an msg file' * 100)})
+    queue = FakeQueueClient([[_message('bad.msg')]])
+
+    results = _worker(queue, blobs).run(drain=True)
+
+    assert [result.success for result in results] == [False]
+    assert blobs.failed == ['bad.msg'] and blobs.archived == []
+    assert queue.deleted == ['bad.msg']
+
+
+@pytest.mark.parametrize('dequeue_count, outcome, failed', [
+    (1, RETRY, []),
+    (3, DELETE, ['mail.msg']),
+])
+def test_storage_failure_is_retried_until_max_dequeue_count(msg_data, dequeue_count,
+                                                            outcome, failed):
+    blobs = FakeBlobService({'mail.msg': FakeBlobClient('mail.msg', msg_data)},
+                            upload_error=BlobStorageError("Server busy"))
+    queue = FakeQueueClient([[_message('mail.msg', dequeue_count)]])
+
+    _worker(queue, blobs).run(drain=True)
+
+    assert blobs.failed == failed
+    if outcome == RETRY:
+        assert queue.updated == [('mail.msg', 7)] and queue.deleted == []
+    else:
+        assert queue.deleted == ['mail.msg']
+
+
+@pytest.mark.parametrize('stage', ['parse', 'generate'])
+def test_reader_failure_mid_conversion_is_retried(msg_data, stage):
+    # Count the GETs of validation and of the whole conversion, then fail
+    # the first GET after validation, or the last GET of the conversion
+    probe = FakeBlobClient('mail.msg', msg_data)
+    reader = BlobRangeReader(probe, page_size=PAGE_SIZE, cache_pages=1)
+    converter = MsgToEmlConverter()
+    validated = converter.validate_msg_format(reader)
+    validation_gets = probe.downloads
+    b''.join(converter.convert_stream(validated))
+    assert probe.downloads > validation_gets + 1
+
+    fail_after = validation_gets if stage == 'parse' else probe.downloads - 1
+    client = FakeBlobClient('mail.msg', msg_data, fail_after=fail_after)
+    blobs = FakeBlobService({'mail.msg': client})
+
+    outcome, result = _worker(None, blobs).process_job(
+        ConversionJob(filename='mail.msg', input_container='msg-input'), dequeue_count=1
+    )
+
+    assert client.downloads == fail_after + 1
+    assert outcome == RETRY
+    assert result.error_message.startswith('BlobStorageError')
+    assert blobs.failed == [] and blobs.uploaded == {}
+
+
+def test_retry_after_a_failed_archive_resumes_from_the_ledger(msg_data, tmp_path):
+    blobs = FakeBlobService({'mail.msg': FakeBlobClient('mail.msg', msg_data)},
+                            archive_errors=[BlobStorageError("Server busy")])
+    ledger = LocalProcessingLedger(str(tmp_path / 'ledger.sqlite3'))
+    worker = _worker(None, blobs, ledger=ledger)
+    job = ConversionJob(filename='mail.msg', input_container='msg-input')
+
+    outcome, _ = worker.process_job(job, dequeue_count=1)
+    assert outcome == RETRY
+    assert blobs.uploads == 1 and blobs.archived == []
+    key = ledger_key('msg-input', 'mail.msg', '"0x1"')
+    assert ledger.lookup(key).stage == STAGE_UPLOADED
+
+    outcome, result = worker.process_job(job, dequeue_count=2)
+    assert outcome == DELETE and result.success
+    # The retry only archives: the EML is not converted or uploaded again
+    assert blobs.uploads == 1 and blobs.archived == ['mail.msg']
+    assert result.output_blob_url == 'https://example/eml-output/mail.eml'
+    assert ledger.lookup(key).stage == STAGE_ARCHIVED
+
+
+def test_free_slots_are_polled_while_conversions_run():
+    # The first conversion only finishes once the second message, which
+    # arrives after the first receive, has been picked up
+    second_started = threading.Event()
+
+    class Worker(QueueConversionWorker):
+        def process_job(self, job, dequeue_count=None):
+            if job.filename == 'first.msg':
+                assert second_started.wait(5), "second message was not received"
+            else:
+                second_started.set()
+            return DELETE, None
+
+    queue = FakeQueueClient([[_message('first.msg')], [], [_message('second.msg')]])
+    worker = Worker(queue, FakeBlobService({}), MsgToEmlConverter(), max_concurrency=2,
+                    visibility_timeout=60)
+
+    worker.run(drain=True)
+
+    assert sorted(queue.deleted) == ['first.msg', 'second.msg']
@@ -0,0 +1,56 @@
+"""Tests for the shared storage transport, retry settings and blob URL clients"""
+import pytest
+
+from services import storage_transport
+from services.blob_storage import BlobStorageService
+from services.storage_transport import blob_client_for_url, get_sync_transport, retry_settings
+
+
+@pytest.fixture(autouse=True)
+def _transports(monkeypatch):
+    # Each test starts without a transport for this process
+    monkeypatch.setattr(storage_transport, '_sync_transports', {})
+
+
+def test_sync_clients_share_one_pooled_transport(monkeypatch):
+    monkeypatch.setenv('STORAGE_POOL_MAXSIZE', '7')
+
+    transport = get_sync_transport()
+    first = BlobStorageService('UseDevelopmentStorage=true')
+    second = BlobStorageService('UseDevelopmentStorage=true')
+
+    assert get_sync_transport() is transport
+    assert first.blob_service_client._pipeline._transport is transport
+    assert second.blob_service_client._pipeline._transport is transport
+    adapter = transport.session.get_adapter('https://example.blob.core.windows.net/')
+    assert adapter._pool_maxsize == 7
+    assert adapter.max_retries.total == 0
+
+
+def test_retry_settings_follow_the_environment(monkeypatch):
+    monkeypatch.setenv('STORAGE_RETRY_TOTAL', '5')
+    monkeypatch.setenv('STORAGE_RETRY_INITIAL_BACKOFF_SECONDS', '2')
+
+    assert retry_settings() == {'retry_total': 5, 'initial_backoff': 2, 'increment_base': 2,
+                                'random_jitter_range': 1}
+
+
+def test_blob_url_client_shares_the_service_pipeline():
+    service_client = BlobStorageService('UseDevelopmentStorage=true').blob_service_client
+
+    client = blob_client_for_url(service_client,
+                                 service_client.url.rstrip('/') + '/eml-output/my%20mail.eml?sig=x')
+
+    assert (client.container_name, client.blob_name) == ('eml-output', 'my mail.eml')
+    assert client._pipeline._transport._transport is get_sync_transport()
+
+
+@pytest.mark.parametrize('url', [
+    'https://other.blob.core.windows.net/eml-output/mail.eml',
+    'http://127.0.0.1:10000/devstoreaccount1/eml-output',
+])
+def test_foreign_or_container_url_is_rejected(url):
+    service_client = BlobStorageService('UseDevelopmentStorage=true').blob_service_client
+
+    with pytest.raises(ValueError):
+        blob_client_for_url(service_client, url)
@@ -0,0 +1,141 @@
+"""Tests for WorkLane admission and cancellation"""
+import asyncio
+
+import pytest
+
+from utils.work_lane import WorkLane
+
+
+async def _hold(lane, size, started, release, order=None, name=None):
+    """Run a conversion that keeps its room until release is set"""
+    async with lane.admit(size):
+        if order is not None:
+            order.append(name)
+        started.set()
+        await release.wait()
+
+
+async def _settle():
+    """Let every ready task run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_limit():
+    async def main():
+        lane = WorkLane(max_concurrency=2, memory_budget=1000)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(_hold(lane, 1, asyncio.Event(), release)) for _ in range(3)]
+        await _settle()
+        assert lane.running == 2
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert (lane.running, lane.bytes_in_flight) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_memory_budget_and_arrival_order():
+    async def main():
+        lane = WorkLane(max_concurrency=10, memory_budget=100)
+        order = []
+        first_release = asyncio.Event()
+        later_release = asyncio.Event()
+        first = asyncio.create_task(_hold(lane, 80, asyncio.Event(), first_release, order, 'a'))
+        await _settle()
+        # 'b' does not fit next to 'a'; 'c' would, but must not overtake 'b'
+        waiting = [
+            asyncio.create_task(_hold(lane, 50, asyncio.Event(), later_release, order, name))
+            for name in ('b', 'c')
+        ]
+        await _settle()
+        assert order == ['a'] and lane.bytes_in_flight == 80
+
+        first_release.set()
+        await first
+        await _settle()
+        assert order == ['a', 'b', 'c'] and lane.bytes_in_flight == 100
+
+        later_release.set()
+        await asyncio.gather(*waiting)
+
+    asyncio.run(main())
+
+
+def test_file_larger_than_budget_runs_alone():
+    async def main():
+        lane = WorkLane(max_concurrency=4, memory_budget=100)
+        release = asyncio.Event()
+        started = asyncio.Event()
+        task = asyncio.create_task(_hold(lane, 500, started, release))
+        await asyncio.wait_for(started.wait(), 1)
+        assert lane.bytes_in_flight == 500
+
+        release.set()
+        await task
+
+    asyncio.run(main())
+
+
+def test_timeout_leaves_the_line():
+    async def main():
+        lane = WorkLane(max_concurrency=1, memory_budget=100)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(lane, 10, asyncio.Event(), release))
+        await _settle()
+
+        with pytest.raises(asyncio.TimeoutError):
+            async with lane.admit(10, timeout=0.01):
+                pass
+        assert not lane._waiters
+
+        release.set()
+        await holder
+        async with lane.admit(10, timeout=0):
+            assert lane.running == 1
+        assert lane.running == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_block_the_line():
+    async def main():
+        lane = WorkLane(max_concurrency=1, memory_budget=100)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(lane, 10, asyncio.Event(), release))
+        await _settle()
+        cancelled = asyncio.create_task(_hold(lane, 10, asyncio.Event(), asyncio.Event()))
+        later_started = asyncio.Event()
+        later = asyncio.create_task(_hold(lane, 10, later_started, release))
+        await _settle()
+
+        cancelled.cancel()
+        await _settle()
+        release.set()
+        await asyncio.wait_for(later_started.wait(), 1)
+        await asyncio.gather(holder, later)
+        assert cancelled.cancelled()
+        assert (lane.running, lane.bytes_in_flight) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_cancel_after_admission_returns_the_room():
+    async def main():
+        lane = WorkLane(max_concurrency=1, memory_budget=100)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(lane, 10, asyncio.Event(), release))
+        await _settle()
+        waiter = asyncio.create_task(_hold(lane, 10, asyncio.Event(), asyncio.Event()))
+        await _settle()
+
+        # The holder's release admits the waiter; cancel it before it resumes
+        release.set()
+        await holder
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert (lane.running, lane.bytes_in_flight) == (0, 0)
+
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+"""Tests for WarmWorkerPool job results and worker recycling"""
+import pytest
+
+from models.conversion_models import ConversionJob
+from services.worker_pool import WarmWorkerPool
+from utils.metrics import resident_memory_mb
+
+
+@pytest.fixture
+def jobs(make_msg, tmp_path):
+    msg_data = make_msg(body='Hello')
+    return [ConversionJob(filename=f'mail{index}.msg', input_data=msg_data,
+                          output_path=str(tmp_path / f'mail{index}.eml'))
+            for index in range(5)]
+
+
+def _run(pool, jobs):
+    with pool:
+        return [future.result(timeout=60) for future in [pool.submit(job) for job in jobs]]
+
+
+def test_workers_are_recycled_after_max_jobs(jobs):
+    pool = WarmWorkerPool(workers=1, max_jobs_per_worker=2, max_rss_mb=0)
+
+    results = _run(pool, jobs)
+
+    assert [result.success for result in results] == [True] * 5
+    assert pool.jobs_completed == 5
+    # Retired after jobs 2 and 4
+    assert pool.workers_recycled == 2
+
+
+@pytest.mark.skipif(resident_memory_mb() is None, reason='RSS is not readable here')
+def test_workers_are_recycled_above_max_rss(jobs):
+    # Every worker is above 1 MB RSS, so each retires after one job
+    pool = WarmWorkerPool(workers=1, max_jobs_per_worker=100, max_rss_mb=1)
+
+    results = _run(pool, jobs[:3])
+
+    assert [result.success for result in results] == [True] * 3
+    assert pool.workers_recycled == 3
+
+
+def test_failed_job_does_not_retire_the_worker(jobs):
+    bad = ConversionJob(filename='bad.msg', input_data=b'not an msg file' * 100,
+                        output_path=jobs[0].output_path)
+    pool = WarmWorkerPool(workers=1, max_jobs_per_worker=100, max_rss_mb=0)
+
+    results = _run(pool, [bad, jobs[1]])
+
+    assert [result.success for result in results] == [False, True]
+    assert results[0].error_message.startswith('ValidationError')
+    assert pool.workers_recycled == 0
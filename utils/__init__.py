@@ -1,4 +1,7 @@
 # Utils module for MSG to EML converter
-from .logging import ConversionLogger
+from .logging import ConversionLogger, correlated, correlation_scope, get_correlation_id
+from .metrics import StageTimer, MetricsSink, LoggingMetricsSink
+from .deadline import Deadline
 
-__all__ = ['ConversionLogger']
+__all__ = ['ConversionLogger', 'correlated', 'correlation_scope', 'get_correlation_id',
+           'StageTimer', 'MetricsSink', 'LoggingMetricsSink', 'Deadline']
@@ -0,0 +1,70 @@
+"""Deadline tracking for time-bounded conversions"""
+import math
+import time
+from typing import Dict, Optional
+
+
+class Deadline:
+    """
+    A point in time by which a unit of work must be finished
+
+    The remaining budget is handed to blocking calls as their timeout, so
+    that hung work is cut off instead of only being detected afterwards.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        """
+        Start the clock
+
+        Args:
+            seconds: Time budget in seconds (None for no deadline)
+        """
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.expires_at = None if seconds is None else self.start + seconds
+
+    def elapsed(self) -> float:
+        """Seconds since the deadline was started"""
+        return time.monotonic() - self.start
+
+    def remaining(self) -> Optional[float]:
+        """
+        Return the remaining time budget
+
+        Returns:
+            Seconds left (0 once expired), or None if there is no deadline
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the time budget is used up"""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        """
+        Raise if the deadline has passed
+
+        Args:
+            stage: Description of the current point in the pipeline, used in
+                the error message (e.g. 'after parsing')
+
+        Raises:
+            TimeoutError: If the deadline has passed
+        """
+        if self.expired():
+            raise TimeoutError(f"Timeout exceeded {stage}: {self.elapsed():.2f}s")
+
+    def request_options(self) -> Dict[str, int]:
+        """
+        Build the timeout keyword for an Azure Storage request
+
+        Returns:
+            {'timeout': remaining whole seconds (at least 1)}, or an empty
+            dict if there is no deadline
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return {}
+        return {'timeout': max(1, math.ceil(remaining))}
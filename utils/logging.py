@@ -1,87 +1,345 @@
 """Logging service for MSG to EML conversion"""
-import os
+import asyncio
+import atexit
+import copy
+import functools
+import json
 import logging
-from datetime import datetime
-from typing import Optional
+import os
+import queue
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Optional
+
+
+# Level when neither CONVERSION_LOG_LEVEL nor FASTMCP_LOG_LEVEL is set
+DEFAULT_LOG_LEVEL = 'ERROR'
+
+# Output format of the console handler: 'json' (one object per line) or 'text'
+DEFAULT_LOG_FORMAT = 'json'
+
+TEXT_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Correlation ID of the file being converted in the current context; copied
+# into threads started with asyncio.to_thread
+_correlation_id: ContextVar[Optional[str]] = ContextVar('correlation_id', default=None)
+
+
+def log_level() -> int:
+    """
+    Return the level configured for conversion logs
+
+    CONVERSION_LOG_LEVEL takes precedence; FASTMCP_LOG_LEVEL, the setting
+    used by earlier versions, is still honoured when it is not set.
+
+    Returns:
+        Logging level (ERROR for unknown names)
+    """
+    name = (os.environ.get('CONVERSION_LOG_LEVEL')
+            or os.environ.get('FASTMCP_LOG_LEVEL')
+            or DEFAULT_LOG_LEVEL)
+    level = logging.getLevelName(name.strip().upper())
+    return level if isinstance(level, int) else logging.ERROR
+
+
+def get_correlation_id() -> Optional[str]:
+    """Return the correlation ID of the current conversion, if any"""
+    return _correlation_id.get()
+
+
+@contextmanager
+def correlation_scope(correlation_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Tag every log record emitted in the block with one correlation ID
+
+    Args:
+        correlation_id: ID to use (default: a new random one)
+
+    Yields:
+        The correlation ID in effect
+    """
+    correlation_id = correlation_id or uuid.uuid4().hex
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+
+def correlated(function):
+    """
+    Run each call of a function (sync or async) in its own correlation scope
+
+    Used on the triggers and worker entry points, so that all records of
+    one file's conversion share an ID.
+    """
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            with correlation_scope():
+                return await function(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with correlation_scope():
+            return function(*args, **kwargs)
+    return wrapper
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Stamps records with the correlation ID of the emitting context"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line
+
+    The object holds the timestamp, level, logger, message and correlation
+    ID, plus the record's custom_dimensions (the structured fields that
+    Application Insights exporters read from extra={'custom_dimensions': ...}).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', None),
+        }
+        dimensions = getattr(record, 'custom_dimensions', None)
+        if dimensions:
+            entry.update(dimensions)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _ProcessQueueHandler(QueueHandler):
+    """
+    Hands records to a background listener thread for formatting and output
+
+    The calling thread only stamps the correlation ID and enqueues the
+    record; message interpolation, JSON encoding and the write happen on
+    the listener. The inline handler is the exception: in the process that
+    created this handler it runs on the calling thread, before the record
+    is queued. A forked child gets its own queue and listener on its first
+    record, since the parent's listener thread does not survive fork, and
+    its listener runs the inline handler too.
+    """
+
+    def __init__(self, *handlers: logging.Handler, inline: Optional[logging.Handler] = None):
+        self._handlers = handlers
+        self._inline = inline
+        self._owner_pid = os.getpid()
+        self._lock = threading.Lock()
+        self._start()
+        super().__init__(self._queue)
+        self.addFilter(CorrelationIdFilter())
+        atexit.register(self._stop)
+
+    def _start(self) -> None:
+        """Start a queue and listener for the current process"""
+        self._pid = os.getpid()
+        handlers = self._handlers
+        if self._inline is not None and self._pid != self._owner_pid:
+            handlers += (self._inline,)
+        self._queue = queue.SimpleQueue()
+        self.queue = self._queue
+        self._listener = QueueListener(self._queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def _stop(self) -> None:
+        """Flush the queued records at exit (in the process that owns the listener)"""
+        if self._pid == os.getpid() and self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._inline is not None and os.getpid() == self._owner_pid:
+            self._inline.handle(record)
+        super().emit(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare, the message is not formatted here: the
+        # arguments of conversion records are immutable values, so the
+        # listener can interpolate them later
+        return copy.copy(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        self._queue.put_nowait(record)
+
+
+class _RootHandlers(logging.Handler):
+    """
+    Passes records to the handlers of the root logger
+
+    Used in place of propagation, so that the root handlers (the Functions
+    host's, or an exporter's) still receive the conversion records. In the
+    host's worker process it runs on the calling thread, where the host's
+    handler ties each record to the invocation that emitted it; only forked
+    children run it on their listener thread.
+    """
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in logging.getLogger().handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.handle(record)
+
+
+def create_queue_handler() -> logging.Handler:
+    """
+    Create a handler writing to stderr in the background and to the root handlers
+
+    Returns:
+        Queue handler whose listener formats records as JSON or text
+        (CONVERSION_LOG_FORMAT, default json) for stderr, and which passes
+        records to the root logger's handlers synchronously (from a
+        listener thread in forked children)
+    """
+    stream_handler = logging.StreamHandler()
+    if os.environ.get('CONVERSION_LOG_FORMAT', DEFAULT_LOG_FORMAT).lower() == 'text':
+        stream_handler.setFormatter(logging.Formatter(TEXT_LOG_FORMAT,
+                                                      datefmt='%Y-%m-%d %H:%M:%S'))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+    return _ProcessQueueHandler(stream_handler, inline=_RootHandlers())
 
 
 class ConversionLogger:
-    """Provides structured logging for MSG to EML conversion operations"""
-    
+    """
+    Provides structured logging for MSG to EML conversion operations
+
+    Each event is one record with a short text message and its fields in
+    custom_dimensions. Events below the configured level cost a single
+    level check: no message, fields or timestamp are built for them.
+    """
+
     def __init__(self, logger_name: str = 'msg_to_eml_converter'):
         """
         Initialize the conversion logger
-        
+
         Args:
             logger_name: Name for the logger instance
         """
         self.logger = logging.getLogger(logger_name)
-        
+
         # Configure log level from environment variable
-        log_level = os.environ.get('FASTMCP_LOG_LEVEL', 'ERROR').upper()
-        self.logger.setLevel(getattr(logging, log_level, logging.ERROR))
-        
-        # Add console handler if not already present
+        self.logger.setLevel(log_level())
+
+        # Add the queue handler if not already present. It hands records to
+        # the root handlers itself; propagating would run them a second time
+        # and log every event twice.
         if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter(
-                '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
-    
-    def log_conversion_start(self, filename: str, file_size: int) -> None:
+            self.logger.addHandler(create_queue_handler())
+        self.logger.propagate = False
+
+    def log_conversion_start(self, filename: str, file_size: Optional[int]) -> None:
         """
         Logs conversion initiation
-        
+
         Args:
             filename: Name of the MSG file being converted
             file_size: Size of the file in bytes
         """
-        file_size_mb = file_size / (1024 * 1024)
-        self.logger.info(
-            f"Conversion started - filename: {filename}, "
-            f"file_size: {file_size_mb:.2f} MB, "
-            f"timestamp: {datetime.utcnow().isoformat()}"
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        self._log(
+            logging.INFO, 'conversion_started',
+            "Conversion started - filename: %s, file_size: %.2f MB",
+            (filename, (file_size or 0) / (1024 * 1024)),
+            filename=filename, file_size_bytes=file_size
         )
-    
-    def log_conversion_success(self, filename: str, duration: float, 
+
+    def log_conversion_success(self, filename: str, duration: float,
                                output_url: str) -> None:
         """
         Logs successful conversion with metrics
-        
+
         Args:
             filename: Name of the MSG file that was converted
             duration: Conversion duration in seconds
             output_url: URL of the output EML blob
         """
-        self.logger.info(
-            f"Conversion successful - filename: {filename}, "
-            f"duration: {duration:.3f}s, "
-            f"output_url: {output_url}, "
-            f"status: success, "
-            f"timestamp: {datetime.utcnow().isoformat()}"
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        self._log(
+            logging.INFO, 'conversion_succeeded',
+            "Conversion successful - filename: %s, duration: %.3fs, output_url: %s",
+            (filename, duration, output_url),
+            filename=filename, duration_seconds=duration, output_url=output_url,
+            status='success'
         )
-    
-    def log_conversion_failure(self, filename: str, error: Exception, 
+
+    def log_conversion_failure(self, filename: str, error: Exception,
                                duration: float) -> None:
         """
         Logs conversion failure with error details
-        
+
         Args:
             filename: Name of the MSG file that failed to convert
             error: Exception that caused the failure
             duration: Time spent before failure in seconds
         """
+        self._log_error('conversion_failed', "Conversion failed", filename, error,
+                        duration, 'failed')
+
+    def log_conversion_timeout(self, filename: str, error: Exception,
+                               duration: float) -> None:
+        """
+        Logs a conversion that ran out of time
+
+        Args:
+            filename: Name of the MSG file that timed out
+            error: TimeoutError raised at the deadline
+            duration: Time spent before the timeout in seconds
+        """
+        self._log_error('conversion_timeout', "Conversion timeout", filename, error,
+                        duration, 'timeout')
+
+    def _log_error(self, event: str, title: str, filename: str, error: Exception,
+                   duration: float, status: str) -> None:
+        """Log a failed conversion event at ERROR level"""
+        if not self.logger.isEnabledFor(logging.ERROR):
+            return
         error_type = type(error).__name__
         error_message = str(error)
-        
-        self.logger.error(
-            f"Conversion failed - filename: {filename}, "
-            f"duration: {duration:.3f}s, "
-            f"error_type: {error_type}, "
-            f"error_message: {error_message}, "
-            f"status: failed, "
-            f"timestamp: {datetime.utcnow().isoformat()}"
+        self._log(
+            logging.ERROR, event,
+            title + " - filename: %s, duration: %.3fs, error_type: %s, error_message: %s",
+            (filename, duration, error_type, error_message),
+            filename=filename, duration_seconds=duration, error_type=error_type,
+            error_message=error_message, status=status
         )
+
+    def _log(self, level: int, event: str, message: str, args: tuple, **fields) -> None:
+        """
+        Emit one event record
+
+        Args:
+            level: Logging level
+            event: Event name, included in the custom dimensions
+            message: %-style message, interpolated on the listener thread
+            args: Arguments of the message
+            **fields: Structured fields of the event
+        """
+        fields['event'] = event
+        fields['correlation_id'] = _correlation_id.get()
+        self.logger.log(level, message, *args, extra={'custom_dimensions': fields})
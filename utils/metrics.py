@@ -0,0 +1,192 @@
+"""Per-stage metrics for MSG to EML conversion"""
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from models.conversion_models import ConversionMetrics
+from .logging import get_correlation_id
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class StageTimer:
+    """
+    Accumulates wall-clock time per pipeline stage
+
+    Stages may be nested; time spent in an inner stage is not counted
+    towards the enclosing one, so the stage durations add up to the
+    total time measured.
+    """
+
+    def __init__(self):
+        """Initialize an empty timer"""
+        self.durations: Dict[str, float] = {}
+        self.bytes_out: Optional[int] = None
+        self._open: List[List[float]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time the enclosed block as the given stage
+
+        Args:
+            name: Stage name (e.g. 'read', 'parse', 'upload')
+        """
+        nested = [0.0]
+        self._open.append(nested)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._open.pop()
+            self._record(name, elapsed - nested[0], elapsed)
+
+    def timed_chunks(self, name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Time the production of a lazily generated chunk stream as a stage
+
+        Only the time spent producing chunks is counted; the time the
+        consumer spends between chunks belongs to its own stage. The total
+        size of the chunks is recorded in bytes_out.
+
+        Args:
+            name: Stage name (e.g. 'generate')
+            chunks: Lazily produced chunks
+
+        Yields:
+            The chunks, unchanged
+        """
+        iterator = iter(chunks)
+        self.bytes_out = self.bytes_out or 0
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                elapsed = time.perf_counter() - start
+                self._record(name, elapsed, elapsed)
+                return
+            elapsed = time.perf_counter() - start
+            self._record(name, elapsed, elapsed)
+            self.bytes_out += len(chunk)
+            yield chunk
+
+    def durations_ms(self) -> Dict[str, int]:
+        """
+        Return the accumulated stage durations
+
+        Returns:
+            Dictionary of stage name to duration in milliseconds
+        """
+        return {name: int(seconds * 1000) for name, seconds in self.durations.items()}
+
+    def _record(self, name: str, seconds: float, wall_seconds: float) -> None:
+        """Add time to a stage and exclude it from the enclosing stage"""
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        if self._open:
+            self._open[-1][0] += wall_seconds
+
+
+def peak_memory_mb() -> Optional[float]:
+    """
+    Return the peak resident set size of this process
+
+    Returns:
+        Peak RSS in MB, or None where the resource module is unavailable
+    """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return max_rss / (1024 * 1024)
+    return max_rss / 1024
+
+
+def resident_memory_mb() -> Optional[float]:
+    """
+    Return the current resident set size of this process
+
+    Read from /proc where available (Linux); elsewhere the peak RSS is
+    returned instead, which is an upper bound.
+
+    Returns:
+        RSS in MB, or None if it cannot be determined
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_memory_mb()
+
+
+class MetricsSink:
+    """Destination for conversion metrics; the base class discards them"""
+
+    def emit(self, metrics: ConversionMetrics) -> None:
+        """
+        Record the metrics of one conversion
+
+        Args:
+            metrics: Populated metrics of a finished conversion
+        """
+
+
+class LoggingMetricsSink(MetricsSink):
+    """
+    Emits metrics as a log record with structured custom dimensions
+
+    The dimensions are attached as extra={'custom_dimensions': ...}, which
+    Application Insights log exporters turn into customDimensions.
+    """
+
+    def __init__(self, logger_name: str = 'msg_to_eml_converter.metrics'):
+        """
+        Initialize the sink
+
+        Args:
+            logger_name: Name for the logger instance
+        """
+        self.logger = logging.getLogger(logger_name)
+        # Metrics are wanted even when CONVERSION_LOG_LEVEL silences the parent logger
+        self.logger.setLevel(logging.INFO)
+
+    def emit(self, metrics: ConversionMetrics) -> None:
+        dimensions = {
+            'filename': metrics.filename,
+            'file_size_mb': metrics.file_size_mb,
+            'conversion_duration_ms': metrics.conversion_duration_ms,
+            'status': metrics.status,
+            'error_type': metrics.error_type,
+            'timestamp': metrics.timestamp.isoformat(),
+            'bytes_in': metrics.bytes_in,
+            'bytes_out': metrics.bytes_out,
+            'peak_memory_mb': metrics.peak_memory_mb,
+            'correlation_id': get_correlation_id(),
+        }
+        for stage, duration_ms in metrics.stage_durations_ms.items():
+            dimensions[f'stage_{stage}_ms'] = duration_ms
+
+        self.logger.info("conversion_metrics", extra={'custom_dimensions': dimensions})
+
+
+def create_metrics_sink() -> MetricsSink:
+    """
+    Create the metrics sink selected by the METRICS_SINK setting
+
+    Returns:
+        'logging' -> LoggingMetricsSink, anything else (default 'none') ->
+        a sink that discards metrics
+    """
+    if os.environ.get('METRICS_SINK', 'none').lower() == 'logging':
+        return LoggingMetricsSink()
+    return MetricsSink()
@@ -0,0 +1,104 @@
+"""Admission control for a lane of conversions sharing a concurrency and memory budget"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+
+class WorkLane:
+    """
+    Admits conversions into a lane with bounded concurrency and input bytes
+
+    At most max_concurrency conversions run at once, and the input sizes of
+    the running ones add up to at most memory_budget bytes. A file larger
+    than the whole budget is admitted once the lane is empty, so it runs
+    alone instead of never. Waiting conversions are admitted in arrival
+    order, so a large file is not starved by a stream of smaller ones.
+
+    Waiting is done on the event loop, so queued conversions hold no threads.
+    """
+
+    def __init__(self, max_concurrency: int, memory_budget: int):
+        """
+        Initialize the lane
+
+        Args:
+            max_concurrency: Maximum conversions running at once
+            memory_budget: Maximum total input bytes of running conversions
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.memory_budget = memory_budget
+        self.running = 0
+        self.bytes_in_flight = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @asynccontextmanager
+    async def admit(self, size: int, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Wait for room in the lane, and hold it for the duration of the block
+
+        Args:
+            size: Input size of the conversion in bytes
+            timeout: Seconds to wait for room (None to wait indefinitely)
+
+        Raises:
+            asyncio.TimeoutError: If the lane has no room within timeout
+        """
+        size = max(0, size)
+        await self._acquire(size, timeout)
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    async def _acquire(self, size: int, timeout: Optional[float]) -> None:
+        """Take a slot and size bytes of the budget, waiting in line if needed"""
+        if not self._waiters and self._fits(size):
+            self._take(size)
+            return
+
+        waiter = (size, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if waiter[1].done() and not waiter[1].cancelled():
+                # Admitted just as the wait ended: give the room back
+                self._release(size)
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+                self._admit_waiters()
+            raise
+
+    def _release(self, size: int) -> None:
+        """Return a slot and size bytes of the budget, and admit who fits"""
+        self.running -= 1
+        self.bytes_in_flight -= size
+        self._admit_waiters()
+
+    def _admit_waiters(self) -> None:
+        """Admit waiting conversions from the head of the line while they fit"""
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.cancelled():
+                self._waiters.popleft()
+                continue
+            if not self._fits(size):
+                break
+            self._waiters.popleft()
+            self._take(size)
+            future.set_result(None)
+
+    def _fits(self, size: int) -> bool:
+        """Check whether a conversion of size input bytes can start now"""
+        if self.running >= self.max_concurrency:
+            return False
+        return self.running == 0 or self.bytes_in_flight + size <= self.memory_budget
+
+    def _take(self, size: int) -> None:
+        """Account for an admitted conversion"""
+        self.running += 1
+        self.bytes_in_flight += size